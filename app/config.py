@@ -2,17 +2,174 @@
 import os
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
-load_dotenv()
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ENV_PATH = os.path.join(PROJECT_ROOT, ".env")
+# The only place the .env file is read; every other module uses `settings`
 load_dotenv(dotenv_path=ENV_PATH)
 
 class Settings(BaseSettings):
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
     Maps_API_KEY: str = os.getenv("GOOGLE_MAPS_API_KEY")
     FRONTEND_ORIGIN: str = "*"
-    FUEL_COST_PER_KM: float = 27   
+    # Upstream endpoints; overridable so benchmarks can point at local stand-ins
+    GOOGLE_MAPS_BASE_URL: str = "https://maps.googleapis.com/maps/api"
+    # Cap on one geocode or Distance Matrix call; a request's remaining time budget lowers it further
+    MAPS_CALL_TIMEOUT_S: float = 5.0
+    OPENAI_BASE_URL: str = ""  # empty = OpenAI default
+    # JSON store locations; empty = the bundled files in app/data
+    LOADS_FILE: str = ""
+    FEEDBACK_FILE: str = ""
+    TRUCKS_FILE: str = ""
+    FUEL_COST_PER_KM: float = 27
+
+    # score_loads formula: rate per km, minus detour fuel cost / SCORE_FUEL_DIVISOR, minus
+    # extra detour minutes / SCORE_TIME_DIVISOR, plus SCORE_URGENCY_BONUS for urgent loads
+    SCORE_FUEL_DIVISOR: float = 100.0
+    SCORE_TIME_DIVISOR: float = 60.0
+    SCORE_URGENCY_BONUS: float = 2.0
+
+    # OpenAI model plus latency budgets (seconds) and a cap on concurrent LLM calls
+    OPENAI_MODEL: str = "gpt-4o"
+    LLM_MAX_CONCURRENCY: int = 4
+    LLM_SUMMARY_BUDGET_S: float = 6.0
+    LLM_AGENT_BUDGET_S: float = 15.0
+
+    # Micro-batching of summary LLM calls: summaries requested within LLM_SUMMARY_BATCH_WINDOW_MS
+    # of each other share one multi-truck prompt, up to LLM_SUMMARY_BATCH_MAX per prompt
+    # (a window of 0 or a max of 1 sends every summary on its own)
+    LLM_SUMMARY_BATCH_WINDOW_MS: float = 30
+    LLM_SUMMARY_BATCH_MAX: int = 8
+
+    # /ask-agent context retrieval: max loads ranked per question and prompt token budget for them
+    AGENT_CONTEXT_MAX_LOADS: int = 20
+    AGENT_CONTEXT_TOKEN_BUDGET: int = 1200
+
+    # Bounded thread pools used by async routes for blocking work
+    BLOCKING_IO_WORKERS: int = 4
+    UPSTREAM_WORKERS: int = 16
+    # Debug aid: log whenever the event loop is blocked longer than the threshold
+    EVENT_LOOP_LAG_DEBUG: bool = False
+    EVENT_LOOP_LAG_THRESHOLD_MS: float = 100.0
+
+    # Sampled request profiling: 0 disables, N profiles one request in N (can be changed at runtime via the admin API)
+    PROFILE_SAMPLE_EVERY: int = 0
+    PROFILE_INTERVAL_MS: float = 5.0
+    PROFILE_OUTPUT_DIR: str = ""  # defaults to <project>/profiles
+    # Admin endpoints require this value in the X-Admin-Token header; while it is unset
+    # they refuse every call (they include destructive ones such as /loads/sweep)
+    ADMIN_TOKEN: str = ""
+
+    # Geocode and Distance Matrix leg caches
+    GEOCODE_CACHE_SIZE: int = 10000
+    GEOCODE_CACHE_TTL_S: float = 7 * 24 * 3600
+    ROUTE_LEG_CACHE_SIZE: int = 50000
+    ROUTE_LEG_CACHE_TTL_S: float = 24 * 3600
+    # "memory" keeps caches per process; "sqlite" shares them between all workers on the
+    # host through one SQLite file (WAL mode), fronted by a small short-lived local tier
+    CACHE_BACKEND: str = "memory"
+    CACHE_SQLITE_PATH: str = ""  # defaults to <project>/cache/shared_cache.sqlite3
+    CACHE_LOCAL_MAX_ENTRIES: int = 1000
+    CACHE_LOCAL_TTL_S: float = 30.0
+
+    # Persistent city-to-city lane table (SQLite), consulted before any Distance Matrix call
+    # for address pairs. Lanes older than LANE_REFRESH_AGE_S are re-fetched in the background
+    # every LANE_REFRESH_INTERVAL_S (0 disables the job), LANE_REFRESH_BATCH lanes at a time.
+    LANE_TABLE_ENABLED: bool = True
+    LANES_DB_PATH: str = ""  # defaults to lanes.sqlite3 next to LOADS_FILE, else in app/data
+    LANE_REFRESH_AGE_S: float = 30 * 24 * 3600
+    LANE_REFRESH_INTERVAL_S: float = 3600
+    LANE_REFRESH_BATCH: int = 50
+
+    # Learned address aliases (SQLite): every spelling of a place that has been geocoded once
+    # maps to one canonical place ID, which the geocode cache, lanes and route legs key on
+    PLACE_ALIASES_ENABLED: bool = True
+    PLACES_DB_PATH: str = ""  # defaults to places.sqlite3 next to LOADS_FILE, else in app/data
+    # Most new cities one Excel upload geocodes to learn their places (after the response)
+    PLACE_LEARN_UPLOAD_LIMIT: int = 200
+
+    # Startup warm-up: load the store and build indexes before the worker serves traffic,
+    # optionally geocoding up to N distinct load cities into the geocode cache
+    WARMUP_ON_STARTUP: bool = True
+    WARMUP_GEOCODE_LIMIT: int = 0
+
+    # Admission control for expensive endpoints: max requests running at once and max
+    # requests waiting for a slot (0 concurrency = unlimited). A full queue or a wait
+    # longer than ADMISSION_QUEUE_TIMEOUT_S is answered with 503 + Retry-After.
+    ADMISSION_CONTROL_ENABLED: bool = True
+    RECOMMEND_MAX_CONCURRENCY: int = 8
+    RECOMMEND_MAX_QUEUE: int = 32
+    SUMMARY_MAX_CONCURRENCY: int = 4
+    SUMMARY_MAX_QUEUE: int = 8
+    AGENT_MAX_CONCURRENCY: int = 4
+    AGENT_MAX_QUEUE: int = 8
+    UPLOAD_MAX_CONCURRENCY: int = 2
+    UPLOAD_MAX_QUEUE: int = 4
+    ADMISSION_QUEUE_TIMEOUT_S: float = 10.0
+    ADMISSION_RETRY_AFTER_S: int = 2
+
+    # Load-match subscriptions (SSE / WebSocket): defaults for the push threshold and the
+    # straight-line pickup radius used to prefilter new loads before any route call. New loads
+    # come from the change feed (every worker's postings); subscriptions are scored
+    # SUBSCRIPTION_MATCH_BATCH per upstream job, one job at a time, each job within
+    # SUBSCRIPTION_MATCH_MAX_UPSTREAM_CALLS / SUBSCRIPTION_MATCH_MAX_TIME_S (0 = unlimited)
+    SUBSCRIPTION_MIN_SCORE: float = 0.0
+    SUBSCRIPTION_MAX_PICKUP_KM: float = 300.0
+    SUBSCRIPTION_QUEUE_SIZE: int = 100
+    SUBSCRIPTION_KEEPALIVE_S: float = 15.0
+    SUBSCRIPTION_MATCH_BATCH: int = 25
+    SUBSCRIPTION_MATCH_MAX_UPSTREAM_CALLS: int = 200
+    SUBSCRIPTION_MATCH_MAX_TIME_S: float = 10.0
+
+    # Deadline pruning: before routing, loads whose expected delivery date cannot be met even
+    # driving the straight line at MAX_TRUCK_SPEED_KMH are dropped; the rest are re-checked
+    # against the real route duration once it is known
+    DEADLINE_PRUNING_ENABLED: bool = True
+    MAX_TRUCK_SPEED_KMH: float = 80.0
+    # Anytime scoring: default per-request budget for /recommend and /recommend/summary
+    # (0 = unlimited). Clients can lower or raise it per request.
+    RECOMMEND_MAX_UPSTREAM_CALLS: int = 600
+    RECOMMEND_MAX_TIME_S: float = 15.0
+
+    # Load statuses (comma-separated, case-insensitive) that are never offered to trucks
+    UNAVAILABLE_LOAD_STATUSES: str = "booked,delivered,cancelled,expired"
+    # Expiry sweeper: every LOAD_SWEEP_INTERVAL_S (0, the default, disables it: it deletes
+    # from the store) loads due more than LOAD_EXPIRY_GRACE_DAYS ago or in an unavailable
+    # status leave the board, archived first (SQLite, queryable) unless LOAD_SWEEP_ARCHIVE is off
+    LOAD_SWEEP_INTERVAL_S: float = 0
+    LOAD_EXPIRY_GRACE_DAYS: int = 1
+    LOAD_SWEEP_ARCHIVE: bool = True
+    LOAD_ARCHIVE_PATH: str = ""  # defaults to loads_archive.sqlite3 next to LOADS_FILE, else in app/data
+
+    # Load change feed (SQLite): every load added, updated or deleted in the store gets a
+    # monotonically increasing version, and /load/changes returns the changes since a version,
+    # long-polling up to CHANGE_FEED_MAX_WAIT_S. Changes by other workers are noticed every
+    # CHANGE_FEED_POLL_S by one poller per worker. Only the newest CHANGE_FEED_RETENTION changes are kept.
+    CHANGE_FEED_ENABLED: bool = True
+    CHANGE_FEED_PATH: str = ""  # defaults to load_changes.sqlite3 next to LOADS_FILE, else in app/data
+    CHANGE_FEED_RETENTION: int = 100000
+    CHANGE_FEED_MAX_WAIT_S: float = 30
+    CHANGE_FEED_POLL_S: float = 1.0
+
+    # Columnar board snapshot: after every store write the board is published as an immutable
+    # file (filter columns as arrays, each load's JSON in an offset-indexed blob) that workers
+    # memory-map read-only, so they share one copy through the page cache instead of each holding
+    # parsed loads. Candidate filtering and /get-all-loads read it; a newer one is swapped in
+    # when the store changes. Saves publish in the background, a burst of them only once.
+    LOAD_SNAPSHOT_ENABLED: bool = True
+    LOAD_SNAPSHOT_DIR: str = ""  # defaults to board_snapshot/ next to LOADS_FILE, else in app/data
+
+    # Multi-load chain planner (backhauls): deadhead legs between loads are estimated from
+    # geocoded coordinates (straight line x road factor at an average speed) unless the lane
+    # table knows them, then the best chains are re-costed with real routes. Deadhead is
+    # charged at FUEL_COST_PER_KM plus CHAIN_TIME_COST_PER_HOUR.
+    CHAIN_MAX_LOADS: int = 3
+    CHAIN_BEAM_WIDTH: int = 200
+    CHAIN_BRANCHING: int = 15  # next-load candidates expanded per partial chain
+    CHAIN_MAX_DEADHEAD_KM: float = 400.0
+    CHAIN_ROAD_FACTOR: float = 1.3
+    CHAIN_AVG_SPEED_KMH: float = 50.0
+    CHAIN_TIME_COST_PER_HOUR: float = 300.0
 
     LOG_LEVEL: str = "INFO"
 
@@ -23,5 +180,15 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-import openai
-openai.api_key = settings.OPENAI_API_KEY
\ No newline at end of file
+
+def store_path(configured: str, filename: str) -> str:
+    """
+    Location of a side store (lane table, archive, ...): its own setting when set,
+    else `filename` next to LOADS_FILE when that is set, so a board kept elsewhere
+    (e.g. a benchmark's scratch copy) never shares state with app/data, else app/data.
+    """
+    if configured:
+        return configured
+    if settings.LOADS_FILE:
+        return os.path.join(os.path.dirname(os.path.abspath(settings.LOADS_FILE)), filename)
+    return os.path.join(PROJECT_ROOT, "app", "data", filename)
@@ -0,0 +1,184 @@
+# logistics_ai_project/app/core/admission.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from app.config import settings
+from app.core.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS, ADMISSION_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Lower rank = served first. Clients pick one with the X-Request-Priority header.
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+DEFAULT_PRIORITY = "normal"
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, gate: str, reason: str):
+        super().__init__(f"{gate}: {reason}")
+        self.gate = gate
+        self.reason = reason
+
+
+class AdmissionGate:
+    """
+    Per-endpoint concurrency limit with a bounded, priority-ordered wait queue.
+
+    At most `max_concurrent` requests run; up to `max_queue` more wait, highest
+    priority first (FIFO within a priority). When the queue is full a newcomer
+    that outranks the lowest-priority waiter takes its place and that waiter is
+    shed; otherwise the newcomer is rejected. Waiting longer than `queue_timeout_s`
+    also rejects. Event-loop only: acquire/release must run on the worker's loop.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout_s: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # heap of (priority rank, arrival seq, future)
+        self._seq = itertools.count()
+        self._in_flight_gauge = ADMISSION_IN_FLIGHT.labels(name)
+        self._queue_gauge = ADMISSION_QUEUE_DEPTH.labels(name)
+        self._wait_histogram = ADMISSION_WAIT.labels(name)
+
+    @property
+    def unlimited(self) -> bool:
+        return self.max_concurrent <= 0
+
+    def _update_gauges(self):
+        self._in_flight_gauge.set(self._active)
+        self._queue_gauge.set(len(self._waiters))
+
+    def _reject(self, reason: str):
+        ADMISSION_REJECTIONS.labels(self.name, reason).inc()
+        raise AdmissionRejected(self.name, reason)
+
+    def _drop_waiter(self, entry: Tuple[int, int, asyncio.Future]):
+        try:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        except ValueError:
+            pass  # already popped by release() or shed
+
+    async def acquire(self, priority: int):
+        if self.unlimited:
+            return
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            self._update_gauges()
+            self._wait_histogram.observe(0.0)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            lowest = max(self._waiters) if self._waiters else None  # queues are small; a linear scan is fine
+            if lowest is None or lowest[0] <= priority:
+                self._reject("queue_full")
+            # The newcomer outranks the lowest-priority waiter: shed that waiter instead
+            self._drop_waiter(lowest)
+            ADMISSION_REJECTIONS.labels(self.name, "shed").inc()
+            lowest[2].set_exception(AdmissionRejected(self.name, "shed"))
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        self._update_gauges()
+        queued_at = time.perf_counter()
+
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout_s)
+        except asyncio.CancelledError:
+            # Client went away while queued. If a slot was already handed over, pass it on.
+            self._drop_waiter(entry)
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()
+            else:
+                future.cancel()
+            self._update_gauges()
+            raise
+
+        if not future.done():
+            future.cancel()
+            self._drop_waiter(entry)
+            self._update_gauges()
+            self._reject("timeout")
+
+        self._update_gauges()
+        future.result()  # re-raises AdmissionRejected if this waiter was shed
+        self._wait_histogram.observe(time.perf_counter() - queued_at)
+
+    def release(self):
+        if self.unlimited:
+            return
+        # Hand the slot straight to the next live waiter so it cannot be stolen in between
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self._active,
+            "queued": len(self._waiters),
+        }
+
+
+def _gate(name: str, max_concurrent: int, max_queue: int) -> AdmissionGate:
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        max_concurrent = 0
+    return AdmissionGate(name, max_concurrent, max_queue, settings.ADMISSION_QUEUE_TIMEOUT_S)
+
+
+# One gate per expensive endpoint; cheap endpoints (feedback, listing, delete) are never gated
+admission_gates: Dict[str, AdmissionGate] = {
+    gate.name: gate for gate in (
+        _gate("recommend", settings.RECOMMEND_MAX_CONCURRENCY, settings.RECOMMEND_MAX_QUEUE),
+        _gate("recommend_summary", settings.SUMMARY_MAX_CONCURRENCY, settings.SUMMARY_MAX_QUEUE),
+        _gate("ask_agent", settings.AGENT_MAX_CONCURRENCY, settings.AGENT_MAX_QUEUE),
+        _gate("upload_loads_excel", settings.UPLOAD_MAX_CONCURRENCY, settings.UPLOAD_MAX_QUEUE),
+    )
+}
+
+
+def request_priority(request: Request) -> int:
+    """Maps the X-Request-Priority header (high / normal / low) to a queue rank; unknown values count as normal."""
+    value = (request.headers.get("x-request-priority") or DEFAULT_PRIORITY).strip().lower()
+    return PRIORITIES.get(value, PRIORITIES[DEFAULT_PRIORITY])
+
+
+def admission(gate_name: str):
+    """
+    FastAPI dependency holding a slot of `gate_name` for the duration of the request:
+
+        @router.post("/recommend", dependencies=[Depends(admission("recommend"))])
+    """
+    gate = admission_gates[gate_name]
+
+    async def hold_slot(request: Request):
+        try:
+            await gate.acquire(request_priority(request))
+        except AdmissionRejected as e:
+            logger.warning(f"Admission rejected for {request.url.path} (gate '{e.gate}', reason '{e.reason}').")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Server is busy ({e.reason}). Please retry shortly.",
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_S)},
+            )
+        try:
+            yield
+        finally:
+            gate.release()
+
+    return hold_slot
@@ -0,0 +1,492 @@
+# logistics_ai_project/app/core/backtest.py
+"""
+Offline backtest: replays the feedback log against candidate scoring weights.
+
+For every feedback event the board as it stood that day is re-scored for the
+truck (loads not yet due, within its capacity) under the baseline weights
+(SCORE_* settings) and each candidate, and the rank of the load the truck
+accepted or rejected is recorded. Good weights rank accepted loads high and
+rejected loads low.
+
+"The board as it stood that day" is the newest --loads snapshot taken on or
+before the event's day (a snapshot is dated DATE=PATH, or by the file's mtime);
+events older than every snapshot are skipped. Without --loads the board is
+rebuilt from the current board and the archive: a load counts from the day the
+change feed saw it added (when that is still in the feed) until the day it was
+archived.
+
+Nothing here calls an upstream API: cities are located through the learned
+place aliases, city-to-city legs come from the lane table and every other leg
+(including the truck's, which live scoring routes for real) is estimated as
+straight line x CHAIN_ROAD_FACTOR at CHAIN_AVG_SPEED_KMH. Events are spread
+over a process pool; each worker gets the route data once. Events for the same
+truck position and day share one scored board.
+
+    python -m app.core.backtest --fuel-divisor 80 --urgency-bonus 3
+    python -m app.core.backtest --loads 2025-05-01=snapshot_may.json --loads 2025-06-01=snapshot_june.json --workers 8 --output report.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.core.deadlines import parse_due_date
+from app.core.geo import haversine_km
+from app.core.lanes import is_coordinate_pair, lane_table
+from app.core.places import normalize_address, place_registry
+from app.core.scoring import ScoringWeights, parse_rate_per_km, score_with_detour
+from app.services.Maps import detour_from_legs
+
+logger = logging.getLogger(__name__)
+
+TOP_K = (1, 5, 10)
+
+# Compact, picklable route data shared with every worker process:
+#   cities: place key -> (lat, lng, normalised text)
+#   lanes:  (origin key, destination key) -> (distance_m, duration_s)
+#   boards: [(snapshot day ordinal, or None for a board valid on every day, loads)], oldest first
+#   loads:  (load_id, pickup key, drop key, rate per km, status, weight or None, due ordinal or None,
+#            first day listed or None, last day listed or None)
+# An event is (truck lat, truck lng, capacity or None, day ordinal, origin key, destination key, accepted)
+RouteData = Dict[str, Any]
+Event = Tuple[float, float, Optional[float], int, str, str, bool]
+# Load ID -> (first day, last day) it was on the board, as ordinals; None where unknown
+ListedDays = Dict[str, Tuple[Optional[int], Optional[int]]]
+
+
+def _locate(address: Any, cities: Dict[str, Tuple[float, float, str]]) -> Optional[str]:
+    """Place key for an address, from the learned aliases only (no geocoding). Adds it to `cities`."""
+    if not isinstance(address, str) or not address.strip():
+        return None
+    if is_coordinate_pair(address):
+        lat, lng = (float(part) for part in address.split(","))
+        key = f"ll:{lat:.4f},{lng:.4f}"
+        cities.setdefault(key, (lat, lng, key))
+        return key
+    if place_registry is None:
+        return None
+    place = place_registry.lookup(address)
+    if place is None:
+        return None
+    cities.setdefault(place.place_id, (place.latitude, place.longitude, normalize_address(address)))
+    return place.place_id
+
+
+def _event_day(timestamp: Any) -> Optional[int]:
+    try:
+        return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).date().toordinal()
+    except ValueError:
+        return None
+
+
+def _compact_board(
+    loads: Iterable[Dict[str, Any]],
+    listed: ListedDays,
+    cities: Dict[str, Tuple[float, float, str]],
+    skipped: Dict[str, int],
+) -> List[tuple]:
+    compact_loads: List[tuple] = []
+    seen_ids = set()
+    for load in loads:
+        if not isinstance(load, dict):
+            continue
+        load_id = str(load.get("load_id") or f"@{len(compact_loads)}")
+        if load_id in seen_ids:
+            continue  # the board's version wins over archived copies
+        seen_ids.add(load_id)
+        pickup = _locate(load.get("pickup_point") or load.get("origin"), cities)
+        drop = _locate(load.get("destination"), cities)
+        if pickup is None or drop is None:
+            skipped["loads_unlocated"] += 1
+            continue
+        weight = load.get("weight_tons")
+        weight = float(weight) if isinstance(weight, (int, float)) and not isinstance(weight, bool) else None
+        due = parse_due_date(load.get("expected_delivery_date"))
+        first_day, last_day = listed.get(load_id, (None, None))
+        compact_loads.append((
+            load_id, pickup, drop, parse_rate_per_km(load.get("rate", "₹0/km"), load_id),
+            str(load.get("status") or ""), weight, due.toordinal() if due is not None else None,
+            first_day, last_day,
+        ))
+    return compact_loads
+
+
+def build_route_data(
+    feedback: Iterable[Dict[str, Any]],
+    boards: Sequence[Tuple[Optional[int], Iterable[Dict[str, Any]]]],
+    trucks: Dict[str, Dict[str, Any]],
+    default_truck_location: Optional[str] = None,
+    default_capacity: Optional[float] = None,
+    listed: Optional[ListedDays] = None,
+) -> Tuple[RouteData, List[Event], Dict[str, int]]:
+    """
+    Resolves board snapshots, trucks and feedback events into RouteData and
+    replayable events. Returns them with counts of what had to be left out and why.
+
+    `boards` are (day ordinal, loads) snapshots; snapshots of the same day are
+    merged. A single snapshot dated None is used for every event, with `listed`
+    saying which days each of its loads was on the board.
+    """
+    cities: Dict[str, Tuple[float, float, str]] = {}
+    skipped = {
+        "loads_unlocated": 0, "events_no_truck_position": 0, "events_unlocated": 0, "events_bad_timestamp": 0,
+        "events_before_first_snapshot": 0,
+    }
+
+    by_day: Dict[Optional[int], List[Dict[str, Any]]] = {}
+    for day, loads in boards:
+        by_day.setdefault(day, []).extend(loads)
+    if None in by_day and len(by_day) > 1:
+        raise ValueError("An undated board cannot be mixed with dated snapshots.")
+    compact_boards = [
+        (day, _compact_board(by_day[day], listed or {}, cities, skipped))
+        for day in sorted(by_day, key=lambda day: day if day is not None else 0)
+    ]
+    first_snapshot_day = compact_boards[0][0] if compact_boards else None
+
+    events: List[Event] = []
+    for entry in feedback:
+        if not isinstance(entry, dict):
+            continue
+        day = _event_day(entry.get("timestamp"))
+        if day is None:
+            skipped["events_bad_timestamp"] += 1
+            continue
+        if first_snapshot_day is not None and day < first_snapshot_day:
+            skipped["events_before_first_snapshot"] += 1
+            continue
+        truck = trucks.get(str(entry.get("truck_id")), {})
+        position = None
+        if truck.get("latitude") is not None and truck.get("longitude") is not None:
+            position = (truck["latitude"], truck["longitude"])
+        else:
+            key = _locate(truck.get("location") or default_truck_location, cities)
+            if key is not None:
+                position = cities[key][:2]
+        if position is None:
+            skipped["events_no_truck_position"] += 1
+            continue
+        origin, destination = _locate(entry.get("load_origin"), cities), _locate(entry.get("load_destination"), cities)
+        if origin is None or destination is None:
+            skipped["events_unlocated"] += 1
+            continue
+        capacity = truck.get("capacity", default_capacity)
+        events.append((position[0], position[1], float(capacity) if capacity is not None else None,
+                       day, origin, destination, str(entry.get("action", "")).lower() == "accepted"))
+
+    route_data = {
+        "cities": cities,
+        "lanes": lane_table.snapshot() if lane_table is not None else {},
+        "boards": compact_boards,
+        "road_factor": settings.CHAIN_ROAD_FACTOR,
+        "avg_speed_kmh": settings.CHAIN_AVG_SPEED_KMH,
+    }
+    return route_data, events, skipped
+
+
+# --- Worker side ------------------------------------------------------------
+
+_route_data: RouteData = {}
+_city_legs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+
+def _init_worker(route_data: RouteData):
+    global _route_data
+    _route_data = route_data
+    _city_legs.clear()
+
+
+def _estimated_leg(lat1: float, lng1: float, lat2: float, lng2: float) -> Dict[str, Any]:
+    road_km = haversine_km(lat1, lng1, lat2, lng2) * _route_data["road_factor"]
+    return {"distance": {"value": road_km * 1000}, "duration": {"value": road_km / _route_data["avg_speed_kmh"] * 3600}}
+
+
+def _city_leg(origin: str, destination: str) -> Dict[str, Any]:
+    """Lane table first (by place key, then by the city text older lanes used), else an estimate."""
+    key = (origin, destination)
+    leg = _city_legs.get(key)
+    if leg is None:
+        cities, lanes = _route_data["cities"], _route_data["lanes"]
+        (lat1, lng1, text1), (lat2, lng2, text2) = cities[origin], cities[destination]
+        lane = lanes.get(key) or lanes.get((text1, text2))
+        if lane is not None:
+            leg = {"distance": {"value": lane[0]}, "duration": {"value": lane[1]}}
+        else:
+            leg = _estimated_leg(lat1, lng1, lat2, lng2)
+        _city_legs[key] = leg
+    return leg
+
+
+def _board_loads(day: int) -> List[tuple]:
+    """Loads listed on `day`, from the newest snapshot taken on or before it."""
+    boards = _route_data["boards"]
+    if not boards:
+        return []
+    position = bisect_right([snapshot_day or 0 for snapshot_day, _ in boards], day) - 1
+    return boards[max(position, 0)][1]
+
+
+class _Board:
+    """
+    The board one truck position sees on one day, scored under every weight set.
+    Per weight set it keeps all scores sorted and the best score per lane, so the
+    rank of any lane's load is a bisect. Feedback events for the same truck
+    position and day (the common case) share one board.
+    """
+
+    def __init__(self, truck_lat: float, truck_lng: float, capacity: Optional[float], day: int, weight_sets: List[ScoringWeights]):
+        cities = _route_data["cities"]
+        candidates = [
+            load for load in _board_loads(day)
+            if (load[6] is None or load[6] >= day) and (capacity is None or load[5] is None or load[5] <= capacity)
+            and (load[7] is None or load[7] <= day) and (load[8] is None or load[8] >= day)
+        ]
+        self.size = len(candidates)
+
+        truck_legs: Dict[str, Dict[str, Any]] = {}
+
+        def from_truck(city: str) -> Dict[str, Any]:
+            leg = truck_legs.get(city)
+            if leg is None:
+                lat, lng, _ = cities[city]
+                leg = truck_legs[city] = _estimated_leg(truck_lat, truck_lng, lat, lng)
+            return leg
+
+        # The detour only depends on the lane, so it is worked out once per lane
+        detours: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for _, pickup, drop, *_ in candidates:
+            if (pickup, drop) not in detours:
+                detours[(pickup, drop)] = detour_from_legs(from_truck(drop), from_truck(pickup), _city_leg(pickup, drop))
+
+        self.sorted_scores: List[List[float]] = []
+        self.lane_best: List[Dict[Tuple[str, str], float]] = []
+        for weights in weight_sets:
+            scores = []
+            lane_best: Dict[Tuple[str, str], float] = {}
+            for _, pickup, drop, rate, status, *_ in candidates:
+                score = score_with_detour(rate, status, detours[(pickup, drop)], weights)
+                scores.append(score)
+                if score > lane_best.get((pickup, drop), float("-inf")):
+                    lane_best[(pickup, drop)] = score
+            scores.sort()
+            self.sorted_scores.append(scores)
+            self.lane_best.append(lane_best)
+
+    def ranks(self, origin: str, destination: str) -> List[int]:
+        """1-based rank of the best load on the lane under each weight set (ties rank optimistically); [] if none is on the board."""
+        if (origin, destination) not in self.lane_best[0]:
+            return []
+        return [
+            len(scores) - bisect_right(scores, lane_best[(origin, destination)]) + 1
+            for scores, lane_best in zip(self.sorted_scores, self.lane_best)
+        ]
+
+
+def _replay_chunk(events: List[Event], weight_sets: List[ScoringWeights]) -> List[Tuple[bool, int, List[int]]]:
+    """For each replayable event: (accepted, candidate count, rank under each weight set)."""
+    boards: Dict[Tuple[float, float, Optional[float], int], _Board] = {}
+    results = []
+    for truck_lat, truck_lng, capacity, day, origin, destination, accepted in events:
+        board_key = (truck_lat, truck_lng, capacity, day)
+        board = boards.get(board_key)
+        if board is None:
+            boards.clear()  # events arrive sorted by board, so one live board is enough
+            board = boards[board_key] = _Board(truck_lat, truck_lng, capacity, day, weight_sets)
+        results.append((accepted, board.size, board.ranks(origin, destination)))
+    return results
+
+
+# --- Parent side ------------------------------------------------------------
+
+def _metrics(results: List[Tuple[bool, int, List[int]]], position: int, top_k: Sequence[int]) -> Dict[str, Any]:
+    """
+    Acceptance-weighted ranking metrics for one weight set. MRR is the mean of
+    1/rank; weighted_mrr counts accepted loads +1/rank and rejected ones -1/rank,
+    so it rises when accepted loads move up and rejected loads move down.
+    """
+    accepted = [ranks[position] for was_accepted, _, ranks in results if ranks and was_accepted]
+    rejected = [ranks[position] for was_accepted, _, ranks in results if ranks and not was_accepted]
+    replayed = len(accepted) + len(rejected)
+
+    def mean(values: List[float]) -> Optional[float]:
+        return round(sum(values) / len(values), 4) if values else None
+
+    metrics: Dict[str, Any] = {
+        "accepted": len(accepted),
+        "rejected": len(rejected),
+        "accepted_mrr": mean([1.0 / rank for rank in accepted]),
+        "rejected_mrr": mean([1.0 / rank for rank in rejected]),
+        "accepted_mean_rank": mean(accepted),
+        "weighted_mrr": round((sum(1.0 / rank for rank in accepted) - sum(1.0 / rank for rank in rejected)) / replayed, 4) if replayed else None,
+    }
+    for k in top_k:
+        metrics[f"accepted_hit_at_{k}"] = mean([1.0 if rank <= k else 0.0 for rank in accepted])
+        metrics[f"rejected_hit_at_{k}"] = mean([1.0 if rank <= k else 0.0 for rank in rejected])
+    return metrics
+
+
+def run_backtest(
+    route_data: RouteData,
+    events: List[Event],
+    weight_sets: Dict[str, ScoringWeights],
+    workers: int = 0,
+    chunk_size: int = 200,
+    top_k: Sequence[int] = TOP_K,
+) -> Dict[str, Any]:
+    """
+    Replays `events` under every named weight set and returns metrics per set,
+    plus each set's change against the first one. workers=0 uses one process
+    per CPU; workers=1 replays in this process.
+    """
+    names = list(weight_sets)
+    weights = [weight_sets[name] for name in names]
+    events = sorted(events, key=lambda event: (event[0], event[1], event[2] if event[2] is not None else -1.0, event[3]))
+    chunks = [events[start:start + chunk_size] for start in range(0, len(events), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    results: List[Tuple[bool, int, List[int]]] = []
+    if workers == 1 or len(chunks) <= 1:
+        _init_worker(route_data)
+        for chunk in chunks:
+            results.extend(_replay_chunk(chunk, weights))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker, initargs=(route_data,)) as pool:
+            for chunk_results in pool.map(_replay_chunk, chunks, [weights] * len(chunks)):
+                results.extend(chunk_results)
+
+    report: Dict[str, Any] = {
+        "events_replayed": sum(1 for _, _, ranks in results if ranks),
+        "events_load_not_on_board": sum(1 for _, _, ranks in results if not ranks),
+        "mean_candidates": round(sum(count for _, count, _ in results) / len(results), 1) if results else 0,
+        "weights": {name: weight_set._asdict() for name, weight_set in weight_sets.items()},
+        "metrics": {name: _metrics(results, position, top_k) for position, name in enumerate(names)},
+    }
+    baseline = report["metrics"][names[0]]
+    report["delta"] = {
+        name: {
+            metric: round(value - baseline[metric], 4)
+            for metric, value in report["metrics"][name].items()
+            if isinstance(value, float) and isinstance(baseline.get(metric), float)
+        }
+        for name in names[1:]
+    }
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def _flatten(entries: List[Any]) -> List[Dict[str, Any]]:
+    """Flattens the store's nested-list layout into plain dicts."""
+    return [item for entry in entries for item in (entry if isinstance(entry, list) else [entry]) if isinstance(item, dict)]
+
+
+def _read_json_list(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{path} does not contain a JSON list.")
+    return _flatten(data)
+
+
+def _dated_snapshot(spec: str) -> Tuple[int, List[Dict[str, Any]]]:
+    """'YYYY-MM-DD=PATH', or 'PATH' dated by the file's modification time."""
+    day_text, separator, path = spec.partition("=")
+    try:
+        day = date.fromisoformat(day_text).toordinal() if separator else None
+    except ValueError:
+        day = None
+    if day is None:
+        path = spec
+        day = date.fromtimestamp(os.path.getmtime(path)).toordinal()
+    return day, _read_json_list(path)
+
+
+def _default_board(include_archive: bool = True) -> Tuple[List[Dict[str, Any]], ListedDays]:
+    """
+    The current board plus archived loads, and the days each was listed: from its
+    'add' in the change feed (unknown once pruned) to the day it was archived.
+    """
+    from app.data.archive import load_archive
+    from app.data.changes import load_change_log
+    from app.data.data_loader import get_dummy_loads
+
+    loads = _flatten(get_dummy_loads())
+    listed: ListedDays = {}
+    if load_change_log is not None:
+        for load_id, added_at in load_change_log.first_added().items():
+            listed[load_id] = (date.fromtimestamp(added_at).toordinal(), None)
+    if load_archive is not None and include_archive:
+        for entry in load_archive.query(limit=-1):
+            load = entry["load"]
+            load_id = str(load.get("load_id"))
+            listed[load_id] = (listed.get(load_id, (None, None))[0], date.fromtimestamp(entry["archived_at"]).toordinal())
+            loads.append(load)
+    return loads, listed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay the feedback log against candidate scoring weights (offline).")
+    parser.add_argument("--feedback", help="feedback log JSON (default: the app's feedback file)")
+    parser.add_argument("--loads", action="append", metavar="[YYYY-MM-DD=]PATH",
+                        help="load board snapshot JSON and the day it was taken (default: the file's mtime); repeatable."
+                             " Each event replays against the newest snapshot on or before its day (default: current board + archive)")
+    parser.add_argument("--no-archive", action="store_true", help="do not add archived loads to the default board")
+    parser.add_argument("--fuel-divisor", type=float, help="candidate SCORE_FUEL_DIVISOR")
+    parser.add_argument("--time-divisor", type=float, help="candidate SCORE_TIME_DIVISOR")
+    parser.add_argument("--urgency-bonus", type=float, help="candidate SCORE_URGENCY_BONUS")
+    parser.add_argument("--truck-location", help="position for trucks the registry cannot place (address or 'lat,lng')")
+    parser.add_argument("--truck-capacity", type=float, help="capacity for trucks the registry has none for (default: no capacity filter)")
+    parser.add_argument("--workers", type=int, default=0, help="processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="events per work item")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    from app.core.trucks import truck_registry
+    from app.data.data_loader import get_dummy_feedback
+
+    feedback = _read_json_list(args.feedback) if args.feedback else get_dummy_feedback()
+    listed: Optional[ListedDays] = None
+    if args.loads:
+        boards = [_dated_snapshot(spec) for spec in args.loads]
+    else:
+        loads, listed = _default_board(not args.no_archive)
+        boards = [(None, loads)]
+    trucks = {str(truck.get("truck_id")): truck for truck in truck_registry.all()}
+
+    baseline = ScoringWeights.from_settings()
+    candidate = baseline._replace(**{
+        field: value for field, value in (
+            ("fuel_divisor", args.fuel_divisor), ("time_divisor", args.time_divisor), ("urgency_bonus", args.urgency_bonus),
+        ) if value is not None
+    })
+
+    route_data, events, skipped = build_route_data(feedback, boards, trucks, args.truck_location, args.truck_capacity, listed)
+    report = run_backtest(route_data, events, {"baseline": baseline, "candidate": candidate}, args.workers, args.chunk_size)
+    report = {
+        "feedback_events": len(feedback),
+        "snapshots": len(route_data["boards"]),
+        "loads": sum(len(loads) for _, loads in route_data["boards"]),
+        "skipped": skipped,
+        **report,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if not report["events_replayed"]:
+        print("No feedback event could be replayed; see 'skipped' (cities must have been geocoded once by the app).", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# logistics_ai_project/app/core/budget.py
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class CallBudget:
+    """
+    Per-request cap on upstream calls and wall time for anytime scoring.
+    A limit of 0 means unlimited. Upstream clients charge the budget of the
+    request they run for (see charge_upstream_call), and the scoring loop asks
+    `exhausted()` before starting each load, so the work in flight is always
+    finished: the call cap can be overshot by at most one load's calls.
+    """
+
+    def __init__(self, max_calls: int = 0, max_seconds: float = 0.0):
+        self.max_calls = max_calls
+        self.max_seconds = max_seconds
+        self.started = time.perf_counter()
+        self.calls = 0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.max_calls <= 0 and self.max_seconds <= 0
+
+    def charge(self, calls: int = 1):
+        self.calls += calls  # one scoring thread per request; the GIL is enough here
+
+    def remaining_seconds(self) -> Optional[float]:
+        """Wall time left, or None without a time limit."""
+        if self.max_seconds <= 0:
+            return None
+        return self.max_seconds - (time.perf_counter() - self.started)
+
+    def exhausted(self) -> Optional[str]:
+        """'calls' or 'time' once a limit is reached, else None."""
+        if self.max_calls > 0 and self.calls >= self.max_calls:
+            return "calls"
+        if self.max_seconds > 0 and time.perf_counter() - self.started >= self.max_seconds:
+            return "time"
+        return None
+
+
+_current_budget: contextvars.ContextVar[Optional[CallBudget]] = contextvars.ContextVar("call_budget", default=None)
+
+
+@contextmanager
+def call_budget(budget: Optional[CallBudget]) -> Iterator[Optional[CallBudget]]:
+    """Makes `budget` the one charged by upstream calls made inside the block (None = no budget)."""
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def upstream_timeout(cap_s: float) -> float:
+    """
+    Timeout for one upstream call: `cap_s`, lowered to the current budget's
+    remaining wall time, so a hung call cannot hold a request past its budget.
+    """
+    budget = _current_budget.get()
+    remaining = budget.remaining_seconds() if budget is not None else None
+    if remaining is None:
+        return cap_s
+    return max(0.05, min(cap_s, remaining))  # a spent budget still gets a token attempt, not timeout=0
+
+
+def charge_upstream_call():
+    """Called by upstream clients for every real (non-cached, non-mock) request."""
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.charge()
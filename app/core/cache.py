@@ -0,0 +1,268 @@
+# logistics_ai_project/app/core/cache.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from app.config import settings, PROJECT_ROOT
+from app.core.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class Cache:
+    """
+    Interface shared by every cache tier used by the scoring and Maps services.
+    Keys are strings; values must be JSON-serialisable so tiers can be swapped.
+    """
+
+    name: str = "cache"
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class TTLCache(Cache):
+    """Thread-safe in-process LRU cache with per-entry expiry."""
+
+    def __init__(self, name: str, max_entries: int, ttl_s: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = CACHE_REQUESTS.labels(name, "hit")
+        self._misses = CACHE_REQUESTS.labels(name, "miss")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._hits.inc()
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        self._misses.inc()
+        return None
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        expires_at = time.monotonic() + (ttl_s if ttl_s is not None else self.ttl_s)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class WALConnections:
+    """Per-thread (and per-process, after a fork) connections to one SQLite file in WAL mode."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)  # autocommit
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # safe with WAL; a crash can only lose the last few writes
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class SQLiteCache(Cache):
+    """
+    Cache shared by every worker process on the host, kept in one SQLite file in
+    WAL mode so readers never block the writer. Entries carry an absolute expiry
+    and a last-access time; once a cache grows past `max_entries` its least
+    recently used entries are trimmed, so eviction is the same whichever worker
+    triggers it. SQLite errors are logged and treated as misses: a broken cache
+    must never fail a request.
+    """
+
+    TRIM_EVERY_SETS = 128    # size check frequency per process
+    TOUCH_AFTER_S = 60.0     # last-access updates are coarse so most reads stay read-only
+
+    def __init__(self, name: str, path: str, max_entries: int, ttl_s: float):
+        self.name = name
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._connections = WALConnections(path)
+        self._sets_since_trim = 0
+        self._hits = CACHE_REQUESTS.labels(name, "hit")
+        self._misses = CACHE_REQUESTS.labels(name, "miss")
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " cache TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (cache, key)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (cache, accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()  # wall clock: expiry times are shared across processes
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM cache_entries WHERE cache = ? AND key = ?",
+                (self.name, key),
+            ).fetchone()
+            if row is not None and row[1] > now:
+                if now - row[2] > self.TOUCH_AFTER_S:
+                    conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE cache = ? AND key = ?", (now, self.name, key))
+                self._hits.inc()
+                return json.loads(row[0])
+            if row is not None:
+                conn.execute("DELETE FROM cache_entries WHERE cache = ? AND key = ? AND expires_at <= ?", (self.name, key, now))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache '{self.name}' read failed: {e}")
+        self._misses.inc()
+        return None
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        now = time.time()
+        expires_at = now + (ttl_s if ttl_s is not None else self.ttl_s)
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO cache_entries (cache, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.name, key, json.dumps(value, separators=(",", ":")), expires_at, now),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache '{self.name}' write failed: {e}")
+            return
+        self._sets_since_trim += 1
+        if self._sets_since_trim >= self.TRIM_EVERY_SETS:
+            self._sets_since_trim = 0
+            self.trim()
+
+    def trim(self):
+        """Drops expired entries, then the least recently used ones beyond `max_entries`."""
+        try:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache_entries WHERE cache = ? AND expires_at <= ?", (self.name, time.time()))
+            (count,) = conn.execute("SELECT COUNT(*) FROM cache_entries WHERE cache = ?", (self.name,)).fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE cache = ? AND key IN ("
+                    " SELECT key FROM cache_entries WHERE cache = ? ORDER BY accessed_at LIMIT ?)",
+                    (self.name, self.name, count - self.max_entries),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache '{self.name}' trim failed: {e}")
+
+    def delete(self, key: str):
+        try:
+            self._connection().execute("DELETE FROM cache_entries WHERE cache = ? AND key = ?", (self.name, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache '{self.name}' delete failed: {e}")
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM cache_entries WHERE cache = ?", (self.name,))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache '{self.name}' clear failed: {e}")
+
+    def __len__(self) -> int:
+        try:
+            (count,) = self._connection().execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE cache = ? AND expires_at > ?", (self.name, time.time())
+            ).fetchone()
+            return count
+        except sqlite3.Error:
+            return 0
+
+
+class TieredCache(Cache):
+    """
+    A small, short-lived in-process tier in front of a shared tier. Hot keys are
+    served without touching SQLite; anything the local tier misses is looked up
+    in (and written through to) the shared tier. A delete on one worker reaches
+    the others' local tiers only after their local TTL.
+    """
+
+    def __init__(self, local: Cache, shared: Cache):
+        self.name = shared.name
+        self.local = local
+        self.shared = shared
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        self.shared.set(key, value, ttl_s)
+        self.local.set(key, value)
+
+    def delete(self, key: str):
+        self.shared.delete(key)
+        self.local.delete(key)
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+
+    def __len__(self) -> int:
+        return len(self.shared)
+
+
+def make_cache(name: str, max_entries: int, ttl_s: float) -> Cache:
+    """Builds the cache tier used for `name`. Single place to choose the backend (CACHE_BACKEND)."""
+    backend = settings.CACHE_BACKEND.lower()
+    if backend == "sqlite":
+        path = settings.CACHE_SQLITE_PATH or os.path.join(PROJECT_ROOT, "cache", "shared_cache.sqlite3")
+        try:
+            shared = SQLiteCache(name, path=path, max_entries=max_entries, ttl_s=ttl_s)
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Could not open shared cache at {path} ({e}). Using an in-process cache for '{name}'.")
+        else:
+            local = TTLCache(
+                f"{name}_local",
+                max_entries=min(max_entries, settings.CACHE_LOCAL_MAX_ENTRIES),
+                ttl_s=min(ttl_s, settings.CACHE_LOCAL_TTL_S),
+            )
+            return TieredCache(local, shared)
+    elif backend != "memory":
+        logger.warning(f"Unknown CACHE_BACKEND '{settings.CACHE_BACKEND}'. Using an in-process cache for '{name}'.")
+    return TTLCache(name, max_entries=max_entries, ttl_s=ttl_s)
@@ -0,0 +1,310 @@
+# logistics_ai_project/app/core/chains.py
+import heapq
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.core.deadlines import parse_due_date
+from app.core.geo import haversine_km
+from app.core.lanes import lane_table
+from app.core.scoring import cached_coordinates, get_coordinates, parse_rate_per_km
+from app.core.timing import timed
+from app.models import Truck
+from app.services.Maps import get_route_leg
+
+logger = logging.getLogger(__name__)
+
+TRUCK_POSITION = "__truck__"  # matrix key for the truck's current position
+
+# (km, minutes, source) for one leg; source is lane, estimate, route or mock
+Leg = Tuple[float, float, str]
+
+
+def deadhead_cost(km: float, minutes: float) -> float:
+    """Cost of driving empty: fuel per km plus the truck's time."""
+    return km * settings.FUEL_COST_PER_KM + minutes / 60.0 * settings.CHAIN_TIME_COST_PER_HOUR
+
+
+class _Candidate:
+    """A load that fits the truck, with its cities resolved and its loaded leg costed."""
+    __slots__ = ("index", "load", "pickup", "drop", "due", "rate_per_km", "loaded", "revenue")
+
+    def __init__(self, index: int, load: Dict[str, Any], pickup: str, drop: str, due: Optional[date], rate_per_km: float, loaded: Leg):
+        self.index = index
+        self.load = load
+        self.pickup = pickup
+        self.drop = drop
+        self.due = due
+        self.rate_per_km = rate_per_km
+        self.loaded = loaded
+        self.revenue = rate_per_km * loaded[0]
+
+
+class LegMatrix:
+    """
+    Distances between load cities for one planning run, memoised per pair.
+    Known lanes come from the lane table; anything else is estimated from the
+    geocoded coordinates (straight line x CHAIN_ROAD_FACTOR at CHAIN_AVG_SPEED_KMH),
+    so building it never calls the Distance Matrix API. Pairs whose straight-line
+    distance already exceeds `max_km` are not looked up at all and return None.
+    """
+
+    def __init__(self, coords: Dict[str, Tuple[float, float]]):
+        self.coords = coords
+        self._memo: Dict[Tuple[str, str], Optional[Leg]] = {}
+
+    def leg(self, origin: str, destination: str, max_km: Optional[float] = None) -> Optional[Leg]:
+        key = (origin, destination)
+        if key in self._memo:
+            cached = self._memo[key]
+            return cached if cached is None or max_km is None or cached[0] <= max_km else None
+
+        (lat1, lng1), (lat2, lng2) = self.coords[origin], self.coords[destination]
+        straight_km = haversine_km(lat1, lng1, lat2, lng2)
+        if max_km is not None and straight_km > max_km:
+            return None  # roads are never shorter than the great circle
+
+        result: Optional[Leg] = None
+        if lane_table is not None and origin != TRUCK_POSITION:
+            element = lane_table.lookup(origin, destination)
+            if element is not None:
+                result = (element["distance"]["value"] / 1000.0, element["duration"]["value"] / 60.0, "lane")
+        if result is None:
+            road_km = straight_km * settings.CHAIN_ROAD_FACTOR
+            result = (road_km, road_km / settings.CHAIN_AVG_SPEED_KMH * 60.0, "estimate")
+        self._memo[key] = result
+        return result if max_km is None or result[0] <= max_km else None
+
+
+class _Partial:
+    __slots__ = ("value", "chain", "deadhead")
+
+    def __init__(self, value: float, chain: Tuple[int, ...], deadhead: Tuple[Leg, ...]):
+        self.value = value
+        self.chain = chain
+        self.deadhead = deadhead
+
+
+def _resolve_candidates(truck: Truck, loads: List[Dict[str, Any]]) -> Tuple[List[_Candidate], LegMatrix]:
+    """
+    Capacity filter plus the coordinates of every distinct city, from the learned
+    place aliases and the geocode cache only: a cold city costs no live geocode
+    here, its loads are just left out (the app learns cities as loads are posted).
+    Only the truck's own position may be geocoded, once.
+    """
+    coords: Dict[str, Tuple[float, float]] = {}
+    failed = set()
+
+    def locate(city: str) -> bool:
+        if city in coords:
+            return True
+        if city in failed:
+            return False
+        result = cached_coordinates(city)
+        if result is None or not result.get("status"):
+            failed.add(city)
+            return False
+        coords[city] = (result["latitude"], result["longitude"])
+        return True
+
+    if truck.latitude is not None and truck.longitude is not None:
+        coords[TRUCK_POSITION] = (truck.latitude, truck.longitude)
+    else:
+        try:
+            result = get_coordinates(truck.location)
+        except Exception as e:
+            # The exception text can carry the request URL, API key included: log it, do not return it
+            logger.warning(f"Chain planner could not geocode the truck at '{truck.location}': {e}")
+            raise ValueError(f"Could not geocode '{truck.location}'")
+        if not result.get("status"):
+            raise ValueError(result.get("message", f"Could not geocode '{truck.location}'"))
+        coords[TRUCK_POSITION] = (result["latitude"], result["longitude"])
+
+    matrix = LegMatrix(coords)
+    candidates = []
+    for load in loads:
+        weight = load.get("weight_tons")
+        if isinstance(weight, (int, float)) and weight > truck.capacity:
+            continue
+        pickup = load.get("pickup_point") or load.get("origin")
+        drop = load.get("destination")
+        if not pickup or not drop or not locate(pickup) or not locate(drop):
+            continue
+        candidates.append(_Candidate(
+            index=len(candidates),
+            load=load,
+            pickup=pickup,
+            drop=drop,
+            due=parse_due_date(load.get("expected_delivery_date")),
+            rate_per_km=parse_rate_per_km(load.get("rate"), load.get("load_id", "N/A")),
+            loaded=matrix.leg(pickup, drop),
+        ))
+    if failed:
+        logger.info(f"Chain planner skipped loads in {len(failed)} cities with no known coordinates yet.")
+    return candidates, matrix
+
+
+def _beam_search(candidates: List[_Candidate], matrix: LegMatrix, max_loads: int) -> List[_Partial]:
+    """
+    Beam search over chains, one load per step. Step 1 seeds from the truck's
+    position; each further step extends a partial chain with the best next loads
+    picked up near its last drop (CHAIN_BRANCHING of them), keeping delivery dates
+    in order. Partial chains covering the same loads and ending on the same load
+    are merged, keeping the best (the DP state), and only CHAIN_BEAM_WIDTH
+    survive each step. Returns every chain of two or more loads it built.
+    """
+    max_deadhead = settings.CHAIN_MAX_DEADHEAD_KM
+    beam_width = settings.CHAIN_BEAM_WIDTH
+    branching = settings.CHAIN_BRANCHING
+
+    beam = []
+    for candidate in candidates:
+        leg = matrix.leg(TRUCK_POSITION, candidate.pickup, max_deadhead)
+        if leg is not None:
+            beam.append(_Partial(candidate.revenue - deadhead_cost(leg[0], leg[1]), (candidate.index,), (leg,)))
+    beam = heapq.nlargest(beam_width, beam, key=lambda p: p.value)
+
+    # Next-load options per drop city, best marginal gain first; built lazily, once per city
+    options_by_drop: Dict[str, List[Tuple[float, _Candidate, Leg]]] = {}
+
+    def next_options(drop: str) -> List[Tuple[float, _Candidate, Leg]]:
+        options = options_by_drop.get(drop)
+        if options is None:
+            options = []
+            for candidate in candidates:
+                leg = matrix.leg(drop, candidate.pickup, max_deadhead)
+                if leg is not None:
+                    options.append((candidate.revenue - deadhead_cost(leg[0], leg[1]), candidate, leg))
+            options.sort(key=lambda option: option[0], reverse=True)
+            options_by_drop[drop] = options
+        return options
+
+    completed: List[_Partial] = []
+    for _ in range(1, max_loads):
+        best_by_state: Dict[Tuple[frozenset, int], _Partial] = {}
+        for partial in beam:
+            last = candidates[partial.chain[-1]]
+            taken = 0
+            for gain, candidate, leg in next_options(last.drop):
+                if taken >= branching:
+                    break
+                if candidate.index in partial.chain:
+                    continue
+                if last.due and candidate.due and candidate.due < last.due:
+                    continue
+                taken += 1
+                extended = _Partial(partial.value + gain, partial.chain + (candidate.index,), partial.deadhead + (leg,))
+                state = (frozenset(extended.chain), candidate.index)
+                best = best_by_state.get(state)
+                if best is None or extended.value > best.value:
+                    best_by_state[state] = extended
+        if not best_by_state:
+            break
+        beam = heapq.nlargest(beam_width, best_by_state.values(), key=lambda p: p.value)
+        completed.extend(beam)
+    return completed
+
+
+def _exact_leg(origin: str, destination: str, coords: Dict[str, Tuple[float, float]], memo: Dict[Tuple[str, str], Optional[Leg]]) -> Optional[Leg]:
+    key = (origin, destination)
+    if key not in memo:
+        origin_value = f"{coords[origin][0]},{coords[origin][1]}" if origin == TRUCK_POSITION else origin
+        element = get_route_leg(origin_value, destination)
+        memo[key] = None if element is None else (
+            element["distance"]["value"] / 1000.0,
+            element["duration"]["value"] / 60.0,
+            "mock" if element.get("status") == "OK_MOCK" else "route",
+        )
+    return memo[key]
+
+
+def _describe(partial: _Partial, candidates: List[_Candidate]) -> Dict[str, Any]:
+    legs = []
+    previous = "truck"
+    for position, index in enumerate(partial.chain):
+        candidate = candidates[index]
+        deadhead = partial.deadhead[position]
+        legs.append({"kind": "deadhead", "from": previous, "to": candidate.pickup,
+                     "km": round(deadhead[0], 1), "min": round(deadhead[1], 1), "source": deadhead[2]})
+        legs.append({"kind": "loaded", "from": candidate.pickup, "to": candidate.drop, "load_id": candidate.load.get("load_id"),
+                     "km": round(candidate.loaded[0], 1), "min": round(candidate.loaded[1], 1), "source": candidate.loaded[2]})
+        previous = candidate.drop
+
+    deadhead_km = sum(leg[0] for leg in partial.deadhead)
+    deadhead_min = sum(leg[1] for leg in partial.deadhead)
+    revenue = sum(candidates[index].revenue for index in partial.chain)
+    cost = deadhead_cost(deadhead_km, deadhead_min)
+    return {
+        "load_ids": [candidates[index].load.get("load_id") for index in partial.chain],
+        "loads": [candidates[index].load for index in partial.chain],
+        "net_value": round(revenue - cost, 2),
+        "total_revenue": round(revenue, 2),
+        "loaded_km": round(sum(candidates[index].loaded[0] for index in partial.chain), 1),
+        "deadhead_km": round(deadhead_km, 1),
+        "deadhead_min": round(deadhead_min, 1),
+        "deadhead_cost": round(cost, 2),
+        "exact": all(leg["source"] != "estimate" for leg in legs),
+        "legs": legs,
+    }
+
+
+def _recost_exact(partial: _Partial, candidates: List[_Candidate], coords, memo) -> Tuple[_Partial, List[_Candidate]]:
+    """Replaces estimated legs of one chain with real routes (lane table / route-leg cache first)."""
+    deadhead = []
+    previous = TRUCK_POSITION
+    chain_candidates = []
+    for position, index in enumerate(partial.chain):
+        candidate = candidates[index]
+        leg = partial.deadhead[position]
+        if leg[2] == "estimate":
+            leg = _exact_leg(previous, candidate.pickup, coords, memo) or leg
+        deadhead.append(leg)
+        loaded = candidate.loaded
+        if loaded[2] == "estimate":
+            loaded = _exact_leg(candidate.pickup, candidate.drop, coords, memo) or loaded
+        chain_candidates.append(_Candidate(position, candidate.load, candidate.pickup, candidate.drop,
+                                           candidate.due, candidate.rate_per_km, loaded))
+        previous = candidate.drop
+    value = sum(c.revenue for c in chain_candidates) - deadhead_cost(sum(l[0] for l in deadhead), sum(l[1] for l in deadhead))
+    return _Partial(value, tuple(range(len(chain_candidates))), tuple(deadhead)), chain_candidates
+
+
+def plan_load_chains(
+    truck: Truck,
+    loads: List[Dict[str, Any]],
+    max_loads: Optional[int] = None,
+    limit: int = 10,
+    exact: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Builds chains of 2..max_loads loads for one truck (each load fits the truck's
+    capacity, delivery dates non-decreasing along the chain) and ranks them by
+    total revenue (rate per km x loaded km) minus deadhead fuel and time cost.
+
+    The search itself runs on estimated/lane distances only. With `exact`, the
+    `limit` best chains are then re-costed with real routes, which costs at most
+    a few Distance Matrix calls per chain and far fewer once lanes are known.
+    Blocking (geocoding, Google Maps); run it on the upstream pool.
+    Raises ValueError when the truck's position cannot be resolved.
+    """
+    max_loads = max(2, max_loads or settings.CHAIN_MAX_LOADS)
+
+    with timed("chain_candidates"):
+        candidates, matrix = _resolve_candidates(truck, loads)
+    if len(candidates) < 2:
+        return []
+
+    with timed("chain_search"):
+        completed = _beam_search(candidates, matrix, max_loads)
+        best = heapq.nlargest(limit, completed, key=lambda p: p.value)
+
+    if not exact:
+        return [_describe(partial, candidates) for partial in best]
+
+    with timed("chain_routes"):
+        memo: Dict[Tuple[str, str], Optional[Leg]] = {}
+        chains = [_describe(*_recost_exact(partial, candidates, matrix.coords, memo)) for partial in best]
+    chains.sort(key=lambda chain: chain["net_value"], reverse=True)
+    logger.info(f"Chain planner: {len(candidates)} candidate loads, {len(completed)} chains built, {len(chains)} returned.")
+    return chains
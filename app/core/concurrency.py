@@ -0,0 +1,156 @@
+# logistics_ai_project/app/core/concurrency.py
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set, TypeVar
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Two bounded pools so that slow upstream calls (Google Maps, OpenAI) cannot
+# starve quick local file work, and neither can block the event loop. Created on
+# first use, and again after shutdown_executors(), so a second app lifespan in the
+# same process (tests, reload) gets working pools.
+_executor_sizes = {"blocking-io": settings.BLOCKING_IO_WORKERS, "upstream": settings.UPSTREAM_WORKERS}
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+# Set by the profiler for a sampled request: while an executor thread runs one of
+# that request's jobs its ident is in the set, so the sampler looks at those threads only
+request_threads: contextvars.ContextVar[Optional[Set[int]]] = contextvars.ContextVar("request_threads", default=None)
+
+
+def _executor(name: str) -> ThreadPoolExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = _executors[name] = ThreadPoolExecutor(max_workers=_executor_sizes[name], thread_name_prefix=name)
+    return executor
+
+
+def _call_tracked(threads: Set[int], func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    ident = threading.get_ident()
+    threads.add(ident)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        threads.discard(ident)
+
+
+async def _run_in(executor: ThreadPoolExecutor, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    # Copy the caller's context so contextvars (request-scoped state) are visible in the worker thread
+    ctx = contextvars.copy_context()
+    threads = request_threads.get()
+    if threads is not None:
+        return await loop.run_in_executor(executor, functools.partial(ctx.run, _call_tracked, threads, func, *args, **kwargs))
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+async def run_blocking_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs blocking file / CPU work (JSON store reads and writes, Excel parsing) off the event loop."""
+    return await _run_in(_executor("blocking-io"), func, *args, **kwargs)
+
+
+async def run_upstream(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs work dominated by blocking network calls (Google Maps, OpenAI) off the event loop."""
+    return await _run_in(_executor("upstream"), func, *args, **kwargs)
+
+
+def shutdown_executors():
+    """Shuts the pools down; the next run_blocking_io()/run_upstream() call creates fresh ones."""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PeriodicJob:
+    """
+    Runs a blocking `func` every `interval_s` on one of the executors
+    (run_blocking_io by default) from a background task started in the app
+    lifespan. Failures are logged and the job keeps its schedule.
+    """
+
+    def __init__(self, name: str, interval_s: float, func: Callable[[], Any], runner: Callable = None):
+        self.name = name
+        self.interval_s = interval_s
+        self.func = func
+        self.runner = runner or run_blocking_io
+        self.runs = 0
+        self.last_result: Any = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run(), name=f"periodic-{self.name}")
+        logger.info(f"Periodic job '{self.name}' started (every {self.interval_s:.0f} s).")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                self.last_result = await self.runner(self.func)
+                self.runs += 1
+            except Exception as e:
+                logger.error(f"Periodic job '{self.name}' failed: {e}", exc_info=True)
+
+
+class EventLoopLagMonitor:
+    """
+    Debug aid that detects anything blocking the event loop.
+
+    A heartbeat task sleeps for `interval_s` and measures how late it wakes up;
+    lateness above `threshold_s` means some callback held the loop. asyncio's
+    own debug mode is enabled too, so the offending callback is also logged
+    by name once it exceeds the same threshold.
+    """
+
+    def __init__(self, threshold_s: float, interval_s: float = 0.25):
+        self.threshold_s = threshold_s
+        self.interval_s = interval_s
+        self.max_lag_s = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.threshold_s
+        self._task = loop.create_task(self._run(), name="event-loop-lag-monitor")
+        logger.info(f"Event loop lag monitor started (threshold {self.threshold_s * 1000:.0f} ms).")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected_wakeup = time.perf_counter() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            lag_s = time.perf_counter() - expected_wakeup
+            self.max_lag_s = max(self.max_lag_s, lag_s)
+            if lag_s > self.threshold_s:
+                logger.warning(f"Event loop blocked for {lag_s * 1000:.0f} ms (threshold {self.threshold_s * 1000:.0f} ms).")
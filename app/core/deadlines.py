@@ -0,0 +1,47 @@
+# logistics_ai_project/app/core/deadlines.py
+import logging
+from datetime import date, datetime, time
+from typing import Any, Callable, Dict, Optional
+
+from app.config import settings
+from app.core.geo import haversine_km
+
+logger = logging.getLogger(__name__)
+
+
+def parse_due_date(value: Any) -> Optional[date]:
+    """'2025-06-10' or '2025-06-10 00:00:00' (Excel uploads) -> date; anything else -> None."""
+    try:
+        return date.fromisoformat(str(value)[:10]) if value else None
+    except ValueError:
+        return None
+
+
+def delivery_deadline(load: Dict[str, Any]) -> Optional[datetime]:
+    """End of the load's expected delivery day (server local time), or None if it has no usable date."""
+    due = parse_due_date(load.get("expected_delivery_date"))
+    return datetime.combine(due, time.max) if due is not None else None
+
+
+def min_hours_to_deliver(
+    truck_lat: float,
+    truck_lng: float,
+    pickup_address: str,
+    drop_address: str,
+    locate: Callable[[str], Optional[Dict[str, Any]]],
+) -> Optional[float]:
+    """
+    Lower bound on the driving hours from the truck's position via the pickup to
+    the drop: great-circle distances at MAX_TRUCK_SPEED_KMH. Roads are never
+    shorter and trucks never faster, so a load whose bound exceeds the time left
+    cannot be delivered on time. `locate` must not call upstream APIs (it is
+    cached_coordinates): the bound is only worth having if it is cheap.
+    Returns None when either address is not known yet, i.e. nothing is proven.
+    """
+    pickup = locate(pickup_address)
+    drop = locate(drop_address) if pickup is not None else None
+    if not pickup or not drop or not pickup.get("status") or not drop.get("status"):
+        return None
+    km = (haversine_km(truck_lat, truck_lng, pickup["latitude"], pickup["longitude"])
+          + haversine_km(pickup["latitude"], pickup["longitude"], drop["latitude"], drop["longitude"]))
+    return km / settings.MAX_TRUCK_SPEED_KMH
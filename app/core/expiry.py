@@ -0,0 +1,111 @@
+# logistics_ai_project/app/core/expiry.py
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.config import settings
+from app.core.deadlines import parse_due_date
+from app.core.load_index import normalize_status, unavailable_statuses
+from app.core.metrics import LOADS_REMOVED
+from app.data.archive import load_archive
+from app.data.changes import change_source
+from app.data.data_loader import remove_loads
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveUnavailable(RuntimeError):
+    pass
+
+
+def _archiver(reason_of: Callable[[Dict[str, Any]], str]) -> Callable[[List[Dict[str, Any]]], None]:
+    """before_save hook for remove_loads: archives the removed loads grouped by reason, or aborts the removal."""
+    def archive(removed: List[Dict[str, Any]]):
+        if load_archive is None:
+            raise ArchiveUnavailable("The load archive is not available; nothing was removed.")
+        by_reason: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for load in removed:
+            by_reason[reason_of(load)].append(load)
+        for reason, loads in by_reason.items():
+            load_archive.add(loads, reason)
+    return archive
+
+
+def sweep_stale_loads() -> Dict[str, int]:
+    """
+    Takes stale loads off the board in one store write: loads due more than
+    LOAD_EXPIRY_GRACE_DAYS ago ('expired') and loads in an UNAVAILABLE_LOAD_STATUSES
+    status ('closed'). They are archived first unless LOAD_SWEEP_ARCHIVE is off.
+    Blocking (file and SQLite I/O); run it in the I/O executor.
+    """
+    cutoff = date.today() - timedelta(days=settings.LOAD_EXPIRY_GRACE_DAYS)
+    closed = unavailable_statuses()
+    reasons: Dict[int, str] = {}
+
+    def stale(load: Dict[str, Any]) -> bool:
+        due = parse_due_date(load.get("expected_delivery_date"))
+        if due is not None and due < cutoff:
+            reasons[id(load)] = "expired"
+        elif normalize_status(load.get("status")) in closed:
+            reasons[id(load)] = "closed"
+        return id(load) in reasons
+
+    archive = _archiver(lambda load: reasons[id(load)]) if settings.LOAD_SWEEP_ARCHIVE else None
+    try:
+        with change_source("expiry"):
+            removed = remove_loads(stale, before_save=archive)
+    except ArchiveUnavailable as e:
+        logger.error(f"Load sweep skipped: {e}")
+        return {"expired": 0, "closed": 0}
+
+    report = {"expired": 0, "closed": 0}
+    for load in removed:
+        report[reasons[id(load)]] += 1
+    for reason, count in report.items():
+        if count:
+            LOADS_REMOVED.labels(reason).inc(count)
+    if removed:
+        logger.info(f"Load sweep removed {len(removed)} stale loads ({report}, archived: {archive is not None}).")
+    return report
+
+
+def bulk_delete_loads(
+    load_ids: Optional[Iterable[str]] = None,
+    statuses: Optional[Iterable[str]] = None,
+    due_before: Optional[date] = None,
+    archive: bool = True,
+) -> Dict[str, Any]:
+    """
+    Deletes every load matching all given criteria (ID list, statuses, due date
+    before `due_before`) in one store write, archiving them first unless `archive`
+    is False. At least one criterion is required. Raises ArchiveUnavailable if
+    archiving was requested but the archive cannot be opened.
+    Blocking; run it in the I/O executor.
+    """
+    wanted_ids = {str(load_id) for load_id in load_ids} if load_ids is not None else None
+    wanted_statuses = {normalize_status(status) for status in statuses} if statuses is not None else None
+    if wanted_ids is None and wanted_statuses is None and due_before is None:
+        raise ValueError("Give load_ids, status or due_before; refusing to delete every load.")
+
+    def matches(load: Dict[str, Any]) -> bool:
+        if wanted_ids is not None and str(load.get("load_id")) not in wanted_ids:
+            return False
+        if wanted_statuses is not None and normalize_status(load.get("status")) not in wanted_statuses:
+            return False
+        if due_before is not None:
+            due = parse_due_date(load.get("expected_delivery_date"))
+            if due is None or due >= due_before:
+                return False
+        return True
+
+    with change_source("bulk_delete"):
+        removed = remove_loads(matches, before_save=_archiver(lambda load: "bulk_delete") if archive else None)
+    if removed:
+        LOADS_REMOVED.labels("bulk_delete").inc(len(removed))
+    removed_ids = [load.get("load_id") for load in removed]
+    result: Dict[str, Any] = {"deleted": len(removed), "archived": archive and bool(removed), "load_ids": removed_ids}
+    if wanted_ids is not None:
+        found = {str(load_id) for load_id in removed_ids}
+        result["not_found"] = sorted(wanted_ids - found)
+    return result
@@ -0,0 +1,231 @@
+# logistics_ai_project/app/core/lanes.py
+import csv
+import io
+import logging
+import math
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings, store_path
+from app.core.cache import WALConnections
+from app.core.metrics import CACHE_REQUESTS
+from app.core.places import normalize_address, place_key
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ["origin", "destination", "distance_m", "duration_s", "refreshed_at", "source"]
+
+_COORDINATE_PAIR = re.compile(r"^\s*-?\d+(\.\d+)?\s*,\s*-?\d+(\.\d+)?\s*$")
+
+
+def is_coordinate_pair(value: str) -> bool:
+    """True for 'lat,lng' strings (truck positions), which are never lanes."""
+    return bool(_COORDINATE_PAIR.match(value or ""))
+
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+class LaneTable:
+    """
+    Persistent city-to-city distances (origin key, destination key -> distance,
+    duration, last refresh), stored in SQLite so every worker shares it and it
+    survives restarts. Lanes are directional. Cities are keyed by place_key(): the
+    canonical place ID once the city has been geocoded, else its normalised text.
+    SQLite errors are logged and treated as misses so routing falls back to the
+    upstream API.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connections = WALConnections(path)
+        self._hits = CACHE_REQUESTS.labels("lanes", "hit")
+        self._misses = CACHE_REQUESTS.labels("lanes", "miss")
+        self._connections.get().execute(
+            "CREATE TABLE IF NOT EXISTS lanes ("
+            " origin TEXT NOT NULL, destination TEXT NOT NULL,"
+            " distance_m INTEGER NOT NULL, duration_s INTEGER NOT NULL,"
+            " refreshed_at REAL NOT NULL, source TEXT NOT NULL DEFAULT 'google',"
+            " claimed_at REAL,"
+            " PRIMARY KEY (origin, destination)) WITHOUT ROWID"
+        )
+
+    def lookup(self, origin: str, destination: str) -> Optional[Dict[str, Any]]:
+        """Returns a Distance Matrix-style element for the lane, or None if it is unknown."""
+        keys = [(place_key(origin), place_key(destination))]
+        text_keys = (normalize_address(origin), normalize_address(destination))
+        if text_keys != keys[0]:
+            keys.append(text_keys)  # lanes recorded before either city had a place ID
+        row = None
+        try:
+            for origin_key, destination_key in keys:
+                row = self._connections.get().execute(
+                    "SELECT distance_m, duration_s FROM lanes WHERE origin = ? AND destination = ?",
+                    (origin_key, destination_key),
+                ).fetchone()
+                if row is not None:
+                    break
+        except sqlite3.Error as e:
+            logger.warning(f"Lane table lookup failed: {e}")
+            row = None
+        if row is None:
+            self._misses.inc()
+            return None
+        self._hits.inc()
+        return {"distance": {"value": row[0]}, "duration": {"value": row[1]}, "status": "OK"}
+
+    def record(self, origin: str, destination: str, distance_m: int, duration_s: int,
+               source: str = "google", refreshed_at: Optional[float] = None):
+        """Inserts or replaces a lane (and releases any refresh claim on it)."""
+        try:
+            self._connections.get().execute(
+                "INSERT OR REPLACE INTO lanes (origin, destination, distance_m, duration_s, refreshed_at, source, claimed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                (place_key(origin), place_key(destination), int(distance_m), int(duration_s),
+                 refreshed_at if refreshed_at is not None else time.time(), source),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Lane table write failed for {origin} -> {destination}: {e}")
+
+    def claim_stale(self, max_age_s: float, limit: int, claim_ttl_s: float = 600.0) -> List[Tuple[str, str]]:
+        """
+        Atomically marks up to `limit` of the oldest lanes not refreshed within
+        `max_age_s` as being refreshed and returns them, so several workers
+        running the refresh job never fetch the same lane twice.
+        """
+        now = time.time()
+        conn = self._connections.get()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT origin, destination FROM lanes"
+                    " WHERE refreshed_at < ? AND (claimed_at IS NULL OR claimed_at < ?)"
+                    " ORDER BY refreshed_at LIMIT ?",
+                    (now - max_age_s, now - claim_ttl_s, limit),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE lanes SET claimed_at = ? WHERE origin = ? AND destination = ?",
+                    [(now, origin, destination) for origin, destination in rows],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Could not claim stale lanes: {e}")
+            return []
+        return [(origin, destination) for origin, destination in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        cutoff = time.time() - settings.LANE_REFRESH_AGE_S
+        total, stale = self._connections.get().execute(
+            "SELECT COUNT(*), COALESCE(SUM(refreshed_at < ?), 0) FROM lanes", (cutoff,)
+        ).fetchone()
+        return {"lanes": total, "stale": stale, "path": self.path}
+
+    def snapshot(self) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        """Every lane as (origin key, destination key) -> (distance_m, duration_s), for offline tools."""
+        rows = self._connections.get().execute("SELECT origin, destination, distance_m, duration_s FROM lanes")
+        return {(origin, destination): (distance_m, duration_s) for origin, destination, distance_m, duration_s in rows}
+
+    def export_csv(self) -> str:
+        """All lanes in the bulk import/export CSV format (CSV_COLUMNS, refreshed_at in UTC ISO-8601)."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        rows = self._connections.get().execute(
+            "SELECT origin, destination, distance_m, duration_s, refreshed_at, source FROM lanes ORDER BY origin, destination"
+        )
+        for origin, destination, distance_m, duration_s, refreshed_at, source in rows:
+            refreshed_iso = datetime.fromtimestamp(refreshed_at, tz=timezone.utc).isoformat()
+            writer.writerow([origin, destination, distance_m, duration_s, refreshed_iso, source])
+        return buffer.getvalue()
+
+    def import_rows(self, rows: Iterable[Dict[str, Any]], source: str = "import") -> Dict[str, Any]:
+        """
+        Bulk-loads lanes, e.g. from historical trips. Each row needs origin,
+        destination, distance (distance_m or distance_km) and duration
+        (duration_s or duration_min); refreshed_at is optional (ISO-8601 or epoch
+        seconds, default now). A row never overwrites a lane refreshed more recently.
+        """
+        imported, skipped, errors = 0, 0, []
+        batch = []
+        for line_number, row in enumerate(rows, start=2):  # line 1 is the CSV header
+            try:
+                origin, destination = str(row["origin"]).strip(), str(row["destination"]).strip()
+                if not origin or not destination:
+                    raise ValueError("origin and destination are required")
+                if row.get("distance_m") not in (None, ""):
+                    distance_m = float(row["distance_m"])
+                else:
+                    distance_m = float(row["distance_km"]) * 1000
+                if row.get("duration_s") not in (None, ""):
+                    duration_s = float(row["duration_s"])
+                else:
+                    duration_s = float(row["duration_min"]) * 60
+                if not math.isfinite(distance_m) or not math.isfinite(duration_s):
+                    raise ValueError("distance and duration must be finite numbers")
+                if distance_m <= 0 or duration_s <= 0:
+                    raise ValueError("distance and duration must be positive")
+                refreshed_at = _parse_timestamp(row.get("refreshed_at"))
+                if refreshed_at is not None and not math.isfinite(refreshed_at):
+                    raise ValueError("refreshed_at must be a finite timestamp")
+                values = (place_key(origin), place_key(destination), int(distance_m), int(duration_s),
+                          refreshed_at or time.time(), row.get("source") or source)
+            except (KeyError, TypeError, ValueError, OverflowError) as e:
+                errors.append({"row": line_number, "error": f"{type(e).__name__}: {e}"})
+                continue
+            batch.append(values)
+
+        conn = self._connections.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for values in batch:
+                cursor = conn.execute(
+                    "INSERT INTO lanes (origin, destination, distance_m, duration_s, refreshed_at, source)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (origin, destination) DO UPDATE SET"
+                    " distance_m = excluded.distance_m, duration_s = excluded.duration_s,"
+                    " refreshed_at = excluded.refreshed_at, source = excluded.source, claimed_at = NULL"
+                    " WHERE excluded.refreshed_at >= lanes.refreshed_at",
+                    values,
+                )
+                if cursor.rowcount:
+                    imported += 1
+                else:
+                    skipped += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"imported": imported, "skipped_older": skipped, "errors": errors}
+
+    def import_csv(self, text: str) -> Dict[str, Any]:
+        return self.import_rows(csv.DictReader(io.StringIO(text)))
+
+
+def _open_lane_table() -> Optional[LaneTable]:
+    if not settings.LANE_TABLE_ENABLED:
+        return None
+    path = store_path(settings.LANES_DB_PATH, "lanes.sqlite3")
+    try:
+        return LaneTable(path)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Could not open lane table at {path} ({e}). Lane lookups are disabled.")
+        return None
+
+
+lane_table = _open_lane_table()
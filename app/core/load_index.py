@@ -0,0 +1,266 @@
+# logistics_ai_project/app/core/load_index.py
+import logging
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import date
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.core.deadlines import parse_due_date
+from app.data.data_loader import loads_file_signature, read_loads, register_loads_listener
+from app.data.snapshot import BoardSnapshot, board_snapshots, current_board
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_status(value: Any) -> str:
+    return " ".join(str(value or "").lower().split())
+
+
+def unavailable_statuses() -> Set[str]:
+    return {normalize_status(status) for status in settings.UNAVAILABLE_LOAD_STATUSES.split(",") if status.strip()}
+
+
+class LoadFilterIndex:
+    """
+    Secondary indexes over the load store for candidate filtering:
+
+    - weight: (weight_tons, key) pairs kept sorted, so "weight <= capacity" is a bisect
+    - status: one bucket of keys per normalised status
+    - delivery date: (date ordinal, key) pairs kept sorted, so "due on or after" is a bisect
+
+    Loads without a numeric weight or a parseable date sit in side sets and always
+    pass those predicates, matching score_loads, which does not reject them either.
+    `query()` walks the smallest of the matching ranges/buckets and checks the other
+    predicates per load, so it costs O(log n + k) for k loads in that range.
+    Updated incrementally like LoadSearchIndex: `sync()` only re-indexes loads that
+    were added, changed or removed.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._order: Dict[str, int] = {}  # key -> position in the store
+        self._by_weight: List[Tuple[float, str]] = []
+        self._unknown_weight: Set[str] = set()
+        self._by_status: Dict[str, Set[str]] = defaultdict(set)
+        self._by_due: List[Tuple[int, str]] = []
+        self._unknown_due: Set[str] = set()
+        self._attributes: Dict[str, Tuple[Optional[float], str, Optional[int]]] = {}  # key -> (weight, status, due ordinal)
+        self._source_signature: Optional[Tuple[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _attributes_of(load: Dict[str, Any]) -> Tuple[Optional[float], str, Optional[int]]:
+        weight = load.get("weight_tons")
+        weight = float(weight) if isinstance(weight, (int, float)) and not isinstance(weight, bool) else None
+        due = parse_due_date(load.get("expected_delivery_date"))
+        return weight, normalize_status(load.get("status")), due.toordinal() if due is not None else None
+
+    @staticmethod
+    def _remove_sorted(entries: List[Tuple[Any, str]], entry: Tuple[Any, str]):
+        position = bisect_left(entries, entry)
+        if position < len(entries) and entries[position] == entry:
+            del entries[position]
+
+    def _remove(self, key: str):
+        attributes = self._attributes.pop(key, None)
+        if attributes is None:
+            return
+        weight, status, due = attributes
+        if weight is None:
+            self._unknown_weight.discard(key)
+        else:
+            self._remove_sorted(self._by_weight, (weight, key))
+        bucket = self._by_status.get(status)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._by_status[status]
+        if due is None:
+            self._unknown_due.discard(key)
+        else:
+            self._remove_sorted(self._by_due, (due, key))
+        self._docs.pop(key, None)
+        self._order.pop(key, None)
+
+    def _add(self, key: str, load: Dict[str, Any]):
+        weight, status, due = attributes = self._attributes_of(load)
+        if weight is None:
+            self._unknown_weight.add(key)
+        else:
+            insort(self._by_weight, (weight, key))
+        self._by_status[status].add(key)
+        if due is None:
+            self._unknown_due.add(key)
+        else:
+            insort(self._by_due, (due, key))
+        self._attributes[key] = attributes
+        self._docs[key] = dict(load)
+
+    def sync(self, loads: Iterable[Dict[str, Any]], source_signature: Optional[Tuple[int, int]] = None):
+        """Brings the indexes in line with `loads`, touching only added, changed or removed loads."""
+        with self._lock:
+            seen: Set[str] = set()
+            occurrences: Dict[str, int] = defaultdict(int)
+            for position, load in enumerate(loads):
+                if not isinstance(load, dict):
+                    continue
+                # Duplicate or missing load_ids still need their own entry: score_loads scores every row
+                load_id = load.get("load_id")
+                base = str(load_id) if load_id else f"@{position}"
+                occurrences[base] += 1
+                key = base if occurrences[base] == 1 else f"{base}#{occurrences[base]}"
+                seen.add(key)
+                self._order[key] = position
+                if self._docs.get(key) != load:
+                    self._remove(key)
+                    self._add(key, load)
+                    self._order[key] = position
+            for stale_key in [key for key in self._docs if key not in seen]:
+                self._remove(stale_key)
+            self._source_signature = source_signature
+
+    def refresh_if_stale(self, current_signature: Optional[Tuple[int, int]], loader: Callable[[], Optional[List[Dict[str, Any]]]]):
+        """
+        Re-syncs from `loader` only when the backing store's signature changed (e.g. another
+        worker wrote it). Keeps the current entries when `loader` returns None (unreadable store).
+        """
+        if current_signature is not None and current_signature == self._source_signature:
+            return
+        loads = loader()
+        if loads is not None:
+            self.sync(loads, current_signature)
+
+    def query(
+        self,
+        max_weight: Optional[float] = None,
+        statuses: Optional[Iterable[str]] = None,
+        exclude_statuses: Optional[Iterable[str]] = None,
+        due_on_or_after: Optional[date] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Loads matching every given predicate, in store order. Statuses are compared
+        normalised (case and whitespace insensitive). The returned dicts are the
+        index's own copies: treat them as read-only.
+        """
+        with self._lock:
+            allowed_statuses = None
+            if statuses is not None or exclude_statuses is not None:
+                allowed_statuses = {normalize_status(status) for status in statuses} if statuses is not None else set(self._by_status)
+                allowed_statuses -= {normalize_status(status) for status in exclude_statuses or ()}
+
+            # Each predicate names a candidate range; only the smallest one is walked
+            ranges: List[Tuple[int, Callable[[], Iterable[str]]]] = [(len(self._docs), lambda: self._docs.keys())]
+            if max_weight is not None:
+                end = bisect_right(self._by_weight, (max_weight, "\uffff"))
+                ranges.append((end + len(self._unknown_weight),
+                               lambda: [key for _, key in self._by_weight[:end]] + list(self._unknown_weight)))
+            if allowed_statuses is not None:
+                buckets = [self._by_status[status] for status in allowed_statuses if status in self._by_status]
+                ranges.append((sum(len(bucket) for bucket in buckets),
+                               lambda: [key for bucket in buckets for key in bucket]))
+            if due_on_or_after is not None:
+                start = bisect_left(self._by_due, (due_on_or_after.toordinal(), ""))
+                ranges.append((len(self._by_due) - start + len(self._unknown_due),
+                               lambda: [key for _, key in self._by_due[start:]] + list(self._unknown_due)))
+            _, smallest = min(ranges, key=lambda entry: entry[0])
+
+            matches = []
+            minimum_due = due_on_or_after.toordinal() if due_on_or_after is not None else None
+            for key in smallest():
+                weight, status, due = self._attributes[key]
+                if max_weight is not None and weight is not None and weight > max_weight:
+                    continue
+                if allowed_statuses is not None and status not in allowed_statuses:
+                    continue
+                if minimum_due is not None and due is not None and due < minimum_due:
+                    continue
+                matches.append(key)
+            matches.sort(key=self._order.__getitem__)
+            return [self._docs[key] for key in matches]
+
+    def status_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {status: len(bucket) for status, bucket in self._by_status.items()}
+
+
+load_filter_index = LoadFilterIndex()
+
+
+def _on_loads_saved(loads: List[Dict[str, Any]]):
+    load_filter_index.sync(loads, loads_file_signature())
+
+
+# With board snapshots on, candidates come from the shared snapshot and the index stays
+# empty; it is only filled (lazily, by candidate_loads) if no snapshot can be published
+if board_snapshots is None:
+    register_loads_listener(_on_loads_saved)
+
+
+def snapshot_candidates(
+    snapshot: BoardSnapshot,
+    max_weight: Optional[float] = None,
+    exclude_statuses: Optional[Iterable[str]] = None,
+    due_on_or_after: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """
+    LoadFilterIndex.query() over a board snapshot's columns: bisects the mapped
+    sorted weight and due-date columns, walks the smaller matching range (plus the
+    loads whose value is unknown, which pass), checks the other predicates per
+    load and decodes only the loads that match, in store order. O(log n + k).
+    """
+    excluded = {normalize_status(status) for status in exclude_statuses or ()}
+    allowed = [normalize_status(status) not in excluded for status in snapshot.strings("statuses")]
+    maximum_weight = max_weight if max_weight is not None else math.inf
+    minimum_due = due_on_or_after.toordinal() if due_on_or_after is not None else 0
+    weights, dues, status_codes = snapshot.column("weight_tons"), snapshot.column("due_ordinal"), snapshot.column("status_code")
+
+    # Each predicate names a candidate range; only the smallest one is walked
+    ranges: List[Tuple[int, Callable[[], Iterable[int]]]] = [(len(snapshot), lambda: range(len(snapshot)))]
+    if max_weight is not None:
+        end = bisect_right(snapshot.column("weight_sorted"), max_weight)
+        unknown_weight = snapshot.column("weight_unknown")
+        ranges.append((end + len(unknown_weight), lambda: chain(snapshot.column("weight_order")[:end], unknown_weight)))
+    if due_on_or_after is not None:
+        due_sorted = snapshot.column("due_sorted")
+        start = bisect_left(due_sorted, minimum_due)
+        unknown_due = snapshot.column("due_unknown")
+        ranges.append((len(due_sorted) - start + len(unknown_due), lambda: chain(snapshot.column("due_order")[start:], unknown_due)))
+    count, smallest = min(ranges, key=lambda entry: entry[0])
+    if count * 2 > len(snapshot):
+        # Most of the board: a scan in store order beats random access plus a sort
+        smallest = ranges[0][1]
+
+    matches = sorted(
+        index
+        for index in smallest()
+        # NaN weights compare false and unknown dates are stored as 0, so both pass
+        if allowed[status_codes[index]] and not weights[index] > maximum_weight and not 0 < dues[index] < minimum_due
+    )
+    return snapshot.loads(matches)
+
+
+def candidate_loads(max_weight: Optional[float]) -> List[Dict[str, Any]]:
+    """
+    The loads worth scoring for a truck of `max_weight` tons: not in an
+    UNAVAILABLE_LOAD_STATUSES status, light enough, and (with deadline pruning on)
+    not due before today. Re-syncs from the store only when the file changed.
+    Reads the memory-mapped board snapshot when snapshots are on, else the
+    in-process index. Blocking (may read the store); run it in the I/O executor.
+    """
+    due_on_or_after = date.today() if settings.DEADLINE_PRUNING_ENABLED else None
+    snapshot = current_board()
+    if snapshot is not None:
+        return snapshot_candidates(snapshot, max_weight, unavailable_statuses(), due_on_or_after)
+    load_filter_index.refresh_if_stale(loads_file_signature(), read_loads)
+    return load_filter_index.query(
+        max_weight=max_weight,
+        exclude_statuses=unavailable_statuses(),
+        due_on_or_after=due_on_or_after,
+    )
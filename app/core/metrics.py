@@ -0,0 +1,356 @@
+# logistics_ai_project/app/core/metrics.py
+# Minimal Prometheus-compatible metrics, cheap enough to leave on in production.
+# Samples are never stored: a histogram observation is one bisect plus a few
+# increments on preallocated slots, and a counter update is one increment.
+# `x += n` is a read-modify-write the GIL does not make atomic, so each child
+# guards its updates with its own uncontended lock; the family lock is only
+# taken the first time a new label combination is seen.
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond local work up to slow upstream calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000, 50000, 100000)
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "bucket_counts", "sum", "count", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.bucket_counts = [0] * (len(upper_bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.bucket_counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """Bucket counts, sum and count read together, so a scrape never sees a torn observation."""
+        with self._lock:
+            return list(self.bucket_counts), self.sum, self.count
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    """Context manager observing the elapsed wall time of its block into a histogram child."""
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _MetricFamily:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_MetricFamily):
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_number(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_MetricFamily):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for values, child in list(self._children.items()):
+            bucket_counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{_format_number(float(bound))}"'
+                samples.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_number(total)}")
+            samples.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {count}")
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._families: List[_MetricFamily] = []
+
+    def register(self, family: _MetricFamily):
+        self._families.append(family)
+
+    def render(self) -> str:
+        return "\n".join(family.render() for family in self._families) + "\n"
+
+    def get(self, name: str) -> Optional[_MetricFamily]:
+        return next((family for family in self._families if family.name == name), None)
+
+
+REGISTRY = Registry()
+
+
+# --- Application metrics ---
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template, method and status code.",
+    ("endpoint", "method", "status"),
+)
+PHASE_DURATION = Histogram(
+    "phase_duration_seconds", "Time spent per processing phase (geocode, route_leg, scoring, sort, llm).",
+    ("phase",),
+)
+# Google APIs answer HTTP 200 with an error status in the body: those count as api_error
+# (OVER_QUERY_LIMIT, REQUEST_DENIED, ...) or no_result (ZERO_RESULTS, NOT_FOUND), never ok
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests_total", "Calls to external services by service and outcome (ok, error, api_error, no_result, timeout, rejected, mock).",
+    ("service", "outcome"),
+)
+LOADS_SCORED = Histogram(
+    "loads_scored_per_request", "Number of candidate loads evaluated by one score_loads call.",
+    buckets=COUNT_BUCKETS,
+)
+LOADS_PRUNED = Counter(
+    "loads_pruned_total", "Loads dropped by score_loads as undeliverable by their date, by stage (past_due, lower_bound, exact).",
+    ("stage",),
+)
+LOADS_REMOVED = Counter(
+    "loads_removed_total", "Loads taken off the board by the sweeper or bulk delete, by reason (expired, closed, bulk_delete).",
+    ("reason",),
+)
+SCORING_BUDGET_EXHAUSTED = Counter(
+    "scoring_budget_exhausted_total", "Scoring passes stopped early with a partial ranking, by the limit reached (calls, time).",
+    ("limit",),
+)
+LLM_SUMMARY_BATCH_SIZE = Histogram(
+    "llm_summary_batch_size", "Summary requests sent upstream together in one micro-batched prompt.",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+LLM_SUMMARY_BATCHES = Counter(
+    "llm_summary_batches_total", "Multi-truck summary prompts by outcome (ok, partial, unparsed, failed).",
+    ("outcome",),
+)
+LOAD_CHANGES = Counter(
+    "load_changes_total", "Load store changes recorded in the change feed, by op (add, update, delete) and source.",
+    ("op", "source"),
+)
+BOARD_SNAPSHOT_PUBLISHES = Counter(
+    "board_snapshot_publishes_total", "Columnar board snapshots written, by reason (save, stale).",
+    ("reason",),
+)
+BOARD_SNAPSHOT_MAPPED_BYTES = Gauge(
+    "board_snapshot_mapped_bytes", "Size of the board snapshot file this worker currently has memory-mapped.",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by cache name and result (hit, miss).",
+    ("cache", "result"),
+)
+STORE_IO_DURATION = Histogram(
+    "store_io_duration_seconds", "JSON store read/write latency by file and operation.",
+    ("store", "operation"),
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight_requests", "Requests currently holding an admission slot, by gate.",
+    ("gate",),
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot, by gate.",
+    ("gate",),
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total", "Requests refused with 503 by admission control, by gate and reason (queue_full, shed, timeout).",
+    ("gate", "reason"),
+)
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds", "Time admitted requests spent queued for a slot, by gate.",
+    ("gate",),
+)
+SUBSCRIPTIONS_ACTIVE = Gauge(
+    "load_subscriptions_active", "Open load-match subscriptions (SSE and WebSocket) on this worker.",
+)
+SUBSCRIPTION_EVENTS = Counter(
+    "load_subscription_events_total", "Load-match notifications by outcome (sent, dropped, prefiltered, below_threshold, over_budget).",
+    ("outcome",),
+)
+
+
+PROCESS_RESIDENT_MEMORY = Gauge(
+    "process_resident_memory_bytes", "Resident set size of this worker process.",
+)
+STARTUP_IMPORT_SECONDS = Gauge(
+    "startup_import_seconds", "Time taken to import the application module tree at worker start.",
+)
+STARTUP_WARMUP_SECONDS = Gauge(
+    "startup_warmup_seconds", "Time taken by the optional startup warm-up phase.",
+)
+
+
+def update_process_metrics():
+    """Refreshes process-level gauges; called at scrape time so it costs nothing between scrapes."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        PROCESS_RESIDENT_MEMORY.set(resident_pages * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource  # Unix only; reports peak RSS (KiB on Linux, bytes on macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            PROCESS_RESIDENT_MEMORY.set(peak if sys.platform == "darwin" else peak * 1024)
+        except ImportError:
+            pass
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request latency per route template
+    (e.g. /api/v1/delete-load/loads/{load_id}) so path parameters do not
+    explode label cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route_template(scope) -> str:
+        route_path = getattr(scope.get("route"), "path", None)
+        if not route_path:
+            return "unmatched"
+        # Depending on the FastAPI version the matched route may or may not carry the
+        # include_router prefix. Prefixes are static, so take the leading segments of
+        # the request path that the route template does not cover.
+        path_segments = [segment for segment in scope["path"].split("/") if segment]
+        route_segment_count = len([segment for segment in route_path.split("/") if segment])
+        prefix_segments = path_segments[:max(0, len(path_segments) - route_segment_count)]
+        return "".join(f"/{segment}" for segment in prefix_segments) + route_path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.labels(self._route_template(scope), scope["method"], str(status_holder["status"])).observe(
+                time.perf_counter() - start
+            )
@@ -0,0 +1,227 @@
+# logistics_ai_project/app/core/places.py
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional
+
+from app.config import settings, store_path
+from app.core.cache import WALConnections
+from app.core.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s,]")
+PLACE_ID_PREFIXES = ("gp:", "ll:")
+
+
+def normalize_address(address: Any) -> str:
+    """
+    Text-level canonical form of a free-text address: Unicode-normalised, lower
+    case, punctuation other than commas dropped, whitespace collapsed and comma
+    parts joined with ', '. 'Mumbai,India', ' mumbai ,  INDIA.' -> 'mumbai, india'.
+    """
+    text = unicodedata.normalize("NFKC", str(address or "")).lower()
+    text = _PUNCTUATION.sub(" ", text)
+    parts = (" ".join(part.split()) for part in text.split(","))
+    return ", ".join(part for part in parts if part)
+
+
+class Place(NamedTuple):
+    place_id: str  # "gp:<Google place_id>", or "ll:<lat>,<lng>" when the geocoder gave none
+    formatted_address: str
+    latitude: float
+    longitude: float
+
+    def as_coordinates(self) -> Dict[str, Any]:
+        """The get_coordinates() result shape."""
+        return {
+            "status": True,
+            "message": "Location coordinates fetched successfully",
+            "location": self.formatted_address,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "place_id": self.place_id,
+        }
+
+
+def canonical_place_id(google_place_id: Optional[str], latitude: float, longitude: float) -> str:
+    """Google's place ID when the geocoder returned one, else the position rounded to ~10 m."""
+    if google_place_id:
+        return f"gp:{google_place_id}"
+    return f"ll:{latitude:.4f},{longitude:.4f}"
+
+
+def place_query(key: str) -> str:
+    """Turns a place key back into something the Distance Matrix API accepts as an origin/destination."""
+    if key.startswith("gp:"):
+        return f"place_id:{key[3:]}"
+    if key.startswith("ll:"):
+        return key[3:]
+    return key
+
+
+class PlaceRegistry:
+    """
+    Learned alias table: normalised address text -> canonical place. An alias is
+    learned the first time a variant is geocoded, after which every spelling of
+    the same place ('mumbai', 'Mumbai, India', 'Mumbai,India') resolves to one
+    place ID without another geocode. Stored in SQLite so all workers share it
+    and it survives restarts; each process keeps the aliases it has seen in memory.
+    SQLite errors are logged and treated as unknown aliases.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connections = WALConnections(path)
+        self._aliases: Dict[str, Place] = {}
+        self._lock = threading.Lock()
+        self._hits = CACHE_REQUESTS.labels("place_aliases", "hit")
+        self._misses = CACHE_REQUESTS.labels("place_aliases", "miss")
+        conn = self._connections.get()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS places ("
+            " place_id TEXT PRIMARY KEY, formatted_address TEXT NOT NULL,"
+            " latitude REAL NOT NULL, longitude REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS place_aliases ("
+            " alias TEXT PRIMARY KEY, place_id TEXT NOT NULL, learned_at REAL NOT NULL)"
+        )
+
+    def lookup(self, address: str) -> Optional[Place]:
+        alias = normalize_address(address)
+        if not alias:
+            return None
+        place = self._aliases.get(alias)
+        if place is not None:
+            self._hits.inc()
+            return place
+        try:
+            row = self._connections.get().execute(
+                "SELECT p.place_id, p.formatted_address, p.latitude, p.longitude"
+                " FROM place_aliases a JOIN places p ON p.place_id = a.place_id WHERE a.alias = ?",
+                (alias,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Place alias lookup failed: {e}")
+            row = None
+        if row is None:
+            self._misses.inc()
+            return None
+        place = Place(*row)
+        with self._lock:
+            self._aliases[alias] = place
+        self._hits.inc()
+        return place
+
+    def learn(self, address: str, geocode_result: Dict[str, Any]) -> Optional[Place]:
+        """Records `address` as an alias of the place in a successful get_coordinates() result."""
+        alias = normalize_address(address)
+        if not alias or not geocode_result.get("status"):
+            return None
+        place = Place(
+            geocode_result.get("place_id") or canonical_place_id(None, geocode_result["latitude"], geocode_result["longitude"]),
+            geocode_result.get("location") or address,
+            geocode_result["latitude"],
+            geocode_result["longitude"],
+        )
+        now = time.time()
+        try:
+            conn = self._connections.get()
+            conn.execute(
+                "INSERT OR REPLACE INTO places (place_id, formatted_address, latitude, longitude, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (place.place_id, place.formatted_address, place.latitude, place.longitude, now),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO place_aliases (alias, place_id, learned_at) VALUES (?, ?, ?)",
+                (alias, place.place_id, now),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record place alias '{alias}': {e}")
+        with self._lock:
+            self._aliases[alias] = place
+        return place
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connections.get()
+        places = conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+        aliases = conn.execute("SELECT COUNT(*) FROM place_aliases").fetchone()[0]
+        return {"places": places, "aliases": aliases, "aliases_in_memory": len(self._aliases), "path": self.path}
+
+
+def _open_place_registry() -> Optional[PlaceRegistry]:
+    if not settings.PLACE_ALIASES_ENABLED:
+        return None
+    path = store_path(settings.PLACES_DB_PATH, "places.sqlite3")
+    try:
+        return PlaceRegistry(path)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Could not open the place alias table at {path} ({e}). Addresses are keyed by normalised text only.")
+        return None
+
+
+place_registry = _open_place_registry()
+
+
+def place_key(address: str) -> str:
+    """
+    The key caches and lane tables use for an address: its canonical place ID
+    once any spelling of it has been geocoded, else its normalised text.
+    Never calls an upstream API. Keys that are already place IDs pass through.
+    """
+    if address.startswith(PLACE_ID_PREFIXES):
+        return address
+    if place_registry is not None:
+        place = place_registry.lookup(address)
+        if place is not None:
+            return place.place_id
+    return normalize_address(address)
+
+
+def learn_places(addresses: Iterable[str], geocode: Callable[[str], Dict[str, Any]], limit: Optional[int] = None) -> int:
+    """
+    Geocodes each distinct address (by normalised text) that has no known place
+    yet, which teaches the alias table. `geocode` is get_coordinates. At most
+    `limit` addresses are geocoded (None = no cap). Failures are logged and
+    skipped. Returns how many addresses were geocoded.
+    Blocking (upstream calls); run it on the upstream pool.
+    """
+    if place_registry is None:
+        return 0
+    learned = 0
+    attempted = 0
+    seen = set()
+    for address in addresses:
+        alias = normalize_address(address)
+        if not alias or alias in seen:
+            continue
+        seen.add(alias)
+        if place_registry.lookup(address) is not None:
+            continue
+        if limit is not None and attempted >= limit:
+            logger.info(f"Place learning stopped after {limit} geocodes; the remaining addresses are learned when first routed.")
+            break
+        attempted += 1
+        try:
+            if geocode(str(address)).get("status"):
+                learned += 1
+        except Exception as e:
+            logger.warning(f"Could not canonicalise address '{address}': {e}")
+    return learned
+
+
+def load_place_ids(load: Dict[str, Any]) -> Dict[str, str]:
+    """Canonical place IDs already known for a load's pickup and destination (no upstream calls)."""
+    place_ids = {}
+    if place_registry is None:
+        return place_ids
+    for address_field, id_field in (("pickup_point", "pickup_place_id"), ("origin", "pickup_place_id"), ("destination", "destination_place_id")):
+        address = load.get(address_field)
+        if address and id_field not in place_ids:
+            place = place_registry.lookup(address)
+            if place is not None:
+                place_ids[id_field] = place.place_id
+    return place_ids
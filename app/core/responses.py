@@ -0,0 +1,74 @@
+# logistics_ai_project/app/core/responses.py
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.core.timing import timed
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; falls back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class RawJSON(bytes):
+    """Bytes that already hold encoded JSON (e.g. a board snapshot's loads), written out as they are."""
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson when it is installed (several times faster
+    than the stdlib encoder on large load lists), else with Starlette's compact
+    json.dumps. Top-level dict values wrapped in RawJSON are spliced in without
+    being decoded and re-encoded. Rendering time shows up as the `serialize`
+    Server-Timing phase.
+    """
+
+    def _dumps(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        return super().render(content)
+
+    def render(self, content: Any) -> bytes:
+        with timed("serialize"):
+            if isinstance(content, dict) and any(isinstance(value, RawJSON) for value in content.values()):
+                members = [
+                    self._dumps(str(key)) + b":" + (value if isinstance(value, RawJSON) else self._dumps(value))
+                    for key, value in content.items()
+                ]
+                return b"{" + b",".join(members) + b"}"
+            return self._dumps(content)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Splits a `fields=a,b,c` query value. None or blank means "return everything"."""
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if not names:
+        raise HTTPException(status_code=400, detail="`fields` must name at least one field, e.g. fields=load_id,score")
+    return names
+
+
+def project(item: Dict[str, Any], fields: List[str], nested: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Builds a flat dict with only `fields` from `item`. A name is looked up on the
+    item itself first, then inside each of the `nested` dicts in order, so a scored
+    load can be projected to e.g. {"load_id", "score", "extra_km"}. Names that are
+    not found are left out rather than returned as null.
+    """
+    projected = {}
+    for name in fields:
+        if name in item:
+            projected[name] = item[name]
+            continue
+        for key in nested:
+            inner = item.get(key)
+            if isinstance(inner, dict) and name in inner:
+                projected[name] = inner[name]
+                break
+    return projected
@@ -0,0 +1,216 @@
+# logistics_ai_project/app/core/retrieval.py
+import json
+import logging
+import math
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.data.data_loader import loads_file_signature, register_loads_listener
+
+logger = logging.getLogger(__name__)
+
+# Fields of a load that are searchable, matching the keys written by save_new_load.py
+INDEXED_FIELDS = ("load_id", "pickup_point", "origin", "destination", "cargo_type", "status", "expected_delivery_date")
+
+# Rough characters-per-token ratio for English/JSON text with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases text and splits it into word / ISO-date tokens."""
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def _date_tokens(value: str) -> List[str]:
+    """Expands an ISO date ('2025-06-10') into tokens a question might use: full date, year-month, year, month name."""
+    try:
+        parsed = datetime.strptime(str(value)[:10], "%Y-%m-%d")
+    except ValueError:
+        return tokenize(value)
+    return [
+        parsed.strftime("%Y-%m-%d"),
+        parsed.strftime("%Y-%m"),
+        parsed.strftime("%Y"),
+        parsed.strftime("%B").lower(),
+        parsed.strftime("%b").lower(),
+    ]
+
+
+def load_tokens(load: Dict[str, Any]) -> List[str]:
+    """Returns the searchable tokens for a single load."""
+    tokens: List[str] = []
+    for field in INDEXED_FIELDS:
+        value = load.get(field)
+        if value is None:
+            continue
+        if field == "expected_delivery_date":
+            tokens.extend(_date_tokens(value))
+        else:
+            tokens.extend(tokenize(value))
+    return tokens
+
+
+def compact_load_json(load: Dict[str, Any]) -> str:
+    """Serializes a load as single-line JSON without whitespace, the way the agent prompt embeds it."""
+    return json.dumps(load, separators=(",", ":"), ensure_ascii=False)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+class LoadSearchIndex:
+    """
+    In-process inverted index over loads with BM25 ranking.
+
+    The index is keyed by load_id and updated incrementally: `sync()` diffs a
+    fresh list of loads against what is indexed and only re-tokenizes loads
+    that were added or changed, and drops loads that disappeared.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # token -> {load_id: term frequency}
+        self._doc_lengths: Dict[str, int] = {}
+        self._doc_terms: Dict[str, Set[str]] = {}
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._order: Dict[str, int] = {}  # load_id -> position in the store, used for recency tie-breaks
+        self._total_length = 0
+        self._source_signature: Optional[Tuple[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _remove(self, load_id: str):
+        for token in self._doc_terms.pop(load_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(load_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= self._doc_lengths.pop(load_id, 0)
+        self._docs.pop(load_id, None)
+        self._order.pop(load_id, None)
+
+    def _add(self, load_id: str, load: Dict[str, Any]):
+        tokens = load_tokens(load)
+        frequencies: Dict[str, int] = defaultdict(int)
+        for token in tokens:
+            frequencies[token] += 1
+        for token, count in frequencies.items():
+            self._postings[token][load_id] = count
+        self._doc_terms[load_id] = set(frequencies)
+        self._doc_lengths[load_id] = len(tokens)
+        self._total_length += len(tokens)
+        self._docs[load_id] = dict(load)
+
+    def upsert(self, load: Dict[str, Any], position: Optional[int] = None):
+        """Adds a load to the index, replacing any previously indexed version with the same load_id."""
+        load_id = str(load.get("load_id"))
+        with self._lock:
+            if self._docs.get(load_id) == load:
+                if position is not None:
+                    self._order[load_id] = position
+                return
+            self._remove(load_id)
+            self._add(load_id, load)
+            self._order[load_id] = position if position is not None else len(self._order)
+
+    def remove(self, load_id: str):
+        with self._lock:
+            self._remove(str(load_id))
+
+    def sync(self, loads: Iterable[Dict[str, Any]], source_signature: Optional[Tuple[int, int]] = None):
+        """Brings the index in line with `loads`, touching only added, changed or removed loads."""
+        with self._lock:
+            seen = set()
+            flat = (item for entry in loads for item in (entry if isinstance(entry, list) else [entry]))
+            for position, load in enumerate(flat):
+                if not isinstance(load, dict) or not load.get("load_id"):
+                    continue
+                seen.add(str(load["load_id"]))
+                self.upsert(load, position)
+            for stale_id in [load_id for load_id in self._docs if load_id not in seen]:
+                self._remove(stale_id)
+            self._source_signature = source_signature
+
+    def refresh_if_stale(self, current_signature: Optional[Tuple[int, int]], loader: Callable[[], List[Dict[str, Any]]]):
+        """Re-syncs from `loader` only when the backing store's signature changed (e.g. another worker wrote it)."""
+        if current_signature is not None and current_signature == self._source_signature:
+            return
+        self.sync(loader(), current_signature)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[Dict[str, Any], float]]:
+        """Returns up to `limit` (load, score) pairs ranked by BM25 relevance to `query`."""
+        query_tokens = set(tokenize(query))
+        with self._lock:
+            doc_count = len(self._docs)
+            if not doc_count or not query_tokens:
+                return []
+            avg_length = self._total_length / doc_count or 1.0
+            scores: Dict[str, float] = defaultdict(float)
+            for token in query_tokens:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for load_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[load_id] / avg_length)
+                    scores[load_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            ranked = sorted(scores.items(), key=lambda kv: (kv[1], self._order.get(kv[0], 0)), reverse=True)[:limit]
+            return [(self._docs[load_id], score) for load_id, score in ranked]
+
+    def most_recent(self, limit: int) -> List[Dict[str, Any]]:
+        """Returns the last `limit` loads in store order (the agent's previous behaviour, used when nothing matches)."""
+        with self._lock:
+            newest = sorted(self._order.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+            return [self._docs[load_id] for load_id, _ in newest]
+
+
+def fit_to_token_budget(loads: Iterable[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """Keeps loads in the given order until their compact JSON would exceed `token_budget`."""
+    selected = []
+    used = 0
+    for load in loads:
+        cost = estimate_tokens(compact_load_json(load)) + 1  # +1 for the separating newline
+        if used + cost > token_budget:
+            break
+        selected.append(load)
+        used += cost
+    return selected
+
+
+load_search_index = LoadSearchIndex()
+
+
+def _on_loads_saved(loads: List[Dict[str, Any]]):
+    load_search_index.sync(loads, loads_file_signature())
+
+
+register_loads_listener(_on_loads_saved)
+
+
+def select_context_loads(
+    question: str,
+    loader: Callable[[], List[Dict[str, Any]]],
+    max_loads: int,
+    token_budget: int,
+) -> List[Dict[str, Any]]:
+    """
+    Picks the loads most relevant to `question` from the shared index and trims
+    them to `token_budget`. The index is re-synced through `loader` only when
+    the loads file changed outside this process. Falls back to the most recent
+    loads when no load matches any term of the question.
+    """
+    load_search_index.refresh_if_stale(loads_file_signature(), loader)
+    ranked = [load for load, _ in load_search_index.search(question, limit=max_loads)]
+    if not ranked:
+        ranked = load_search_index.most_recent(max_loads)
+    return fit_to_token_budget(ranked, token_budget)
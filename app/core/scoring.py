@@ -1,53 +1,156 @@
 import logging
-from typing import List, Dict, Any
+import time
+from datetime import datetime
+from typing import List, Dict, Any, NamedTuple, Optional
 from app.models import Truck
-from app.services.Maps import get_route_eta_distance 
-import requests
-from dotenv import load_dotenv
-import os
-load_dotenv()
+from app.config import settings
+from app.services.Maps import get_route_eta_distance, maps_is_mocked
+from app.core.metrics import UPSTREAM_REQUESTS, LOADS_SCORED, LOADS_PRUNED, SCORING_BUDGET_EXHAUSTED
+from app.core.budget import CallBudget, call_budget, charge_upstream_call, upstream_timeout
+from app.core.deadlines import delivery_deadline, min_hours_to_deliver
+from app.core.timing import timed, observe_phase
+from app.core.cache import make_cache
+from app.core.places import canonical_place_id, normalize_address, place_registry
 
 
 logger = logging.getLogger(__name__)
 
+# Geocoding results barely change, so successful lookups are kept for days.
+geocode_cache = make_cache("geocode", max_entries=settings.GEOCODE_CACHE_SIZE, ttl_s=settings.GEOCODE_CACHE_TTL_S)
+
+
+def geocode_cache_key(location: str) -> str:
+    """Normalises an address for cache lookups: case, punctuation and repeated whitespace are ignored."""
+    return normalize_address(location)
+
+
+def parse_rate_per_km(rate: Any, load_id: Any = "N/A") -> float:
+    """Parses a stored rate such as '₹22.50/km' into a float; invalid or negative rates count as 0.0."""
+    rate_str_cleaned = rate if isinstance(rate, str) else str(rate if rate is not None else "₹0/km")
+    rate_str_cleaned = rate_str_cleaned.replace("â‚¹", "₹").replace("Rs.", "₹").strip()
+    try:
+        rate_value = float(rate_str_cleaned.replace("₹", "").replace("/km", "").strip())
+        if rate_value < 0:
+            logger.warning(f"Parsed negative rate value for load {load_id}: '{rate_str_cleaned}'. Using 0.0 for scoring.")
+            rate_value = 0.0
+    except ValueError as e:
+        logger.warning(f"Rate parsing ValueError for load {load_id}: '{rate_str_cleaned}'. Error: {e}. Using 0.0.")
+        rate_value = 0.0
+    except Exception as e:
+        logger.warning(f"Unexpected rate parse error for load {load_id} ('{rate_str_cleaned}'): {e}. Using 0.0.")
+        rate_value = 0.0
+    return rate_value
+
+class ScoringWeights(NamedTuple):
+    """The constants of the score_loads formula (see SCORE_* settings)."""
+    fuel_divisor: float = 100.0
+    time_divisor: float = 60.0
+    urgency_bonus: float = 2.0
+
+    @classmethod
+    def from_settings(cls) -> "ScoringWeights":
+        return cls(settings.SCORE_FUEL_DIVISOR, settings.SCORE_TIME_DIVISOR, settings.SCORE_URGENCY_BONUS)
+
+
+def urgency_bonus(status: Any, weights: ScoringWeights) -> float:
+    return weights.urgency_bonus if "urgent" in str(status or "").lower() else 0.0
+
+
+def score_with_detour(rate_value: float, status: Any, detour_info: Dict[str, Any], weights: ScoringWeights) -> float:
+    """
+    The score of one routed load: rate per km plus the urgency bonus, minus the
+    detour's fuel cost / fuel_divisor and its extra minutes / time_divisor
+    (negative detours are not rewarded). Shared by score_loads and the backtest.
+    """
+    score = rate_value + urgency_bonus(status, weights)
+
+    # Fuel Penalty
+    detour_fuel_cost = detour_info.get("fuel_cost", 0.0)
+    if isinstance(detour_fuel_cost, (int, float)) and detour_fuel_cost > 0:
+        score -= detour_fuel_cost / weights.fuel_divisor
+
+    # Time Penalty
+    detour_extra_min = detour_info.get("extra_min", 0.0)
+    if isinstance(detour_extra_min, (int, float)) and detour_extra_min > 0:
+        score -= detour_extra_min / weights.time_divisor
+    return score
+
+
 def score_loads(
     truck: Truck,
     all_loads_data: List[Dict[str, Any]],
+    stats: Optional[Dict[str, int]] = None,
+    budget: Optional[CallBudget] = None,
 ) -> List[Dict[str, Any]]:
     """
     Scores loads based on various factors including detour, rate, and urgency.
     Filters loads based on truck capacity.
-    Applies fuel penalty by dividing by 100 and time penalty by dividing by 60.
+    Applies fuel penalty by dividing by 100 and time penalty by dividing by 60
+    (SCORE_FUEL_DIVISOR / SCORE_TIME_DIVISOR / SCORE_URGENCY_BONUS).
+    Drops loads that cannot be delivered by their expected_delivery_date: first
+    with a straight-line lower bound before any route call, then exactly once the
+    real route duration is known.
 
     Args:
-        truck: The Truck object representing the vehicle.
-               IMPORTANT: This truck object is expected to already have
-               'latitude', 'longitude', and 'capacity' attributes populated
-               by the caller (e.g., the /recommend endpoint after geocoding).
+        truck: The Truck object representing the vehicle, with 'capacity' set.
+               If 'latitude' and 'longitude' are set (GPS fix or truck registry)
+               they are used as-is; otherwise 'location' is geocoded.
         all_loads_data: A list of dictionaries, where each dictionary
                         represents a load with keys like 'load_id',
                         'weight_tons', 'rate', 'status', 'pickup_point'
                         or 'origin', 'destination'.
+        stats: Optional dict that receives the number of loads pruned per stage
+               (past_due, lower_bound, exact) and in total ('pruned'), the number
+               of loads evaluated ('evaluated'), not reached ('skipped') and
+               whether the result is 'partial' (with the exhausted 'budget_limit').
+        budget: Optional CallBudget (max upstream calls / wall time). With a budget,
+                loads are evaluated best optimistic score first (rate plus urgency
+                bonus, which penalties can only lower) and scoring stops once the
+                budget runs out, returning the loads scored so far.
 
     Returns:
         A list of dictionaries, each containing the cleaned original 'load' data,
         its calculated 'score', and 'detour' information.
     """
+    if budget is not None and budget.unlimited:
+        budget = None
+    with call_budget(budget):
+        return _score_loads_within_budget(truck, all_loads_data, stats, budget)
+
+
+def _optimistic_score(load: Dict[str, Any], weights: ScoringWeights) -> float:
+    """Upper bound of a load's score before routing: rate plus urgency bonus (penalties only subtract)."""
+    return parse_rate_per_km(load.get("rate", "₹0/km"), load.get("load_id", "N/A")) + urgency_bonus(load.get("status"), weights)
+
+
+def _score_loads_within_budget(
+    truck: Truck,
+    all_loads_data: List[Dict[str, Any]],
+    stats: Optional[Dict[str, int]],
+    budget: Optional[CallBudget],
+) -> List[Dict[str, Any]]:
     scored_and_filtered_loads = []
+    pruned = {"past_due": 0, "lower_bound": 0, "exact": 0}
+    weights = ScoringWeights.from_settings()
 
     truck_current_address = truck.location
 
-    if not truck_current_address:
-        truck_id_for_log = getattr(truck, 'truck_id', 'N/A')
-        logger.error(
-            f"Truck (ID: {truck_id_for_log}) is missing 'current_location_address'. "
-            f"Cannot proceed with scoring."
-        )
-        return []
-    
-    # service = GoogleLocationService()
-    # origin_coords_result = service.get_coordinates(truck_current_address)
-    origin_coords_result = get_coordinates(truck_current_address)
+    if truck.latitude is not None and truck.longitude is not None:
+        # Known position (telematics fix or registry): no geocoding round-trip needed
+        origin_coords_result = {"status": True, "latitude": truck.latitude, "longitude": truck.longitude}
+    else:
+        if not truck_current_address:
+            truck_id_for_log = getattr(truck, 'truck_id', 'N/A')
+            logger.error(
+                f"Truck (ID: {truck_id_for_log}) is missing 'current_location_address'. "
+                f"Cannot proceed with scoring."
+            )
+            return []
+
+        # service = GoogleLocationService()
+        # origin_coords_result = service.get_coordinates(truck_current_address)
+        with timed("geocode"):
+            origin_coords_result = get_coordinates(truck_current_address)
 
     if not origin_coords_result["status"] or origin_coords_result["latitude"] is None or origin_coords_result["longitude"] is None:
         truck_id_for_log = getattr(truck, 'truck_id', 'N/A')
@@ -72,7 +175,24 @@ def score_loads(
         return []
 
 
-    for load_item in all_loads_data:
+    LOADS_SCORED.observe(len(all_loads_data))
+    scoring_started = time.perf_counter()
+    now = datetime.now()
+    route_is_mocked = maps_is_mocked()
+
+    candidates = all_loads_data
+    if budget is not None:
+        # Anytime mode: spend the budget where the winners are likely to be
+        candidates = sorted(all_loads_data, key=lambda load: _optimistic_score(load, weights), reverse=True)
+    evaluated = 0
+    budget_limit = None
+
+    for load_item in candidates:
+        if budget is not None:
+            budget_limit = budget.exhausted()
+            if budget_limit is not None:
+                break
+        evaluated += 1
         current_load = dict(load_item)
         load_id = current_load.get('load_id', 'N/A')
 
@@ -104,6 +224,22 @@ def score_loads(
             logger.warning(f"Load {load_id} is missing pickup ('{pickup_address}') or destination ('{drop_address}') address. Skipping.")
             continue
 
+        # --- Deadline Feasibility (cheap lower bound, before any route call) ---
+        deadline = delivery_deadline(current_load) if settings.DEADLINE_PRUNING_ENABLED else None
+        hours_left = None
+        if deadline is not None:
+            hours_left = (deadline - now).total_seconds() / 3600
+            if hours_left <= 0:
+                pruned["past_due"] += 1
+                continue
+            with timed("deadline_bound"):
+                # Known coordinates only: on a miss the bound is skipped rather than paid for with geocodes
+                min_hours = min_hours_to_deliver(truck_origin_lat, truck_origin_lng, pickup_address, drop_address, cached_coordinates)
+            if min_hours is not None and min_hours > hours_left:
+                logger.info(f"Load {load_id} cannot make its delivery date ({min_hours:.1f}h needed at best, {hours_left:.1f}h left). Skipping.")
+                pruned["lower_bound"] += 1
+                continue
+
         # --- Detour Calculation ---
         # This uses the truck's already resolved origin coordinates
         detour_info = get_route_eta_distance(
@@ -117,75 +253,104 @@ def score_loads(
             logger.info(f"Skipping load {load_id} due to detour calculation failure (e.g., invalid addresses or API error).")
             continue
 
-        # --- Rate Value Parsing ---
-        rate_value = 0.0
-        rate_str_cleaned = current_load.get("rate", "₹0/km")
-
-        try:
-            rate_value_str = rate_str_cleaned.replace("₹", "").replace("/km", "").strip()
-            rate_value = float(rate_value_str)
-
-            if rate_value < 0:
-                logger.warning(f"Parsed negative rate value for load {load_id}: '{rate_str_cleaned}'. Using 0.0 for scoring.")
-                rate_value = 0.0
-        except ValueError as e:
-            logger.warning(f"Rate parsing ValueError for load {load_id}: '{rate_str_cleaned}'. Error: {e}. Using 0.0.")
-            rate_value = 0.0
-        except Exception as e:
-            logger.warning(f"Unexpected rate parse error for load {load_id} ('{rate_str_cleaned}'): {e}. Using 0.0.")
-            rate_value = 0.0
-
-        # --- Score Calculation (Using /100 for fuel and /60 for time, as requested) ---
-        score = rate_value # Base score from rate per km
-
-        # Bonus for urgency
-        if "urgent" in current_load.get("status", "").lower():
-            score += 2.0
-
-        # Fuel Penalty
-        fuel_penalty = 0.0
-        detour_fuel_cost = detour_info.get("fuel_cost", 0.0)
-        if isinstance(detour_fuel_cost, (int, float)) and detour_fuel_cost > 0:
-            fuel_penalty = detour_fuel_cost / 100.0 # Penalty based on fuel cost
+        # --- Exact Deadline Slack (real driving time truck -> pickup -> drop) ---
+        # Mock legs carry made-up durations, so they can neither prune a load nor give it a slack
+        deadline_slack_h = None
+        if hours_left is not None and not route_is_mocked:
+            deadline_slack_h = hours_left - detour_info.get("via_min", 0.0) / 60.0
+            if deadline_slack_h < 0:
+                logger.info(f"Load {load_id} misses its delivery date by {-deadline_slack_h:.1f}h on the real route. Skipping.")
+                pruned["exact"] += 1
+                continue
 
-        # Time Penalty
-        time_penalty = 0.0
-        detour_extra_min = detour_info.get("extra_min", 0.0)
-        if isinstance(detour_extra_min, (int, float)) and detour_extra_min > 0:
-            time_penalty = detour_extra_min / 60.0 # Penalty based on extra time in minutes
+        # --- Rate Value Parsing ---
+        rate_value = parse_rate_per_km(current_load.get("rate", "₹0/km"), load_id)
 
-        score -= fuel_penalty
-        score -= time_penalty
+        # --- Score Calculation (Using /100 for fuel and /60 for time by default) ---
+        score = score_with_detour(rate_value, current_load.get("status", ""), detour_info, weights)
 
         logger.debug(
             f"Load {load_id} -> Base Rate: {rate_value:.2f}, "
-            f"Urgency Bonus: {2.0 if 'urgent' in current_load.get('status', '').lower() else 0.0:.2f}, "
-            f"Fuel Penalty: -{fuel_penalty:.2f}, Time Penalty: -{time_penalty:.2f}, "
+            f"Urgency Bonus: {urgency_bonus(current_load.get('status'), weights):.2f}, "
+            f"Detour: {detour_info.get('fuel_cost', 0.0)} fuel / {detour_info.get('extra_min', 0.0)} min, "
             f"Final Score: {score:.2f}"
         )
 
         scored_and_filtered_loads.append({
             "load": current_load,
             "score": round(score, 2), # Round the final score for consistency
-            "detour": detour_info
+            "detour": detour_info,
+            "deadline_slack_h": round(deadline_slack_h, 1) if deadline_slack_h is not None else None
         })
 
+    observe_phase("scoring", time.perf_counter() - scoring_started)
+    for stage, count in pruned.items():
+        if count:
+            LOADS_PRUNED.labels(stage).inc(count)
+    skipped = len(candidates) - evaluated
+    if budget_limit is not None:
+        SCORING_BUDGET_EXHAUSTED.labels(budget_limit).inc()
+        logger.info(f"Scoring budget exhausted ({budget_limit}) after {evaluated} loads and {budget.calls} upstream calls; {skipped} loads skipped.")
+    if stats is not None:
+        stats.update(pruned)
+        stats["pruned"] = sum(pruned.values())
+        stats["evaluated"] = evaluated
+        stats["skipped"] = skipped
+        stats["partial"] = budget_limit is not None
+        stats["budget_limit"] = budget_limit
     return scored_and_filtered_loads
 
 
 
+def cached_coordinates(location: str) -> Optional[Dict[str, Any]]:
+    """
+    get_coordinates() without the API call: the learned alias or the cached
+    geocode of `location`, or None when it has not been geocoded yet.
+    """
+    if place_registry is not None:
+        place = place_registry.lookup(location)
+        if place is not None:
+            return place.as_coordinates()
+    cached = geocode_cache.get(geocode_cache_key(location))
+    return dict(cached) if cached is not None else None
+
+
 def get_coordinates(location: str) -> dict:
     """
-    Returns latitude and longitude for a given address or pincode.
+    Returns latitude and longitude for a given address or pincode, plus the
+    canonical place_id every spelling of that place shares. Addresses whose alias
+    is already learned never reach the geocode cache or the API; other successful
+    lookups are cached and teach the alias table. Failures are not cached. The
+    call is bounded like fetch_route_leg's; a timeout is an ordinary failure.
     """
-    api_key = os.getenv("GOOGLE_MAPS_API_KEY")
-    base_url = "https://maps.googleapis.com/maps/api/geocode/json"
+    cached = cached_coordinates(location)
+    if cached is not None:
+        return cached
+    cache_key = geocode_cache_key(location)
+
+    import requests  # imported lazily to keep worker start-up fast
+
+    base_url = f"{settings.GOOGLE_MAPS_BASE_URL}/geocode/json"
     params = {
         "address": location,
-        "key": api_key
+        "key": settings.Maps_API_KEY
     }
-    response = requests.get(base_url, params=params)
+    charge_upstream_call()
+    try:
+        response = requests.get(base_url, params=params, timeout=upstream_timeout(settings.MAPS_CALL_TIMEOUT_S))
+    except requests.exceptions.Timeout:
+        UPSTREAM_REQUESTS.labels("google_geocode", "timeout").inc()
+        return {
+            "status": False,
+            "message": f"Geocoding timed out for location: {location}",
+            "latitude": None,
+            "longitude": None
+        }
+    except requests.exceptions.RequestException:
+        UPSTREAM_REQUESTS.labels("google_geocode", "error").inc()
+        raise
     if response.status_code != 200:
+        UPSTREAM_REQUESTS.labels("google_geocode", "error").inc()
         return {
             "status": False,
             "message": "Request to Google API failed",
@@ -194,21 +359,29 @@ def get_coordinates(location: str) -> dict:
         }
     data = response.json()
     if data.get("status") != "OK" or not data.get("results"):
+        outcome = "no_result" if data.get("status") in ("OK", "ZERO_RESULTS") else "api_error"
+        UPSTREAM_REQUESTS.labels("google_geocode", outcome).inc()
         return {
             "status": False,
             "message": f"Could not find coordinates for location: {location}",
             "latitude": None,
             "longitude": None
         }
+    UPSTREAM_REQUESTS.labels("google_geocode", "ok").inc()
     location_data = data["results"][0]["geometry"]["location"]
     formatted_address = data["results"][0]["formatted_address"]
-    return {
+    result = {
         "status": True,
         "message": "Location coordinates fetched successfully",
         "location": formatted_address,
         "latitude": location_data["lat"],
-        "longitude": location_data["lng"]
+        "longitude": location_data["lng"],
+        "place_id": canonical_place_id(data["results"][0].get("place_id"), location_data["lat"], location_data["lng"]),
     }
+    geocode_cache.set(cache_key, result)
+    if place_registry is not None:
+        place_registry.learn(location, result)
+    return dict(result)
 
 
 
@@ -0,0 +1,256 @@
+# logistics_ai_project/app/core/subscriptions.py
+import asyncio
+import itertools
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.core.budget import CallBudget, call_budget
+from app.core.concurrency import run_blocking_io, run_upstream
+from app.core.geo import haversine_km
+from app.core.load_index import normalize_status, unavailable_statuses
+from app.core.metrics import SUBSCRIPTIONS_ACTIVE, SUBSCRIPTION_EVENTS
+from app.core.scoring import get_coordinates, score_loads
+from app.data.changes import load_change_log
+from app.models import Truck
+
+logger = logging.getLogger(__name__)
+
+_FEED_BATCH = 500  # changes read from the feed per step
+
+
+class Subscription:
+    """One subscribed truck. Matches are queued here and drained by its SSE or WebSocket connection."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, truck: Truck, latitude: float, longitude: float, min_score: float, max_pickup_km: float):
+        self.subscription_id = f"S{next(self._ids)}"
+        self.truck = truck
+        self.latitude = latitude
+        self.longitude = longitude
+        self.min_score = min_score
+        self.max_pickup_km = max_pickup_km
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.SUBSCRIPTION_QUEUE_SIZE)
+
+    def push(self, event: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(event)
+            SUBSCRIPTION_EVENTS.labels("sent").inc()
+        except asyncio.QueueFull:
+            # A consumer that stopped reading must not make the hub buffer without bound
+            SUBSCRIPTION_EVENTS.labels("dropped").inc()
+            logger.warning(f"Subscription {self.subscription_id} queue full. Dropping match for load {event.get('load', {}).get('load_id')}.")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "subscription_id": self.subscription_id,
+            "truck": self.truck.model_dump(),
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "min_score": self.min_score,
+            "max_pickup_km": self.max_pickup_km,
+        }
+
+
+def _geocode_pickups(loads: List[Dict[str, Any]]) -> Dict[str, Tuple[float, float]]:
+    """Pickup coordinates per load_id, geocoded once per batch and shared by every subscriber (geocode cache backed)."""
+    coords = {}
+    for load in loads:
+        pickup = load.get("pickup_point") or load.get("origin")
+        if not pickup:
+            continue
+        try:
+            result = get_coordinates(pickup)
+        except Exception as e:
+            logger.warning(f"Could not geocode pickup '{pickup}' for load {load.get('load_id')}: {e}")
+            continue
+        if result.get("status"):
+            coords[str(load.get("load_id"))] = (result["latitude"], result["longitude"])
+    return coords
+
+
+def _match_budget() -> CallBudget:
+    return CallBudget(max_calls=settings.SUBSCRIPTION_MATCH_MAX_UPSTREAM_CALLS, max_seconds=settings.SUBSCRIPTION_MATCH_MAX_TIME_S)
+
+
+def match_new_loads(
+    subscription: Subscription,
+    new_loads: List[Dict[str, Any]],
+    pickup_coords: Dict[str, Tuple[float, float]],
+    budget: Optional[CallBudget] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Scores only `new_loads` for one subscribed truck. Loads that are not open, over the truck's capacity
+    or with a pickup further than `max_pickup_km` in a straight line are dropped
+    before any route call; the rest go through score_loads (within `budget`) and are
+    kept if they reach the subscription's min_score. Blocking (Google Maps); run it on the upstream pool.
+    """
+    candidates = []
+    closed = unavailable_statuses()
+    for load in new_loads:
+        if normalize_status(load.get("status")) in closed:
+            SUBSCRIPTION_EVENTS.labels("prefiltered").inc()
+            continue
+        weight = load.get("weight_tons")
+        if isinstance(weight, (int, float)) and weight > subscription.truck.capacity:
+            SUBSCRIPTION_EVENTS.labels("prefiltered").inc()
+            continue
+        pickup = pickup_coords.get(str(load.get("load_id")))
+        if pickup is not None and subscription.max_pickup_km > 0:
+            if haversine_km(subscription.latitude, subscription.longitude, pickup[0], pickup[1]) > subscription.max_pickup_km:
+                SUBSCRIPTION_EVENTS.labels("prefiltered").inc()
+                continue
+        candidates.append(load)
+
+    if not candidates:
+        return []
+
+    matches = []
+    for item in score_loads(subscription.truck, candidates, budget=budget):
+        if item["score"] >= subscription.min_score:
+            matches.append(item)
+        else:
+            SUBSCRIPTION_EVENTS.labels("below_threshold").inc()
+    return matches
+
+
+def _match_batch(
+    subscriptions: List[Subscription],
+    new_loads: List[Dict[str, Any]],
+    pickup_coords: Dict[str, Tuple[float, float]],
+) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    One upstream job: matches for each subscription in turn, under one CallBudget.
+    Subscriptions reached after the budget ran out get None (not scored).
+    Blocking; run it on the upstream pool.
+    """
+    budget = _match_budget()
+    results: List[Optional[List[Dict[str, Any]]]] = []
+    for subscription in subscriptions:
+        if not budget.unlimited and budget.exhausted() is not None:
+            SUBSCRIPTION_EVENTS.labels("over_budget").inc()
+            results.append(None)
+            continue
+        try:
+            results.append(match_new_loads(subscription, new_loads, pickup_coords, budget))
+        except Exception as e:
+            logger.error(f"Matching new loads for subscription {subscription.subscription_id} failed: {e}")
+            results.append(None)
+    return results
+
+
+def _geocode_pickups_within_budget(loads: List[Dict[str, Any]]) -> Dict[str, Tuple[float, float]]:
+    with call_budget(_match_budget()):
+        return _geocode_pickups(loads)
+
+
+class LoadSubscriptionHub:
+    """
+    Per-worker registry of subscribed trucks. While any truck is subscribed the hub
+    follows the load change feed, which every worker's saves are recorded in, and
+    scores just the added loads against each subscription in the background,
+    pushing matches to the subscriber's queue: O(trucks x new loads) instead of
+    every truck re-polling /recommend over the whole board. Subscriptions are
+    scored SUBSCRIPTION_MATCH_BATCH per upstream job, one job at a time, so a
+    posting with many subscribers holds one upstream thread rather than the pool.
+    With the change feed disabled only this worker's postings are seen, through
+    notify_new_loads.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Subscription] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._follower: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    async def subscribe(self, truck: Truck, min_score: Optional[float] = None, max_pickup_km: Optional[float] = None) -> Subscription:
+        """
+        Registers an already resolved truck (see resolve_truck). Its coordinates are used
+        as-is, otherwise its location is geocoded once. Raises ValueError if that fails.
+        """
+        if truck.latitude is not None and truck.longitude is not None:
+            coords = {"status": True, "latitude": truck.latitude, "longitude": truck.longitude}
+        else:
+            coords = await run_upstream(get_coordinates, truck.location)
+        if not coords.get("status"):
+            raise ValueError(coords.get("message", f"Could not geocode '{truck.location}'"))
+        subscription = Subscription(
+            truck,
+            latitude=coords["latitude"],
+            longitude=coords["longitude"],
+            min_score=settings.SUBSCRIPTION_MIN_SCORE if min_score is None else min_score,
+            max_pickup_km=settings.SUBSCRIPTION_MAX_PICKUP_KM if max_pickup_km is None else max_pickup_km,
+        )
+        self._subscriptions[subscription.subscription_id] = subscription
+        SUBSCRIPTIONS_ACTIVE.set(len(self._subscriptions))
+        if load_change_log is not None and (self._follower is None or self._follower.done()):
+            self._follower = asyncio.get_running_loop().create_task(self._follow_feed(await run_blocking_io(load_change_log.latest_version)))
+        logger.info(f"Subscription {subscription.subscription_id} opened for truck at '{truck.location}'.")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if self._subscriptions.pop(subscription.subscription_id, None) is not None:
+            SUBSCRIPTIONS_ACTIVE.set(len(self._subscriptions))
+            logger.info(f"Subscription {subscription.subscription_id} closed.")
+
+    def notify_new_loads(self, new_loads: List[Dict[str, Any]]):
+        """
+        Called on the event loop after new loads are committed. Returns immediately;
+        matching runs in the background. A no-op with the change feed on: the feed
+        follower picks the loads up (from every worker) instead.
+        """
+        if load_change_log is not None or not new_loads or not self._subscriptions:
+            return
+        task = asyncio.get_running_loop().create_task(self._match_and_push(list(new_loads)))
+        self._tasks.add(task)  # keep a reference until done so the task is not garbage collected
+        task.add_done_callback(self._tasks.discard)
+
+    async def _follow_feed(self, version: int):
+        """Reads added loads from the change feed after `version` while anyone is subscribed."""
+        while self._subscriptions:
+            try:
+                result = await run_blocking_io(load_change_log.since, version, _FEED_BATCH)
+            except Exception as e:
+                logger.error(f"Load subscriptions could not read the change feed: {e}")
+                await asyncio.sleep(settings.CHANGE_FEED_POLL_S)
+                continue
+            if result["reset_required"]:
+                logger.warning(f"Load subscriptions fell behind the change feed; skipping to version {result['version']}.")
+            version = result["version"]
+            new_loads = [change["load"] for change in result["changes"] if change["op"] == "add"]
+            if new_loads:
+                await self._match_and_push(new_loads)
+            if not result["more"] and not result["reset_required"]:
+                await load_change_log.wakeup.wait(settings.CHANGE_FEED_MAX_WAIT_S, version)
+
+    async def _match_and_push(self, new_loads: List[Dict[str, Any]]):
+        try:
+            pickup_coords = await run_upstream(_geocode_pickups_within_budget, new_loads)
+            subscriptions = list(self._subscriptions.values())
+            batch_size = max(1, settings.SUBSCRIPTION_MATCH_BATCH)
+            for start in range(0, len(subscriptions), batch_size):
+                batch = subscriptions[start:start + batch_size]
+                results = await run_upstream(_match_batch, batch, new_loads, pickup_coords)
+                for subscription, matches in zip(batch, results):
+                    if not matches or subscription.subscription_id not in self._subscriptions:
+                        continue  # nothing matched, not scored, or disconnected while we were scoring
+                    for item in sorted(matches, key=lambda x: x["score"], reverse=True):
+                        subscription.push({"event": "load_match", **item})
+        except Exception as e:
+            logger.error(f"Load subscription matching failed: {e}", exc_info=True)
+
+    async def shutdown(self):
+        if self._follower is not None:
+            self._tasks.add(self._follower)
+            self._follower = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._subscriptions.clear()
+        SUBSCRIPTIONS_ACTIVE.set(0)
+
+
+subscription_hub = LoadSubscriptionHub()
@@ -0,0 +1,233 @@
+# logistics_ai_project/app/core/timing.py
+import contextvars
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from app.config import settings, PROJECT_ROOT
+from app.core.concurrency import request_threads, run_blocking_io
+from app.core.metrics import PHASE_DURATION
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RequestTimings:
+    """
+    Per-request accumulator of phase timings. One instance is shared by every
+    thread working on the request (contextvars are copied into executor
+    threads), so updates are guarded by a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases: Dict[str, List[float]] = {}  # phase -> [total_s, count, max_s]
+
+    def record(self, phase: str, seconds: float):
+        with self._lock:
+            entry = self._phases.get(phase)
+            if entry is None:
+                self._phases[phase] = [seconds, 1, seconds]
+            else:
+                entry[0] += seconds
+                entry[1] += 1
+                entry[2] = max(entry[2], seconds)
+
+    def server_timing_header(self, total_s: float) -> str:
+        """Formats the timings as a Server-Timing header value (durations in milliseconds)."""
+        with self._lock:
+            parts = []
+            for phase, (total, count, slowest) in self._phases.items():
+                part = f"{phase};dur={total * 1000:.1f}"
+                if count > 1:
+                    part += f';desc="{count} calls, max {slowest * 1000:.1f}ms"'
+                parts.append(part)
+        parts.append(f"total;dur={total_s * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_timing(phase: str, seconds: float):
+    """Adds `seconds` to `phase` for the current request, if the call is part of one."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.record(phase, seconds)
+
+
+def observe_phase(phase: str, seconds: float):
+    """Records an already measured phase duration in the phase histogram and the request breakdown."""
+    PHASE_DURATION.labels(phase).observe(seconds)
+    record_timing(phase, seconds)
+
+
+class timed:
+    """
+    Context manager timing a processing phase into both a Prometheus histogram
+    (the phase histogram unless `histogram` is given) and the current
+    request's Server-Timing breakdown.
+    """
+    __slots__ = ("_phase", "_histogram", "_start")
+
+    def __init__(self, phase: str, histogram=None):
+        self._phase = phase
+        self._histogram = histogram if histogram is not None else PHASE_DURATION.labels(phase)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        self._histogram.observe(elapsed)
+        record_timing(self._phase, elapsed)
+        return False
+
+
+# --- Sampled profiling ---
+
+class StackSampler:
+    """
+    Statistical profiler for one request: a background thread snapshots, every
+    `interval_s`, the event loop thread and the executor threads currently
+    running the request's jobs (`threads`, filled in by run_blocking_io and
+    run_upstream), and counts stacks that pass through app code. Each stack is
+    rooted at an "event-loop" or "worker" frame. The event loop is shared, so
+    its samples can include other requests' coroutines; worker samples cannot.
+    Output is the "folded" format understood by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval_s: float, loop_thread_id: int):
+        self.interval_s = interval_s
+        self.threads: Set[int] = set()
+        self._loop_thread_id = loop_thread_id
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        self._thread.join()
+        return dict(self._counts)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            targets = [(self._loop_thread_id, "event-loop")] + [(thread_id, "worker") for thread_id in tuple(self.threads)]
+            for thread_id, role in targets:
+                frame = frames.get(thread_id)
+                stack = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(APP_DIR)
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if in_app:
+                    stack.append(role)
+                    self._counts[";".join(reversed(stack))] += 1
+
+
+class ProfilingControl:
+    """Admin-toggled 1-in-N request sampling. `sample_every` of 0 disables profiling."""
+
+    def __init__(self, sample_every: int, output_dir: str, interval_ms: float):
+        self.sample_every = sample_every
+        self.output_dir = output_dir
+        self.interval_ms = interval_ms
+        self.profiles_written = 0
+        self._counter = itertools.count(1)
+
+    def should_sample(self) -> bool:
+        return self.sample_every > 0 and next(self._counter) % self.sample_every == 0
+
+    def dump(self, counts: Dict[str, int], method: str, path: str) -> Optional[str]:
+        if not counts:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_path = path.strip("/").replace("/", "_") or "root"
+        file_path = os.path.join(
+            self.output_dir, f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}_{method}_{safe_path}.folded"
+        )
+        with open(file_path, "w", encoding="utf-8") as f:
+            for stack, count in counts.items():
+                f.write(f"{stack} {count}\n")
+        self.profiles_written += 1
+        return file_path
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "sample_every": self.sample_every,
+            "interval_ms": self.interval_ms,
+            "output_dir": self.output_dir,
+            "profiles_written": self.profiles_written,
+        }
+
+
+profiling = ProfilingControl(
+    sample_every=settings.PROFILE_SAMPLE_EVERY,
+    output_dir=settings.PROFILE_OUTPUT_DIR or os.path.join(PROJECT_ROOT, "profiles"),
+    interval_ms=settings.PROFILE_INTERVAL_MS,
+)
+
+
+def _finish_profile(sampler: StackSampler, method: str, path: str):
+    """Stops a request's sampler and writes its folded stacks. Blocking."""
+    try:
+        file_path = profiling.dump(sampler.stop(), method, path)
+        if file_path:
+            logger.info(f"Sampled profile for {method} {path} written to {file_path}")
+    except Exception as e:
+        logger.error(f"Failed to write sampled profile: {e}", exc_info=True)
+
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware that opens a request-scoped timing context, returns
+    the collected phases in a `Server-Timing` response header, and profiles
+    1-in-N requests when sampling is switched on.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+
+        sampler = threads_token = None
+        if profiling.should_sample():
+            sampler = StackSampler(profiling.interval_ms / 1000.0, threading.get_ident())
+            threads_token = request_threads.set(sampler.threads)
+            sampler.start()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                header = timings.server_timing_header(time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_timings.reset(token)
+            if sampler is not None:
+                request_threads.reset(threads_token)
+                # Joining the sampler thread and writing the file both block; keep them off the event loop
+                await run_blocking_io(_finish_profile, sampler, scope["method"], scope["path"])
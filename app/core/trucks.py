@@ -0,0 +1,138 @@
+# logistics_ai_project/app/core/trucks.py
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.core.concurrency import run_blocking_io
+from app.data.data_loader import (
+    DUMMY_TRUCKS_FILE, file_signature, get_registered_trucks, save_registered_trucks, trucks_write_lock,
+)
+from app.models import Truck
+
+logger = logging.getLogger(__name__)
+
+POSITION_FIELDS = ("location", "latitude", "longitude")
+
+
+class TruckNotRegistered(LookupError):
+    pass
+
+
+class TruckRegistry:
+    """
+    Last known position and capacity per truck_id, persisted in the trucks JSON
+    file. Reads are served from memory and reloaded only when the file changed
+    (e.g. another worker wrote it); writes go through the file under the store lock.
+    """
+
+    def __init__(self):
+        self._trucks: Dict[str, Dict[str, Any]] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        signature = file_signature(DUMMY_TRUCKS_FILE)
+        if signature is not None and signature == self._signature:
+            return
+        trucks = {str(truck["truck_id"]): truck for truck in get_registered_trucks() if isinstance(truck, dict) and truck.get("truck_id")}
+        with self._lock:
+            self._trucks = trucks
+            self._signature = signature
+
+    def get(self, truck_id: str) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        truck = self._trucks.get(str(truck_id))
+        return dict(truck) if truck is not None else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        self._refresh()
+        return [dict(truck) for truck in self._trucks.values()]
+
+    def upsert(self, truck_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Merges `fields` (None values ignored) into the truck's record and saves it.
+        A new position replaces the old one as a whole: sending only a location
+        clears stale coordinates, sending only coordinates keeps the location text.
+        Blocking (file I/O); run it in the I/O executor.
+        """
+        updates = {key: value for key, value in fields.items() if value is not None}
+        with trucks_write_lock:
+            trucks = [truck for truck in get_registered_trucks() if isinstance(truck, dict)]
+            record = next((truck for truck in trucks if str(truck.get("truck_id")) == str(truck_id)), None)
+            if record is None:
+                record = {"truck_id": str(truck_id)}
+                trucks.append(record)
+
+            if any(key in updates for key in POSITION_FIELDS):
+                if "latitude" not in updates:
+                    record.pop("latitude", None)
+                    record.pop("longitude", None)
+                if "place_id" not in updates:
+                    record.pop("place_id", None)
+                record["position_updated_at"] = datetime.utcnow().isoformat()
+            record.update(updates)
+
+            if not save_registered_trucks(trucks):
+                raise OSError(f"Could not save truck registry to {DUMMY_TRUCKS_FILE}")
+            self._signature = None  # force a reload on the next read
+        return dict(record)
+
+    def remove(self, truck_id: str) -> bool:
+        with trucks_write_lock:
+            trucks = [truck for truck in get_registered_trucks() if isinstance(truck, dict)]
+            remaining = [truck for truck in trucks if str(truck.get("truck_id")) != str(truck_id)]
+            if len(remaining) == len(trucks):
+                return False
+            if not save_registered_trucks(remaining):
+                raise OSError(f"Could not save truck registry to {DUMMY_TRUCKS_FILE}")
+            self._signature = None
+        return True
+
+
+truck_registry = TruckRegistry()
+
+
+def resolve_truck(truck: Truck) -> Truck:
+    """
+    Completes a request's Truck from the registry when it carries a truck_id.
+    Fields sent in the request win; if the request sends any position (location
+    or coordinates) the registered position is ignored. Raises TruckNotRegistered
+    for an unknown id that the request cannot stand in for, and ValueError when
+    the result still lacks a capacity or any position.
+    """
+    requested = truck.model_dump(exclude_none=True)
+    resolved = dict(requested)
+
+    if truck.truck_id:
+        registered = truck_registry.get(truck.truck_id)
+        if registered is None:
+            if truck.capacity is None or not any(key in requested for key in POSITION_FIELDS):
+                raise TruckNotRegistered(f"Truck '{truck.truck_id}' is not registered.")
+        else:
+            request_has_position = any(key in requested for key in POSITION_FIELDS)
+            for key in ("location", "latitude", "longitude", "capacity"):
+                if key in requested or (request_has_position and key in POSITION_FIELDS):
+                    continue
+                if registered.get(key) is not None:
+                    resolved[key] = registered[key]
+
+    if (resolved.get("latitude") is None) != (resolved.get("longitude") is None):
+        raise ValueError("latitude and longitude must be given together.")
+    if resolved.get("capacity") is None:
+        raise ValueError("Truck capacity is required (send it or register the truck).")
+    if not resolved.get("location") and resolved.get("latitude") is None:
+        raise ValueError("Truck position is required: send location or latitude/longitude, or register the truck.")
+    return Truck(**resolved)
+
+
+async def resolve_request_truck(truck: Truck) -> Truck:
+    """resolve_truck for route handlers: 404 for unknown trucks, 422 for incomplete ones."""
+    try:
+        return await run_blocking_io(resolve_truck, truck)
+    except TruckNotRegistered as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
@@ -0,0 +1,79 @@
+# logistics_ai_project/app/core/warmup.py
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+from app.config import settings
+from app.core.metrics import STARTUP_WARMUP_SECONDS
+from app.core.load_index import load_filter_index
+from app.core.retrieval import load_search_index
+from app.core.scoring import get_coordinates, geocode_cache_key
+from app.data.changes import load_change_log
+from app.data.data_loader import loads_file_signature, read_loads
+from app.data.snapshot import board_snapshots
+
+logger = logging.getLogger(__name__)
+
+
+def _distinct_cities(loads: List[Dict[str, Any]], limit: int) -> List[str]:
+    """The `limit` pickup and destination cities that occur most on the board, de-duplicated by their cache key."""
+    counts: Counter = Counter()
+    spellings: Dict[str, str] = {}
+    for entry in loads:
+        for load in (entry if isinstance(entry, list) else [entry]):
+            if not isinstance(load, dict):
+                continue
+            for address in (load.get("pickup_point") or load.get("origin"), load.get("destination")):
+                if isinstance(address, str) and address.strip():
+                    key = geocode_cache_key(address)
+                    counts[key] += 1
+                    spellings.setdefault(key, address)
+    return [spellings[key] for key, _ in counts.most_common(limit)]
+
+
+def run_warmup() -> Dict[str, Any]:
+    """
+    Startup warm-up so the first real requests do not pay for cold state.
+    Loads the board, builds the search index and the filter index (or maps the board
+    snapshot), and (when WARMUP_GEOCODE_LIMIT > 0) pre-geocodes the most common cities. Blocking; run it in the I/O executor.
+    """
+    started = time.perf_counter()
+    report: Dict[str, Any] = {"loads": 0, "indexed": 0, "geocoded": 0, "geocode_failures": 0}
+
+    try:
+        signature = loads_file_signature()
+        loads = read_loads()
+        if loads is None:
+            raise ValueError("the load store could not be read")
+        report["loads"] = len(loads)
+        load_search_index.sync(loads, signature)
+        report["indexed"] = len(load_search_index)
+        if board_snapshots is not None:
+            # Maps the published snapshot, or publishes one if the board changed while no worker ran
+            board_snapshots.refresh_if_stale(signature, lambda: loads)
+        else:
+            load_filter_index.sync(loads, signature)
+        if load_change_log is not None:
+            # Board edits made while no worker was running become ordinary changes in the feed
+            load_change_log.refresh_if_stale(signature, lambda: loads)
+    except Exception as e:
+        logger.error(f"Warm-up could not load the load board: {e}", exc_info=True)
+        loads = []
+
+    if settings.WARMUP_GEOCODE_LIMIT > 0:
+        for city in _distinct_cities(loads, settings.WARMUP_GEOCODE_LIMIT):
+            try:
+                if get_coordinates(city).get("status"):
+                    report["geocoded"] += 1
+                else:
+                    report["geocode_failures"] += 1
+            except Exception as e:
+                report["geocode_failures"] += 1
+                logger.warning(f"Warm-up geocode failed for '{city}': {e}")
+
+    elapsed = time.perf_counter() - started
+    STARTUP_WARMUP_SECONDS.set(elapsed)
+    report["seconds"] = round(elapsed, 3)
+    logger.info(f"Warm-up finished: {report}")
+    return report
@@ -0,0 +1,120 @@
+# logistics_ai_project/app/data/archive.py
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.config import settings, store_path
+from app.core.cache import WALConnections
+
+logger = logging.getLogger(__name__)
+
+_LOAD_NUMBER = re.compile(r"[A-Za-z]*(\d+)")
+
+
+def _load_number(load_id: Any) -> Optional[int]:
+    match = _LOAD_NUMBER.match(str(load_id or ""))
+    return int(match.group(1)) if match else None
+
+
+class LoadArchive:
+    """
+    Loads taken off the board (expired, closed or bulk-deleted), kept in SQLite
+    so history stays queryable without sitting in the hot JSON store. Each
+    archived version is stored once: re-archiving an identical load (e.g. two
+    workers sweeping at the same time) is a no-op.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connections = WALConnections(path)
+        conn = self._connections.get()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS archived_loads ("
+            " load_id TEXT NOT NULL, fingerprint TEXT NOT NULL,"
+            " load_number INTEGER, status TEXT, expected_delivery_date TEXT,"
+            " reason TEXT NOT NULL, archived_at REAL NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (load_id, fingerprint))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS archived_loads_archived_at ON archived_loads (archived_at)")
+
+    def add(self, loads: Iterable[Dict[str, Any]], reason: str) -> int:
+        """Archives `loads` in one transaction. Returns how many were new to the archive."""
+        now = time.time()
+        rows = []
+        for load in loads:
+            data = json.dumps(load, ensure_ascii=False, sort_keys=True, default=str)
+            rows.append((
+                str(load.get("load_id") or ""),
+                hashlib.sha1(data.encode("utf-8")).hexdigest(),
+                _load_number(load.get("load_id")),
+                str(load.get("status") or ""),
+                str(load.get("expected_delivery_date") or ""),
+                reason,
+                now,
+                data,
+            ))
+        if not rows:
+            return 0
+        conn = self._connections.get()
+        before = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO archived_loads VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - before
+
+    def query(
+        self,
+        load_id: Optional[str] = None,
+        status: Optional[str] = None,
+        reason: Optional[str] = None,
+        archived_after: Optional[float] = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """Archived loads, newest first, each with its archive reason and time."""
+        clauses, params = [], []
+        if load_id:
+            clauses.append("load_id = ?")
+            params.append(load_id)
+        if status:
+            clauses.append("lower(status) = lower(?)")
+            params.append(status)
+        if reason:
+            clauses.append("reason = ?")
+            params.append(reason)
+        if archived_after is not None:
+            clauses.append("archived_at >= ?")
+            params.append(archived_after)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connections.get().execute(
+            f"SELECT data, reason, archived_at FROM archived_loads{where} ORDER BY archived_at DESC, load_id LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+        return [{"load": json.loads(data), "reason": row_reason, "archived_at": archived_at} for data, row_reason, archived_at in rows]
+
+    def count(self) -> int:
+        return self._connections.get().execute("SELECT COUNT(*) FROM archived_loads").fetchone()[0]
+
+    def max_load_number(self) -> Optional[int]:
+        """Highest numeric load ID ever archived, so new IDs never reuse an archived one."""
+        return self._connections.get().execute("SELECT MAX(load_number) FROM archived_loads").fetchone()[0]
+
+
+def _open_archive() -> Optional[LoadArchive]:
+    path = store_path(settings.LOAD_ARCHIVE_PATH, "loads_archive.sqlite3")
+    try:
+        return LoadArchive(path)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Could not open the load archive at {path} ({e}). Sweeps and archiving bulk deletes will remove nothing until it can be opened.")
+        return None
+
+
+load_archive = _open_archive()
@@ -0,0 +1,326 @@
+# logistics_ai_project/app/data/changes.py
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings, store_path
+from app.core.cache import WALConnections
+from app.core.concurrency import run_blocking_io
+from app.core.metrics import LOAD_CHANGES
+from app.data.data_loader import loads_file_signature, loads_write_lock, read_loads, register_loads_listener
+
+logger = logging.getLogger(__name__)
+
+
+_change_source: contextvars.ContextVar[str] = contextvars.ContextVar("load_change_source", default="store")
+
+
+@contextmanager
+def change_source(source: str) -> Iterator[None]:
+    """Labels the load store writes made inside the block (add_load, excel_upload, delete, expiry, ...)."""
+    token = _change_source.set(source)
+    try:
+        yield
+    finally:
+        _change_source.reset(token)
+
+
+def _keyed(loads: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """Loads by load_id; rows without one (or duplicates) get positional keys, as in LoadFilterIndex."""
+    keyed: Dict[str, Dict[str, Any]] = {}
+    occurrences: Dict[str, int] = defaultdict(int)
+    flat = [load for entry in loads for load in (entry if isinstance(entry, list) else [entry])]
+    for position, load in enumerate(flat):
+        if not isinstance(load, dict):
+            continue
+        load_id = load.get("load_id")
+        base = str(load_id) if load_id else f"@{position}"
+        occurrences[base] += 1
+        keyed[base if occurrences[base] == 1 else f"{base}#{occurrences[base]}"] = load
+    return keyed
+
+
+def _serialize(load: Dict[str, Any]) -> Tuple[str, str]:
+    data = json.dumps(load, ensure_ascii=False, sort_keys=True, default=str)
+    return data, hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class _Wakeup:
+    """
+    Wakes long-polling requests on the event loop: at once for commits in this
+    worker (from whichever thread made them), and through one shared poller for
+    other writers, so any number of waiting clients costs one `check` per
+    CHANGE_FEED_POLL_S per worker.
+    """
+
+    def __init__(self, check: Callable[[], int]):
+        self._check = check  # blocking; records unrecorded store writes and returns the latest version
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiters: Dict[asyncio.Future, int] = {}  # waiter -> latest version it has seen
+        self._poller: Optional[asyncio.Task] = None
+
+    async def wait(self, timeout_s: float, seen_version: int):
+        """Returns when a version after `seen_version` may exist, or after `timeout_s`."""
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        waiter = loop.create_future()
+        self._waiters[waiter] = seen_version
+        if self._poller is None or self._poller.done() or self._poller.get_loop() is not loop:
+            self._poller = loop.create_task(self._poll())
+        try:
+            await asyncio.wait_for(waiter, timeout_s)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters.pop(waiter, None)
+
+    async def _poll(self):
+        while self._waiters:
+            await asyncio.sleep(settings.CHANGE_FEED_POLL_S)
+            if not self._waiters:
+                break
+            try:
+                latest = await run_blocking_io(self._check)
+            except Exception as e:
+                logger.warning(f"Change feed poll failed ({e}).")
+                continue
+            for waiter, seen_version in list(self._waiters.items()):
+                if latest > seen_version and not waiter.done():
+                    waiter.set_result(None)
+
+    def notify(self):
+        loop = self._loop
+        if loop is not None and self._waiters and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake_all)
+
+    def _wake_all(self):
+        for waiter in list(self._waiters):
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class LoadChangeLog:
+    """
+    Append-only log of load add/update/delete events with a monotonically
+    increasing version, in SQLite so every worker appends to and reads one log.
+    Changes are found by diffing each saved board against the last recorded one
+    (kept as per-load fingerprints), so every writer is covered without touching
+    its code; the in-memory copy of the last board keeps a save at O(changes)
+    hashing while no other worker has written in between. Only the newest
+    `retention` changes are kept; clients further behind must re-sync in full.
+    """
+
+    def __init__(self, path: str, retention: int):
+        self.path = path
+        self.retention = retention
+        self.wakeup = _Wakeup(self._poll_store)
+        self._connections = WALConnections(path)
+        self._lock = threading.Lock()
+        self._mirror: Optional[Dict[str, Dict[str, Any]]] = None
+        self._mirror_version: Optional[int] = None
+        self._seen_signature: Optional[Tuple[int, int]] = None  # store signature last known to be recorded
+        conn = self._connections.get()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS load_changes ("
+            " version INTEGER PRIMARY KEY AUTOINCREMENT, load_id TEXT NOT NULL, op TEXT NOT NULL,"
+            " data TEXT, source TEXT NOT NULL, changed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS load_state (load_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS load_feed_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
+
+    @staticmethod
+    def _latest_version(conn: sqlite3.Connection) -> int:
+        # AUTOINCREMENT keeps the high-water mark even after old changes are pruned
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'load_changes'").fetchone()
+        return row[0] if row else 0
+
+    def latest_version(self) -> int:
+        return self._latest_version(self._connections.get())
+
+    def record(self, loads: List[Any], signature: Optional[Tuple[int, int]] = None, source: Optional[str] = None) -> int:
+        """Appends one change per load added, changed or removed since the last recorded board. Returns how many."""
+        source = source or _change_source.get()
+        current = _keyed(loads)
+        now = time.time()
+        conn = self._connections.get()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                latest = self._latest_version(conn)
+                if latest == 0:
+                    # The first record lists whatever is already on the board; those are not postings
+                    conn.execute("INSERT OR IGNORE INTO load_feed_meta (key, value) VALUES ('first_sync_at', ?)", (json.dumps(now),))
+                changes: List[Tuple[str, str, Optional[str], Optional[str]]] = []  # (load_id, op, data, fingerprint)
+                if self._mirror is not None and self._mirror_version == latest:
+                    # Nobody else wrote since our last record: compare dicts, hash only what changed
+                    previous = self._mirror
+                    for key, load in current.items():
+                        before = previous.get(key)
+                        if before != load:
+                            data, fingerprint = _serialize(load)
+                            changes.append((key, "add" if before is None else "update", data, fingerprint))
+                else:
+                    fingerprints = dict(conn.execute("SELECT load_id, fingerprint FROM load_state"))
+                    previous = fingerprints
+                    for key, load in current.items():
+                        data, fingerprint = _serialize(load)
+                        if fingerprints.get(key) != fingerprint:
+                            changes.append((key, "add" if key not in fingerprints else "update", data, fingerprint))
+                changes.extend((key, "delete", None, None) for key in previous if key not in current)
+
+                conn.executemany(
+                    "INSERT INTO load_changes (load_id, op, data, source, changed_at) VALUES (?, ?, ?, ?, ?)",
+                    [(key, op, data, source, now) for key, op, data, _ in changes],
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO load_state (load_id, fingerprint) VALUES (?, ?)",
+                    [(key, fingerprint) for key, op, _, fingerprint in changes if op != "delete"],
+                )
+                conn.executemany("DELETE FROM load_state WHERE load_id = ?", [(key,) for key, op, _, _ in changes if op == "delete"])
+                if signature is not None:
+                    conn.execute("INSERT OR REPLACE INTO load_feed_meta (key, value) VALUES ('signature', ?)", (json.dumps(signature),))
+                latest = self._latest_version(conn)
+                if changes and self.retention > 0:
+                    conn.execute("DELETE FROM load_changes WHERE version <= ?", (latest - self.retention,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                self._mirror = None
+                raise
+            self._mirror = {key: dict(load) for key, load in current.items()}
+            self._mirror_version = latest
+            if signature is not None:
+                self._seen_signature = signature
+
+        if changes:
+            ops: Dict[str, int] = defaultdict(int)
+            for _, op, _, _ in changes:
+                ops[op] += 1
+            for op, count in ops.items():
+                LOAD_CHANGES.labels(op, source).inc(count)
+            self.wakeup.notify()
+        return len(changes)
+
+    def refresh_if_stale(self, current_signature: Optional[Tuple[int, int]], loader: Callable[[], Optional[List[Any]]]):
+        """
+        Records the store's changes if the file was written by something that did not
+        record them (e.g. a hand edit). Records nothing when `loader` returns None (the
+        store could not be read): diffing that as an empty board would log a delete of
+        every load.
+        """
+        row = self._connections.get().execute("SELECT value FROM load_feed_meta WHERE key = 'signature'").fetchone()
+        recorded = tuple(json.loads(row[0])) if row else None
+        if current_signature is not None and current_signature == recorded:
+            self._seen_signature = current_signature
+            return
+        loads = loader()
+        if loads is None:
+            logger.warning("The load store could not be read; its changes will be recorded on the next check.")
+            return
+        self.record(loads, current_signature, source="store")
+
+    def sync_store(self):
+        """
+        Records store writes the log has not seen (other writers, hand edits). A
+        file this log already saw recorded is skipped without the store lock or
+        SQLite; otherwise the check holds the lock, so it never reads a file this
+        worker is halfway through writing. Blocking; run it in the I/O executor.
+        """
+        signature = loads_file_signature()
+        if signature is not None and signature == self._seen_signature:
+            return
+        with loads_write_lock:
+            self.refresh_if_stale(loads_file_signature(), read_loads)
+
+    def _poll_store(self) -> int:
+        self.sync_store()
+        return self.latest_version()
+
+    def first_added(self) -> Dict[str, float]:
+        """
+        When each load was first added, for loads whose add is still in the log.
+        Loads the log found already on the board at its first record are left out.
+        """
+        conn = self._connections.get()
+        row = conn.execute("SELECT value FROM load_feed_meta WHERE key = 'first_sync_at'").fetchone()
+        if row is None:  # logs started before the marker existed: their first change is the first sync
+            row = conn.execute("SELECT changed_at FROM load_changes WHERE version = 1").fetchone()
+        first_sync_at = (json.loads(row[0]) if isinstance(row[0], str) else row[0]) if row else None
+        rows = conn.execute("SELECT load_id, MIN(changed_at) FROM load_changes WHERE op = 'add' GROUP BY load_id")
+        return {load_id: added_at for load_id, added_at in rows if added_at != first_sync_at}
+
+    def since(self, version: int, limit: int) -> Dict[str, Any]:
+        """
+        Changes after `version`, oldest first, at most `limit`. 'version' in the
+        result is the one to ask from next time. 'reset_required' means changes
+        after `version` were already pruned (or `version` is from another log):
+        re-download the board and continue from the version returned with it.
+        """
+        conn = self._connections.get()
+        latest = self._latest_version(conn)
+        oldest = conn.execute("SELECT MIN(version) FROM load_changes").fetchone()[0]
+        if version > latest or (version < latest and (oldest is None or version < oldest - 1)):
+            return {"version": latest, "changes": [], "more": False, "reset_required": True}
+
+        rows = conn.execute(
+            "SELECT version, load_id, op, data, source, changed_at FROM load_changes WHERE version > ? ORDER BY version LIMIT ?",
+            (version, limit + 1),
+        ).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        changes = []
+        for change_version, load_id, op, data, source, changed_at in rows:
+            change = {"version": change_version, "op": op, "load_id": load_id, "source": source, "changed_at": changed_at}
+            if data is not None:
+                change["load"] = json.loads(data)
+            changes.append(change)
+        return {"version": rows[-1][0] if rows else max(version, latest), "changes": changes, "more": more, "reset_required": False}
+
+
+def _open_change_log() -> Optional[LoadChangeLog]:
+    if not settings.CHANGE_FEED_ENABLED:
+        return None
+    path = store_path(settings.CHANGE_FEED_PATH, "load_changes.sqlite3")
+    try:
+        return LoadChangeLog(path, settings.CHANGE_FEED_RETENTION)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Could not open the load change log at {path} ({e}). The change feed is disabled.")
+        return None
+
+
+load_change_log = _open_change_log()
+
+
+def _on_loads_saved(loads: List[Dict[str, Any]]):
+    load_change_log.record(loads, loads_file_signature())
+
+
+if load_change_log is not None:
+    register_loads_listener(_on_loads_saved)
+
+
+def sync_change_log():
+    """Records store writes the log has not seen; see LoadChangeLog.sync_store. Blocking."""
+    if load_change_log is not None:
+        load_change_log.sync_store()
+
+
+def current_feed_version() -> Optional[int]:
+    """
+    The feed version a full board read corresponds to, after recording any
+    unrecorded store changes; None when the feed is disabled. Read it before the
+    board: a change landing in between is then replayed, never skipped.
+    Blocking; run it in the I/O executor.
+    """
+    if load_change_log is None:
+        return None
+    sync_change_log()
+    return load_change_log.latest_version()
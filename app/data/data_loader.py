@@ -3,42 +3,133 @@
 import json
 import os
 import logging
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+from app.config import settings
+from app.core.metrics import STORE_IO_DURATION
+from app.core.timing import timed
 
 logger = logging.getLogger(__name__)
 
 # Define base path for data files relative to this file's location
 DATA_DIR = os.path.dirname(os.path.abspath(__file__))
-DUMMY_LOADS_FILE = os.path.join(DATA_DIR, "dummy_loads.json")
-DUMMY_FEEDBACK_FILE = os.path.join(DATA_DIR, "dummy_feedback_log.json")
+DUMMY_LOADS_FILE = settings.LOADS_FILE or os.path.join(DATA_DIR, "dummy_loads.json")
+DUMMY_FEEDBACK_FILE = settings.FEEDBACK_FILE or os.path.join(DATA_DIR, "dummy_feedback_log.json")
+DUMMY_TRUCKS_FILE = settings.TRUCKS_FILE or os.path.join(DATA_DIR, "dummy_trucks.json")
 
+# Serializes read-modify-write cycles on the JSON files. Routes run this work in
+# worker threads, so without it two concurrent writers could drop each other's changes.
+loads_write_lock = threading.RLock()
+feedback_write_lock = threading.RLock()
+trucks_write_lock = threading.RLock()
 
-def get_dummy_loads() -> List[Dict[str, Any]]:
-    """Loads dummy load data from a JSON file."""
+# Callbacks notified with the full list of loads after every successful save,
+# so in-memory structures (search index, etc.) can update incrementally.
+_loads_listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+
+def register_loads_listener(listener: Callable[[List[Dict[str, Any]]], None]):
+    """Registers a callback invoked with the saved loads after each save_loads() call."""
+    _loads_listeners.append(listener)
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Returns (mtime_ns, size) of `path`, or None if it is missing.
+    Cheap way for caches to notice that another process rewrote the file.
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result.st_mtime_ns, stat_result.st_size
+
+
+def loads_file_signature() -> Optional[Tuple[int, int]]:
+    return file_signature(DUMMY_LOADS_FILE)
+
+
+def read_loads() -> Optional[List[Dict[str, Any]]]:
+    """
+    The loads in the JSON file: [] when there is no file, None when it cannot be
+    read or parsed. Anything that diffs the board against an earlier one must
+    skip a None rather than treat the board as empty.
+    """
     try:
         if os.path.exists(DUMMY_LOADS_FILE):
-            with open(DUMMY_LOADS_FILE, 'r', encoding='utf-8') as f:
+            with timed("loads_read", STORE_IO_DURATION.labels("loads", "read")), open(DUMMY_LOADS_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 if isinstance(data, list):
                     return data
-                logger.warning(f"{DUMMY_LOADS_FILE} does not contain a list. Returning empty list.")
-        else:
-            logger.warning(f"Data file {DUMMY_LOADS_FILE} not found.")
+                logger.warning(f"{DUMMY_LOADS_FILE} does not contain a list.")
+                return None
+        logger.warning(f"Data file {DUMMY_LOADS_FILE} not found.")
+        return []
     except json.JSONDecodeError:
         logger.error(f"Error decoding JSON from {DUMMY_LOADS_FILE}")
     except Exception as e:
         logger.error(f"Error reading {DUMMY_LOADS_FILE}: {e}")
-    return []
+    return None
 
 
-def save_loads(loads_to_save: List[Dict[str, Any]]):
-    """Saves the entire list of loads to the JSON file, overwriting previous content."""
+def get_dummy_loads() -> List[Dict[str, Any]]:
+    """Loads dummy load data from a JSON file (an empty list when it cannot be read)."""
+    loads = read_loads()
+    return loads if loads is not None else []
+
+
+def save_loads(loads_to_save: List[Dict[str, Any]]) -> bool:
+    """
+    Saves the entire list of loads to the JSON file, overwriting previous content. Returns False if the write failed.
+    Written to a temporary file and renamed over the store, so other workers (which do not share
+    loads_write_lock) read either the old board or the new one, never a half-written file.
+    """
+    temporary_path = f"{DUMMY_LOADS_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        with open(DUMMY_LOADS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(loads_to_save, f, indent=4, ensure_ascii=False)
+        with timed("loads_write", STORE_IO_DURATION.labels("loads", "write")):
+            with open(temporary_path, 'w', encoding='utf-8') as f:
+                json.dump(loads_to_save, f, indent=4, ensure_ascii=False)
+            os.replace(temporary_path, DUMMY_LOADS_FILE)
         logger.info(f"All loads saved to {DUMMY_LOADS_FILE}")
     except Exception as e:
         logger.error(f"Error saving loads to {DUMMY_LOADS_FILE}: {e}")
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        return False
+
+    for listener in _loads_listeners:
+        try:
+            listener(loads_to_save)
+        except Exception as e:
+            logger.error(f"Loads listener {getattr(listener, '__name__', listener)} failed: {e}", exc_info=True)
+    return True
+
+
+def remove_loads(
+    should_remove: Callable[[Dict[str, Any]], bool],
+    before_save: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Removes every load for which `should_remove` is true in a single
+    read-modify-write of the store, and returns the removed loads.
+    `before_save` receives the removed loads before the file is rewritten
+    (e.g. to archive them); if it raises, nothing is removed.
+    Nested lists in the file are flattened on save.
+    """
+    with loads_write_lock:
+        current_loads = [load for entry in get_dummy_loads() for load in (entry if isinstance(entry, list) else [entry])]
+        removed = [load for load in current_loads if isinstance(load, dict) and should_remove(load)]
+        if not removed:
+            return []
+        if before_save is not None:
+            before_save(removed)
+        removed_ids = {id(load) for load in removed}
+        if not save_loads([load for load in current_loads if id(load) not in removed_ids]):
+            raise OSError(f"Could not save loads to {DUMMY_LOADS_FILE}")
+    return removed
 
 
 def delete_load_by_id_from_file(load_id: str) -> bool:
@@ -46,31 +137,32 @@ def delete_load_by_id_from_file(load_id: str) -> bool:
     Deletes a load from the dummy_loads.json file by its ID.
     Returns True if the load was found and deleted, False otherwise.
     """
-    current_loads = get_dummy_loads()
-    if not current_loads:
-        logger.warning("Load list is empty or could not be loaded.")
-        return False
-
-    logger.debug(f"Attempting to delete load with ID: {load_id}")
-    logger.debug(f"Available load IDs: {[load.get('load_id') for load in current_loads]}")
-
-    # ✅ FIX: Use "load_id" instead of "Load_id"
-    updated_loads = [load for load in current_loads if load.get("load_id") != load_id]
-
-    if len(updated_loads) < len(current_loads):
-        save_loads(updated_loads)
-        logger.info(f"Load with ID '{load_id}' deleted from {DUMMY_LOADS_FILE}.")
-        return True
-    else:
-        logger.warning(f"Load with ID '{load_id}' not found. No changes made.")
-        return False
+    with loads_write_lock:
+        current_loads = get_dummy_loads()
+        if not current_loads:
+            logger.warning("Load list is empty or could not be loaded.")
+            return False
+
+        logger.debug(f"Attempting to delete load with ID: {load_id}")
+        logger.debug(f"Available load IDs: {[load.get('load_id') for load in current_loads]}")
+
+        # ✅ FIX: Use "load_id" instead of "Load_id"
+        updated_loads = [load for load in current_loads if load.get("load_id") != load_id]
+
+        if len(updated_loads) < len(current_loads):
+            save_loads(updated_loads)
+            logger.info(f"Load with ID '{load_id}' deleted from {DUMMY_LOADS_FILE}.")
+            return True
+        else:
+            logger.warning(f"Load with ID '{load_id}' not found. No changes made.")
+            return False
 
 
 def get_dummy_feedback() -> List[Dict[str, Any]]:
     """Loads dummy feedback data from a JSON file."""
     try:
         if os.path.exists(DUMMY_FEEDBACK_FILE):
-            with open(DUMMY_FEEDBACK_FILE, 'r', encoding='utf-8') as f:
+            with timed("feedback_read", STORE_IO_DURATION.labels("feedback", "read")), open(DUMMY_FEEDBACK_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 if isinstance(data, list):
                     return data
@@ -86,13 +178,39 @@ def get_dummy_feedback() -> List[Dict[str, Any]]:
 
 def save_dummy_feedback(feedback_entry: Dict[str, Any]):
     """Appends a feedback entry to the JSON file."""
-    current_feedback = get_dummy_feedback()
-    current_feedback.append(feedback_entry)
+    with feedback_write_lock:
+        current_feedback = get_dummy_feedback()
+        current_feedback.append(feedback_entry)
+        try:
+            with timed("feedback_write", STORE_IO_DURATION.labels("feedback", "write")), open(DUMMY_FEEDBACK_FILE, 'w', encoding='utf-8') as f:
+                json.dump(current_feedback, f, indent=4, ensure_ascii=False)
+            logger.info(f"Feedback entry saved to {DUMMY_FEEDBACK_FILE}")
+        except Exception as e:
+            logger.error(f"Error saving feedback to {DUMMY_FEEDBACK_FILE}: {e}")
+
+
+def get_registered_trucks() -> List[Dict[str, Any]]:
+    """Loads the truck registry (one dict per truck_id) from its JSON file."""
     try:
-        with open(DUMMY_FEEDBACK_FILE, 'w', encoding='utf-8') as f:
-            json.dump(current_feedback, f, indent=4, ensure_ascii=False)
-        logger.info(f"Feedback entry saved to {DUMMY_FEEDBACK_FILE}")
+        if os.path.exists(DUMMY_TRUCKS_FILE):
+            with timed("trucks_read", STORE_IO_DURATION.labels("trucks", "read")), open(DUMMY_TRUCKS_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                if isinstance(data, list):
+                    return data
+                logger.warning(f"{DUMMY_TRUCKS_FILE} does not contain a list.")
+    except json.JSONDecodeError:
+        logger.error(f"Error decoding JSON from {DUMMY_TRUCKS_FILE}")
     except Exception as e:
-        logger.error(f"Error saving feedback to {DUMMY_FEEDBACK_FILE}: {e}")
+        logger.error(f"Error reading {DUMMY_TRUCKS_FILE}: {e}")
+    return []
 
 
+def save_registered_trucks(trucks: List[Dict[str, Any]]) -> bool:
+    """Overwrites the truck registry file. Returns False if the write failed."""
+    try:
+        with timed("trucks_write", STORE_IO_DURATION.labels("trucks", "write")), open(DUMMY_TRUCKS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(trucks, f, indent=4, ensure_ascii=False)
+        return True
+    except Exception as e:
+        logger.error(f"Error saving trucks to {DUMMY_TRUCKS_FILE}: {e}")
+        return False
@@ -0,0 +1,427 @@
+# logistics_ai_project/app/data/snapshot.py
+import glob
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings, store_path
+from app.core.deadlines import parse_due_date
+from app.core.metrics import BOARD_SNAPSHOT_MAPPED_BYTES, BOARD_SNAPSHOT_PUBLISHES
+from app.data.data_loader import loads_file_signature, loads_write_lock, read_loads, register_loads_listener
+
+try:
+    import orjson
+except ImportError:  # optional speed-up for encoding and decoding loads; falls back to the stdlib
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"LBSNAP02"
+_HEADER = struct.Struct("<8sI")  # magic, length of the JSON table of contents that follows
+_CURRENT = "CURRENT"  # holds the file name of the newest snapshot
+_KEEP_NEWEST = 4  # snapshot files kept besides the current one, however young
+_OPEN_GRACE_S = 5  # a worker that just read CURRENT may still be opening an older file until then
+_PRUNE_AFTER_S = 60  # even the newest files go after this long, unless current
+_PUBLISH_WAIT_S = 10  # how long a reader waits for this worker's pending publish before writing its own
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _flat_loads(loads: Iterable[Any]) -> List[Dict[str, Any]]:
+    """The store's loads in order, nested lists flattened and non-dict rows skipped (as get-all-loads returns them)."""
+    return [load for entry in loads for load in (entry if isinstance(entry, list) else [entry]) if isinstance(load, dict)]
+
+
+def _encode_load(load: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(load, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(load, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def write_board_snapshot(path: str, loads: Iterable[Any], source_signature: Optional[Tuple[int, int]]) -> int:
+    """
+    Writes `loads` to `path` as a columnar snapshot and returns its size. Layout:
+    header, JSON table of contents, then 8-byte aligned sections:
+
+    - weight_tons  float64 per load, NaN when not numeric
+    - due_ordinal  int32 per load, date.toordinal() of expected_delivery_date, 0 when unparseable
+    - status_code  uint32 per load, index into the `statuses` strings
+    - weight_sorted / weight_order  known weights ascending, and the row of each
+    - weight_unknown                rows whose weight is not numeric
+    - due_sorted / due_order        known due ordinals ascending, and the row of each
+    - due_unknown                   rows whose date is unparseable
+    - statuses     distinct raw status values
+    - loads        each load's JSON; the blob is itself a JSON array of the loads
+
+    String columns are a blob plus uint64 offsets: value i is blob[offsets[i]:offsets[i + 1] - 1]
+    (every value is followed by one separator byte). The numeric columns use the same
+    rules as LoadFilterIndex, so filtering on them gives the same candidates, and the
+    sorted ones make its range predicates a bisect here too.
+    """
+    rows = _flat_loads(loads)
+    weights = array("d")
+    due_ordinals = array("i")
+    status_codes = array("I")
+    statuses: Dict[str, int] = {}
+    for load in rows:
+        weight = load.get("weight_tons")
+        weights.append(float(weight) if isinstance(weight, (int, float)) and not isinstance(weight, bool) else math.nan)
+        due = parse_due_date(load.get("expected_delivery_date"))
+        due_ordinals.append(due.toordinal() if due is not None else 0)
+        status_codes.append(statuses.setdefault(str(load.get("status") or ""), len(statuses)))
+
+    def sorted_column(values: array, typecode: str, unknown: Callable[[Any], bool]) -> Tuple[array, array, array]:
+        known_rows = [row for row, value in enumerate(values) if not unknown(value)]
+        known_rows.sort(key=values.__getitem__)  # stable: equal values stay in store order
+        return (
+            array(typecode, [values[row] for row in known_rows]),
+            array("I", known_rows),
+            array("I", [row for row, value in enumerate(values) if unknown(value)]),
+        )
+
+    weight_sorted, weight_order, weight_unknown = sorted_column(weights, "d", math.isnan)
+    due_sorted, due_order, due_unknown = sorted_column(due_ordinals, "i", lambda due: due == 0)
+
+    def string_column(values: List[bytes], prefix: bytes, separator: bytes, suffix: bytes, empty: bytes) -> Tuple[List[bytes], int, array]:
+        # The blob is written piece by piece rather than joined, so the board is not held twice
+        offsets = array("Q", [len(prefix)])
+        for value in values:
+            offsets.append(offsets[-1] + len(value) + 1)
+        if not values:
+            return [empty], len(empty), offsets
+        pieces = [prefix]
+        for value in values:
+            pieces += (value, separator)
+        pieces[-1] = suffix
+        return pieces, offsets[-1], offsets
+
+    load_column = string_column([_encode_load(load) for load in rows], b"[", b",", b"]", b"[]")
+    status_column = string_column([status.encode("utf-8") for status in statuses], b"", b"\0", b"\0", b"")
+
+    sections: List[List[bytes]] = []
+    toc: Dict[str, Any] = {
+        "rows": len(rows),
+        "byteorder": sys.byteorder,
+        "source_signature": list(source_signature) if source_signature is not None else None,
+        "published_at": time.time(),
+        "columns": {},
+        "strings": {},
+    }
+    position = 0
+
+    def add_section(pieces: List[bytes], size: int) -> int:
+        nonlocal position
+        offset = position
+        position = _aligned(position + size)
+        sections.append(pieces + [b"\0" * (position - offset - size)])
+        return offset
+
+    for name, column in (
+        ("weight_tons", weights), ("due_ordinal", due_ordinals), ("status_code", status_codes),
+        ("weight_sorted", weight_sorted), ("weight_order", weight_order), ("weight_unknown", weight_unknown),
+        ("due_sorted", due_sorted), ("due_order", due_order), ("due_unknown", due_unknown),
+    ):
+        data = column.tobytes()
+        toc["columns"][name] = {"type": column.typecode, "offset": add_section([data], len(data)), "count": len(column)}
+    for name, (pieces, size, offsets) in (("statuses", status_column), ("loads", load_column)):
+        data = offsets.tobytes()
+        toc["strings"][name] = {
+            "offsets": add_section([data], len(data)),
+            "count": len(offsets) - 1,
+            "data": add_section(pieces, size),
+            "size": size,
+        }
+
+    toc_bytes = json.dumps(toc).encode("utf-8")
+    header = _HEADER.pack(_MAGIC, len(toc_bytes)) + toc_bytes
+    header += b"\0" * (_aligned(len(header)) - len(header))
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(header)
+        for pieces in sections:
+            f.writelines(pieces)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+    return len(header) + position
+
+
+class BoardSnapshot:
+    """
+    Read-only, memory-mapped view of one published snapshot. Columns are
+    memoryviews straight over the mapping, so nothing is copied or parsed until a
+    load is asked for, and every worker mapping the same file shares its pages.
+    Immutable: when the board changes a new snapshot replaces this one, and
+    requests still holding this one keep reading it until they finish.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, toc_length = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a board snapshot")
+        toc = json.loads(bytes(view[_HEADER.size:_HEADER.size + toc_length]))
+        if toc["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {toc['byteorder']}-endian machine")
+        base = _aligned(_HEADER.size + toc_length)
+        self.size = len(self._mmap)
+        self.rows: int = toc["rows"]
+        self.source_signature: Optional[Tuple[int, int]] = tuple(toc["source_signature"]) if toc["source_signature"] is not None else None
+        self.published_at: float = toc["published_at"]
+        self._columns: Dict[str, memoryview] = {}
+        for name, spec in toc["columns"].items():
+            start = base + spec["offset"]
+            self._columns[name] = view[start:start + spec["count"] * array(spec["type"]).itemsize].cast(spec["type"])
+        self._strings: Dict[str, Tuple[memoryview, memoryview]] = {}
+        for name, spec in toc["strings"].items():
+            start = base + spec["offsets"]
+            offsets = view[start:start + (spec["count"] + 1) * 8].cast("Q")
+            data = view[base + spec["data"]:base + spec["data"] + spec["size"]]
+            self._strings[name] = (offsets, data)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> memoryview:
+        """A numeric column (weight_tons, due_ordinal, status_code, weight_sorted, ...), indexable like a list."""
+        return self._columns[name]
+
+    def raw(self, name: str, index: int) -> memoryview:
+        offsets, data = self._strings[name]
+        return data[offsets[index]:offsets[index + 1] - 1]
+
+    def strings(self, name: str) -> List[str]:
+        offsets, _ = self._strings[name]
+        return [bytes(self.raw(name, index)).decode("utf-8") for index in range(len(offsets) - 1)]
+
+    def load(self, index: int) -> Dict[str, Any]:
+        """The load at `index`, decoded from the mapping (a fresh dict the caller may modify)."""
+        raw = self.raw("loads", index)
+        return orjson.loads(raw) if orjson is not None else json.loads(bytes(raw))
+
+    def loads(self, indices: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        return [self.load(index) for index in (range(self.rows) if indices is None else indices)]
+
+    def loads_json(self) -> bytes:
+        """The whole board as a JSON array, copied out of the mapping without being decoded."""
+        return bytes(self._strings["loads"][1])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "file": self.name,
+            "loads": self.rows,
+            "bytes": self.size,
+            "statuses": len(self._strings["statuses"][0]) - 1,
+            "source_signature": self.source_signature,
+            "published_at": self.published_at,
+        }
+
+
+class BoardSnapshotStore:
+    """
+    The directory snapshots are published to. Each publish writes a new immutable
+    file and then repoints CURRENT at it (both atomic renames); readers compare the
+    store's file signature with their mapped snapshot's and map the CURRENT one
+    when it differs. Store saves hand their board to one publisher thread per
+    worker, so the save does not wait for the write and a burst of saves publishes
+    only the newest board. Old files are removed once no worker should still be
+    opening them.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._current: Optional[BoardSnapshot] = None
+        self._queue = threading.Condition()
+        self._pending: Optional[Tuple[List[Any], Optional[Tuple[int, int]]]] = None
+        self._publishing: Optional[Tuple[int, int]] = None  # signature the publisher thread is writing
+        self._publisher: Optional[threading.Thread] = None
+
+    def _swap(self, snapshot: BoardSnapshot):
+        # Requests holding the previous snapshot keep it mapped until they drop it
+        self._current = snapshot
+        BOARD_SNAPSHOT_MAPPED_BYTES.set(snapshot.size)
+
+    def publish(self, loads: Iterable[Any], source_signature: Optional[Tuple[int, int]], reason: str = "save") -> BoardSnapshot:
+        name = f"board-{time.time_ns()}-{os.getpid()}.snap"
+        path = os.path.join(self.directory, name)
+        write_board_snapshot(path, loads, source_signature)
+        pointer = os.path.join(self.directory, _CURRENT)
+        with open(f"{pointer}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(f"{pointer}.{os.getpid()}.tmp", pointer)
+        BOARD_SNAPSHOT_PUBLISHES.labels(reason).inc()
+
+        snapshot = BoardSnapshot(path)
+        with self._lock:
+            self._swap(snapshot)
+        self._prune(keep=name)
+        return snapshot
+
+    def schedule(self, loads: Iterable[Any], source_signature: Optional[Tuple[int, int]]):
+        """Queues `loads` for the publisher thread and returns at once, replacing any board still queued."""
+        with self._queue:
+            self._pending = (list(loads), source_signature)
+            if self._publisher is None or not self._publisher.is_alive():
+                self._publisher = threading.Thread(target=self._publish_queued, name="board-snapshot-publisher", daemon=True)
+                self._publisher.start()
+            self._queue.notify_all()
+
+    def _publish_queued(self):
+        while True:
+            with self._queue:
+                while self._pending is None:
+                    self._queue.wait()
+                (loads, signature), self._pending = self._pending, None
+                self._publishing = signature
+            try:
+                self.publish(loads, signature)
+            except Exception as e:
+                logger.error(f"Could not publish a board snapshot ({e}). Readers will publish one when they need it.")
+            finally:
+                del loads  # do not hold the last board while idle
+                with self._queue:
+                    self._publishing = None
+                    self._queue.notify_all()
+
+    def wait_for(self, source_signature: Optional[Tuple[int, int]], timeout_s: float) -> Optional[BoardSnapshot]:
+        """
+        current(source_signature), after waiting up to `timeout_s` if this
+        worker's publisher has that board queued or is writing it.
+        """
+        deadline = time.monotonic() + timeout_s
+        with self._queue:
+            while source_signature in (self._publishing, self._pending[1] if self._pending is not None else None):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._queue.wait(remaining)
+        return self.current(source_signature)
+
+    def _prune(self, keep: str):
+        """
+        Removes all but the newest _KEEP_NEWEST files once they are past the open
+        grace period, and any but `keep` after _PRUNE_AFTER_S.
+        """
+        now = time.time()
+        files = []
+        for path in glob.glob(os.path.join(self.directory, "board-*.snap")):
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        files.sort(reverse=True)
+        for rank, (modified, path) in enumerate(files):
+            age = now - modified
+            if os.path.basename(path) == keep or not (age > _PRUNE_AFTER_S or (rank >= _KEEP_NEWEST and age > _OPEN_GRACE_S)):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # gone already, or still mapped on a platform that refuses to delete it
+
+    def current(self, source_signature: Optional[Tuple[int, int]]) -> Optional[BoardSnapshot]:
+        """
+        The published snapshot of the store as of `source_signature`, mapping a
+        newer one if another worker published it. None when nothing published
+        matches (the store was written without publishing, e.g. edited by hand).
+        """
+        snapshot = self._current
+        if snapshot is not None and snapshot.source_signature == source_signature:
+            return snapshot
+        with self._lock:
+            snapshot = self._current
+            try:
+                with open(os.path.join(self.directory, _CURRENT), "r", encoding="utf-8") as f:
+                    name = f.read().strip()
+            except OSError:
+                name = ""
+            if name and (snapshot is None or snapshot.name != name):
+                try:
+                    snapshot = BoardSnapshot(os.path.join(self.directory, name))
+                    self._swap(snapshot)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Could not map board snapshot {name}: {e}")
+        if snapshot is not None and snapshot.source_signature == source_signature:
+            return snapshot
+        return None
+
+    def refresh_if_stale(self, current_signature: Optional[Tuple[int, int]], loader: Callable[[], Optional[List[Any]]]) -> Optional[BoardSnapshot]:
+        """
+        The snapshot for `current_signature`, publishing one from `loader` when none
+        matches. None when `loader` returns None (the store could not be read).
+        """
+        snapshot = self.current(current_signature)
+        if snapshot is None:
+            loads = loader()
+            if loads is None:
+                return None
+            snapshot = self.publish(loads, current_signature, reason="stale")
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._current
+        return {"directory": self.directory, "mapped": snapshot.stats() if snapshot is not None else None}
+
+
+def _open_board_snapshots() -> Optional[BoardSnapshotStore]:
+    if not settings.LOAD_SNAPSHOT_ENABLED:
+        return None
+    directory = store_path(settings.LOAD_SNAPSHOT_DIR, "board_snapshot")
+    try:
+        return BoardSnapshotStore(directory)
+    except OSError as e:
+        logger.error(f"Could not open the board snapshot directory {directory} ({e}). Workers will parse the JSON store.")
+        return None
+
+
+board_snapshots = _open_board_snapshots()
+
+
+def _on_loads_saved(loads: List[Dict[str, Any]]):
+    board_snapshots.schedule(loads, loads_file_signature())
+
+
+if board_snapshots is not None:
+    register_loads_listener(_on_loads_saved)
+
+
+def current_board() -> Optional[BoardSnapshot]:
+    """
+    The memory-mapped snapshot of the current board, publishing one first if the
+    store changed without one (it then parses the JSON store once, for every
+    worker). None when snapshots are disabled or cannot be written; callers then
+    read the JSON store. Blocking; run it in the I/O executor.
+    """
+    if board_snapshots is None:
+        return None
+    try:
+        # A save in this worker is published by its publisher thread; wait for that rather than write a second copy
+        snapshot = board_snapshots.wait_for(loads_file_signature(), _PUBLISH_WAIT_S)
+        if snapshot is None:
+            # Read under the store lock, so a file this worker is halfway through writing is never snapshotted,
+            # but written outside it, so saves are not held up
+            with loads_write_lock:
+                signature, loads = loads_file_signature(), read_loads()
+            if loads is None:
+                raise ValueError("the load store could not be read")
+            snapshot = board_snapshots.current(signature) or board_snapshots.publish(loads, signature, reason="stale")
+        return snapshot
+    except (OSError, ValueError) as e:
+        logger.error(f"Board snapshot unavailable ({e}). Reading the JSON store instead.")
+        return None
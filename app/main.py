@@ -1,21 +1,67 @@
 # logistics_ai_project/app/main.py
+import time
+_import_started = time.perf_counter()  # measures how long the app module tree takes to import
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import uvicorn # For programmatic run, if needed
 
 from app.config import settings
-from app.routers import loads, recommendations, agent, feedback,save_new_load# Import your routers
+from app.core.concurrency import EventLoopLagMonitor, PeriodicJob, run_blocking_io, run_upstream, shutdown_executors
+from app.core.lanes import lane_table
+from app.core.metrics import MetricsMiddleware, STARTUP_IMPORT_SECONDS
+from app.core.responses import FastJSONResponse
+from app.core.timing import ServerTimingMiddleware
+from app.core.warmup import run_warmup
+from app.core.subscriptions import subscription_hub
+from app.core.expiry import sweep_stale_loads
+from app.services.Maps import refresh_stale_lanes
+from app.routers import loads, recommendations, agent, feedback,save_new_load,metrics,admin,subscriptions,trucks# Import your routers
 
 # Configure logging
 logging.basicConfig(level=settings.LOG_LEVEL.upper(),
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+STARTUP_IMPORT_SECONDS.set(time.perf_counter() - _import_started)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lag_monitor = None
+    if settings.EVENT_LOOP_LAG_DEBUG:
+        lag_monitor = EventLoopLagMonitor(threshold_s=settings.EVENT_LOOP_LAG_THRESHOLD_MS / 1000.0)
+        lag_monitor.start()
+    if settings.WARMUP_ON_STARTUP:
+        # Load the board and build indexes before the first request instead of during it
+        await run_blocking_io(run_warmup)
+    lane_refresh = None
+    if lane_table is not None and settings.LANE_REFRESH_INTERVAL_S > 0:
+        # Re-fetch a small batch of old lanes in the background, never on a request
+        lane_refresh = PeriodicJob("lane_refresh", settings.LANE_REFRESH_INTERVAL_S, refresh_stale_lanes, runner=run_upstream)
+        lane_refresh.start()
+    load_sweeper = None
+    if settings.LOAD_SWEEP_INTERVAL_S > 0:
+        # Expired and closed loads leave the board (and go to the archive) on a schedule
+        load_sweeper = PeriodicJob("load_sweep", settings.LOAD_SWEEP_INTERVAL_S, sweep_stale_loads)
+        load_sweeper.start()
+    yield
+    if load_sweeper is not None:
+        await load_sweeper.stop()
+    if lane_refresh is not None:
+        await lane_refresh.stop()
+    await subscription_hub.shutdown()
+    if lag_monitor is not None:
+        await lag_monitor.stop()
+    shutdown_executors()
+
 app = FastAPI(
     title="Logistics AI API",
     description="API for recommending truck loads and providing logistics insights.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse # orjson-backed when available
 )
 
 # CORS Middleware
@@ -27,12 +73,21 @@ app.add_middleware(
     allow_headers=["*"],    # Allows all headers
 )
 
+# Per-endpoint latency histograms (exposed at /metrics)
+app.add_middleware(MetricsMiddleware)
+# Per-request phase breakdown in the Server-Timing header, plus opt-in sampled profiling
+app.add_middleware(ServerTimingMiddleware)
+
 # Include routers
 app.include_router(recommendations.router, prefix="/api/v1/recommendations", tags=["Recommendations"])
 app.include_router(agent.router, prefix="/api/v1/agent", tags=["AI Agent"])
 app.include_router(feedback.router, prefix="/api/v1/feedback", tags=["Feedback"])
 app.include_router(save_new_load.router, prefix="/api/v1/load", tags=["Save New Load"])
 app.include_router(loads.router, prefix="/api/v1/delete-load", tags=["Delete Load"])
+app.include_router(metrics.router, tags=["Metrics"])
+app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
+app.include_router(trucks.router, prefix="/api/v1/trucks", tags=["Trucks"])
+app.include_router(subscriptions.router, prefix="/api/v1/subscriptions", tags=["Subscriptions"])
 
 @app.get("/", tags=["Root"])
 async def read_root():
@@ -1,16 +1,89 @@
 # logistics_ai_project/app/models.py
-from pydantic import BaseModel
+from datetime import date
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 
 class Truck(BaseModel):
-    # truck_id: str
-    location: str # Descriptive location, for display or context
-    # latitude: float
-    # longitude: float
-    capacity: int # Assuming in tons, for example
+    # A registered truck can be referenced by truck_id alone; any field sent here overrides the registry
+    truck_id: Optional[str] = None
+    location: Optional[str] = None # Descriptive location, for display or context
+    # Current GPS fix. When both are given, scoring uses them directly and skips geocoding
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    capacity: Optional[int] = None # Assuming in tons, for example
+
+class TruckUpdate(BaseModel):
+    # Registry upsert / telematics ping; omitted fields keep their registered values
+    location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    capacity: Optional[int] = None
+
+class RegisteredTruck(BaseModel):
+    truck_id: str
+    location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    capacity: Optional[int] = None
+    place_id: Optional[str] = None # canonical place of `location`, when it was geocoded here
+    position_updated_at: Optional[str] = None # UTC ISO timestamp of the last position change
 
 class Feedback(BaseModel):
     truck_id: str
     load_origin: str
     load_destination: str
     ai_score: float
-    action: str # e.g., "accepted", "rejected"
\ No newline at end of file
+    action: str # e.g., "accepted", "rejected"
+
+class DetourInfo(BaseModel):
+    direct_km: float
+    via_km: float
+    extra_km: float
+    extra_min: float
+    fuel_cost: float
+    via_min: Optional[float] = None # driving time truck -> pickup -> drop
+
+class ScoredLoad(BaseModel):
+    load: Dict[str, Any] # The stored load as-is; its columns come from user uploads
+    score: float
+    detour: DetourInfo
+    deadline_slack_h: Optional[float] = None # hours to spare before the delivery date ends, if the load has one
+
+class ChainLeg(BaseModel):
+    kind: str # "deadhead" (driving empty) or "loaded"
+    load_id: Optional[str] = None # set on loaded legs
+    from_: str = Field(..., alias="from")
+    to: str
+    km: float
+    min: float
+    source: str # lane, route, estimate or mock
+
+class LoadChain(BaseModel):
+    load_ids: List[Optional[str]]
+    loads: List[Dict[str, Any]]
+    net_value: float # total_revenue - deadhead_cost
+    total_revenue: float
+    loaded_km: float
+    deadhead_km: float
+    deadhead_min: float
+    deadhead_cost: float
+    exact: bool # False if any leg is still a straight-line estimate
+    legs: List[ChainLeg]
+
+class RecommendationSummary(BaseModel):
+    summary: str
+    fallback: bool # True when the template summary was used instead of the LLM
+    partial: bool = False # True when scoring stopped on its call/time budget before every load was seen
+
+class BulkDeleteRequest(BaseModel):
+    # Loads matching every given criterion are deleted; at least one is required
+    load_ids: Optional[List[str]] = None
+    status: Optional[List[str]] = None
+    due_before: Optional[date] = None # expected_delivery_date strictly before this day
+    archive: bool = True # keep a copy in the load archive
+
+class LoadList(BaseModel):
+    status: bool
+    message: str
+    loads: List[Dict[str, Any]]
+    version: Optional[int] = None # change feed version of this board; pass it as `since` to /load/changes
@@ -0,0 +1,109 @@
+# app/routers/admin.py
+import hmac
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Body, Depends, File, Header, HTTPException, Response, UploadFile, status
+
+from app.config import settings
+from app.core.timing import profiling
+from app.core.admission import admission_gates
+from app.core.concurrency import run_blocking_io
+from app.core.lanes import lane_table
+from app.core.places import place_registry
+from app.data.snapshot import board_snapshots
+from app.core.expiry import sweep_stale_loads
+
+logger = logging.getLogger(__name__)
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(default=None)):
+    """Rejects the call unless it carries the configured admin token. Fails closed: with ADMIN_TOKEN unset every call is rejected."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin endpoints are disabled until ADMIN_TOKEN is configured.")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or missing admin token.")
+
+
+router = APIRouter(dependencies=[Depends(require_admin_token)])
+
+@router.get("/profiling", summary="Show sampled-profiling settings")
+def get_profiling_endpoint() -> Dict[str, Any]:
+    return profiling.as_dict()
+
+@router.put("/profiling", summary="Turn sampled request profiling on or off")
+def set_profiling_endpoint(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    """
+    Expects a JSON payload like: {"sample_every": 50, "interval_ms": 5}
+    `sample_every` of 0 disables profiling; N profiles one request in N.
+    Folded stacks are written to the profiling output directory.
+    """
+    try:
+        sample_every = int(payload.get("sample_every", profiling.sample_every))
+        interval_ms = float(payload.get("interval_ms", profiling.interval_ms))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="'sample_every' must be an integer and 'interval_ms' a number.")
+    if sample_every < 0 or interval_ms <= 0:
+        raise HTTPException(status_code=400, detail="'sample_every' must be >= 0 and 'interval_ms' > 0.")
+
+    profiling.sample_every = sample_every
+    profiling.interval_ms = interval_ms
+    logger.info(f"Sampled profiling updated: every {sample_every} requests, {interval_ms} ms interval.")
+    return profiling.as_dict()
+
+@router.get("/admission", summary="Show admission-control limits, in-flight requests and queue depth per gate")
+def get_admission_endpoint() -> Dict[str, Any]:
+    return {name: gate.as_dict() for name, gate in admission_gates.items()}
+
+def _require_lane_table():
+    if lane_table is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="The lane table is disabled (LANE_TABLE_ENABLED=false).")
+    return lane_table
+
+@router.get("/lanes", summary="Show lane table size and how many lanes are due for refresh")
+async def get_lanes_endpoint() -> Dict[str, Any]:
+    return await run_blocking_io(_require_lane_table().stats)
+
+@router.get("/lanes/export", summary="Download every known lane as CSV")
+async def export_lanes_endpoint():
+    text = await run_blocking_io(_require_lane_table().export_csv)
+    return Response(
+        content=text,
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="lanes.csv"'},
+    )
+
+@router.post("/lanes/import", summary="Bulk-load lane distances from a CSV (e.g. historical trips)")
+async def import_lanes_endpoint(file: UploadFile = File(...)) -> Dict[str, Any]:
+    """
+    CSV columns: origin, destination, distance_m (or distance_km), duration_s
+    (or duration_min), and optionally refreshed_at and source. Rows never
+    overwrite a lane that was refreshed more recently. Bad rows are reported, not fatal.
+    """
+    table = _require_lane_table()
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Lane CSV must be UTF-8 encoded.")
+    header = text.splitlines()[0] if text.strip() else ""
+    if "origin" not in header or "destination" not in header:
+        raise HTTPException(status_code=400, detail="Lane CSV needs a header row with origin and destination columns.")
+    report = await run_blocking_io(table.import_csv, text)
+    logger.info(f"Lane import from {file.filename}: {report['imported']} imported, {report['skipped_older']} skipped, {len(report['errors'])} errors.")
+    return report
+
+@router.get("/places", summary="Show how many canonical places and learned address aliases are known")
+async def get_places_endpoint() -> Dict[str, Any]:
+    if place_registry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Address aliases are disabled (PLACE_ALIASES_ENABLED=false).")
+    return await run_blocking_io(place_registry.stats)
+
+@router.get("/board-snapshot", summary="Show the memory-mapped board snapshot this worker is reading")
+def get_board_snapshot_endpoint() -> Dict[str, Any]:
+    if board_snapshots is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Board snapshots are disabled (LOAD_SNAPSHOT_ENABLED=false).")
+    return board_snapshots.stats()
+
+@router.post("/loads/sweep", summary="Run the expired/closed load sweeper now")
+async def sweep_loads_endpoint() -> Dict[str, Any]:
+    return await run_blocking_io(sweep_stale_loads)
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends
 import logging
 from typing import Dict, Any,List
 
+from app.config import settings
+from app.core.retrieval import select_context_loads
+from app.core.concurrency import run_blocking_io, run_upstream
+from app.core.admission import admission
 from app.services.openai_client import get_openai_agent_answer
 from app.data.data_loader import get_dummy_loads
 
@@ -31,8 +35,8 @@ def flatten_loads_data(raw_data: List[Any]) -> List[Dict[str, Any]]:
             logger.warning(f"Skipping non-dictionary, non-list item in main list: {type(item_or_sublist)}")
     return flattened_list
 
-@router.post("/ask-agent", summary="Ask a question to the logistics AI agent")
-def ask_agent_endpoint(payload: Dict[str, Any] = Body(...)) -> dict:
+@router.post("/ask-agent", summary="Ask a question to the logistics AI agent", dependencies=[Depends(admission("ask_agent"))])
+async def ask_agent_endpoint(payload: Dict[str, Any] = Body(...)) -> dict:
     """
     Asks a logistics question to the AI agent.
     Expects a JSON payload like: {"question": "your question here"}
@@ -42,28 +46,19 @@ def ask_agent_endpoint(payload: Dict[str, Any] = Body(...)) -> dict:
     if not question:
         raise HTTPException(status_code=400, detail="A 'question' field is required in the payload.")
 
-    # Load and flatten data to ensure it's a list of dictionaries
-    raw_loads_from_file = get_dummy_loads()
-    all_available_loads = flatten_loads_data(raw_loads_from_file)
-    
-    logger.debug(f"Number of loads after flattening: {len(all_available_loads)}")
-    if all_available_loads:
-        logger.debug(f"First load item type after flattening: {type(all_available_loads[0])}")
-
-    recent_loads_for_context = all_available_loads[-5:] if all_available_loads else []
-    logger.debug(f"Recent loads for context count: {len(recent_loads_for_context)}")
-
-    context_loads_serializable = []
-    for load in recent_loads_for_context:
-        if isinstance(load, dict):
-            context_loads_serializable.append(dict(load))  # Creates a shallow copy
-        else:
-            logger.warning(f"Skipping non-dictionary item in recent_loads_for_context: {type(load)}")
-
+    # Rank loads by relevance to the question using the in-process search index.
+    # The index only re-reads the loads file when it changed since the last sync.
+    context_loads_serializable = await run_blocking_io(
+        select_context_loads,
+        question,
+        loader=lambda: flatten_loads_data(get_dummy_loads()),
+        max_loads=settings.AGENT_CONTEXT_MAX_LOADS,
+        token_budget=settings.AGENT_CONTEXT_TOKEN_BUDGET,
+    )
     logger.debug(f"Context loads being sent to agent: {context_loads_serializable}")
 
     # Call OpenAI agent without truck_id
-    answer = get_openai_agent_answer(question, context_loads_serializable)
+    answer = await run_upstream(get_openai_agent_answer, question, context_loads_serializable)
 
     if answer is None:
         logger.error(f"Failed to get an answer from the AI agent for question '{question}'. Check OpenAI client logs.")
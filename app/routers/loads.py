@@ -1,8 +1,14 @@
 # app/routers/loads.py
 import logging
-from fastapi import APIRouter, HTTPException, status
-from typing import Dict
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import Any, Dict, Optional
 from app.data import data_loader
+from app.data.archive import load_archive
+from app.data.changes import change_source
+from app.core.concurrency import run_blocking_io
+from app.core.expiry import ArchiveUnavailable, bulk_delete_loads
+from app.models import BulkDeleteRequest
+from app.routers.admin import require_admin_token
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -11,7 +17,8 @@ logger = logging.getLogger(__name__)
 async def delete_load(load_id: str):
     logger.info(f"Delete load endpoint called with ID: {load_id}")
     try:
-        deleted_successfully = data_loader.delete_load_by_id_from_file(load_id)
+        with change_source("delete"):  # copied into the I/O thread with the rest of the context
+            deleted_successfully = await run_blocking_io(data_loader.delete_load_by_id_from_file, load_id)
 
         if deleted_successfully:
             logger.info(f"Load with ID '{load_id}' successfully deleted from file.")
@@ -29,4 +36,43 @@ async def delete_load(load_id: str):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An internal server error occurred during load deletion."
-        )
\ No newline at end of file
+        )
+
+@router.post(
+    "/loads/bulk-delete",
+    summary="Delete many loads in one write, by ID list and/or filter (admin)",
+    dependencies=[Depends(require_admin_token)],
+)
+async def bulk_delete_loads_endpoint(request: BulkDeleteRequest) -> Dict[str, Any]:
+    """
+    Deletes the loads matching every given criterion, e.g.
+    {"load_ids": ["L101", "L102"]} or {"status": ["booked"], "due_before": "2025-07-01"}.
+    Deleted loads are archived unless "archive" is false. A filter can clear the
+    whole board, so like /admin/loads/sweep it needs the X-Admin-Token header.
+    """
+    try:
+        result = await run_blocking_io(
+            bulk_delete_loads, request.load_ids, request.status, request.due_before, request.archive
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ArchiveUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except OSError as e:
+        logger.error(f"Bulk delete failed: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not save the load store.")
+    logger.info(f"Bulk delete removed {result['deleted']} loads.")
+    return result
+
+@router.get("/archive", summary="Query archived (expired, closed or deleted) loads")
+async def get_archived_loads(
+    load_id: Optional[str] = None,
+    load_status: Optional[str] = Query(None, alias="status"),
+    reason: Optional[str] = Query(None, description="expired, closed or bulk_delete"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+) -> Dict[str, Any]:
+    if load_archive is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The load archive is not available.")
+    items = await run_blocking_io(load_archive.query, load_id, load_status, reason, None, limit, offset)
+    return {"count": len(items), "items": items}
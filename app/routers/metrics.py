@@ -0,0 +1,13 @@
+# app/routers/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.core.metrics import REGISTRY, CONTENT_TYPE_LATEST, update_process_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", summary="Prometheus metrics for this worker", include_in_schema=False)
+def metrics_endpoint() -> Response:
+    """Exposes request latency, per-phase timings, upstream call counts and store I/O in Prometheus text format."""
+    update_process_metrics()
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
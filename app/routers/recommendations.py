@@ -1,79 +1,142 @@
 # logistics_ai_project/app/routers/recommendations.py
-from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 import logging
-from typing import List
+from typing import Any, Dict, List, Optional, Union
 
 
-from app.models import Truck
+from app.models import Truck, ScoredLoad, RecommendationSummary, LoadChain
 from app.core.scoring import score_loads
-from app.services import google_location_service
-from app.services.openai_client import get_openai_summary
-from app.data.data_loader import get_dummy_loads
-import os
-load_dotenv()
+from app.core.chains import plan_load_chains
+from app.core.load_index import candidate_loads
+from app.core.budget import CallBudget
+from app.config import settings
+from app.services.openai_client import get_openai_summary, build_fallback_summary
+from app.core.concurrency import run_blocking_io, run_upstream
+from app.core.timing import timed
+from app.core.responses import FastJSONResponse, parse_fields, project
+from app.core.admission import admission
+from app.core.trucks import resolve_request_truck
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def scoring_budget(max_upstream_calls: Optional[int] = None, max_time_ms: Optional[int] = None) -> CallBudget:
+    """Per-request budget; omitted limits fall back to the server defaults (0 = unlimited)."""
+    return CallBudget(
+        max_calls=settings.RECOMMEND_MAX_UPSTREAM_CALLS if max_upstream_calls is None else max_upstream_calls,
+        max_seconds=settings.RECOMMEND_MAX_TIME_S if max_time_ms is None else max_time_ms / 1000.0,
+    )
 
-class AppSettings:
-    Maps_API_KEY: str = os.getenv("GOOGLE_MAPS_API_KEY")
-settings = AppSettings()
 
-
-logger = logging.getLogger(__name__)
-router = APIRouter()
-
-try:
-    google_location_service_instance = google_location_service(api_key=settings.Maps_API_KEY)
-except AttributeError:
-    logger.error("Maps_API_KEY not found in settings. Google Maps API service cannot be initialized.")
-    google_location_service_instance = None
-except Exception as e:
-    logger.error(f"Failed to initialize GoogleLocationService: {e}")
-    google_location_service_instance = None
+def scoring_headers(stats: dict) -> dict:
+    """Pruning and anytime-scoring outcome of one score_loads pass, as response headers."""
+    return {
+        "X-Loads-Pruned": str(stats.get("pruned", 0)), # cannot make their delivery date
+        "X-Loads-Scored": str(stats.get("evaluated", 0)),
+        "X-Loads-Skipped": str(stats.get("skipped", 0)), # not reached before the budget ran out
+        "X-Recommendation-Partial": "true" if stats.get("partial") else "false",
+    }
 
 
 # This endpoing is responsible to get loads based on the truck's location origin and destination
-@router.post("/recommend", summary="Get scored load recommendations for a truck")
-def recommend_loads_endpoint(truck: Truck) -> List[dict]:
+# With fields= the items are flat projections (e.g. {"load_id", "score", "extra_km"}), not ScoredLoad
+@router.post(
+    "/recommend",
+    summary="Get scored load recommendations for a truck",
+    response_model=Union[List[ScoredLoad], List[Dict[str, Any]]],
+    responses={200: {"description": "Scored loads, best first. With `fields=`, each item is a flat object holding only the requested fields."}},
+    dependencies=[Depends(admission("recommend"))],
+)
+async def recommend_loads_endpoint(
+    truck: Truck,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return per load, e.g. load_id,score,extra_km. Names are looked up on the result, then in `load` and `detour`."),
+    max_upstream_calls: Optional[int] = Query(None, ge=0, description="Stop scoring after about this many Google Maps calls (0 = unlimited; default RECOMMEND_MAX_UPSTREAM_CALLS)."),
+    max_time_ms: Optional[int] = Query(None, ge=0, description="Stop scoring after this much wall time (0 = unlimited; default RECOMMEND_MAX_TIME_S)."),
+):
     logger.info("Recommend loads endpoint method")
     """
     Provides a list of loads, scored and sorted based on suitability for the given truck.
+    When the call or time budget runs out, the best ranking found so far is returned
+    with X-Recommendation-Partial: true and the scored/skipped counts in headers.
     """
-    all_available_loads = get_dummy_loads()
+    field_names = parse_fields(fields)
+    # {"truck_id": "T1"} is enough for a registered truck; its stored position skips geocoding
+    truck = await resolve_request_truck(truck)
+
+    # Only loads that are open, light enough and not already overdue reach the scoring loop
+    all_available_loads = await run_blocking_io(candidate_loads, truck.capacity)
     if not all_available_loads:
-        logger.warning("No loads available from the data source.")
-        return []
+        logger.warning("No candidate loads available for this truck.")
+        return FastJSONResponse([], headers=scoring_headers({}))
+
+    # Scoring is dominated by blocking Google Maps calls; keep them on the upstream pool.
+    # The budget makes it anytime: most promising loads first, stop when it runs out.
+    stats = {}
+    budget = scoring_budget(max_upstream_calls, max_time_ms)
+    scored_loads_list = await run_upstream(score_loads, truck, all_available_loads, stats, budget)
+    pruned_headers = scoring_headers(stats)
 
-    scored_loads_list = score_loads(truck, all_available_loads)
-    
     if not scored_loads_list:
         logger.info(f"No suitable loads found for this truck after scoring.")
-        return []
+        return FastJSONResponse([], headers=pruned_headers)
         
-    return sorted(scored_loads_list, key=lambda x: x["score"], reverse=True)
+    with timed("sort"):
+        ranked_loads = sorted(scored_loads_list, key=lambda x: x["score"], reverse=True)
+
+    if field_names is not None:
+        ranked_loads = [project(item, field_names, nested=("load", "detour")) for item in ranked_loads]
+
+    # score_loads already builds ScoredLoad-shaped dicts, so they go straight to the
+    # encoder instead of being re-validated and copied by the response model.
+    return FastJSONResponse(ranked_loads, headers=pruned_headers)
+
+
+# This endpoint plans backhauls: chains of 2-3 loads driven one after another
+@router.post("/recommend/chains", summary="Get ranked multi-load chains (backhauls) for a truck", response_model=List[LoadChain], dependencies=[Depends(admission("recommend"))])
+async def recommend_chains_endpoint(
+    truck: Truck,
+    max_loads: Optional[int] = Query(None, ge=2, le=4, description="Longest chain to build (defaults to CHAIN_MAX_LOADS)."),
+    limit: int = Query(10, ge=1, le=50, description="Number of chains to return."),
+    exact: bool = Query(True, description="Re-cost the returned chains with real routes instead of estimates."),
+):
+    """
+    Chains are ranked by total rate x loaded km minus the fuel and time cost of the
+    empty (deadhead) legs between them. Each load fits the truck's capacity and
+    delivery dates never go backwards along a chain.
+    """
+    truck = await resolve_request_truck(truck)
+    all_available_loads = await run_blocking_io(candidate_loads, truck.capacity)
+    if not all_available_loads:
+        return FastJSONResponse([])
+
+    try:
+        chains = await run_upstream(plan_load_chains, truck, all_available_loads, max_loads, limit, exact)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return FastJSONResponse(chains)
 
 
 # this endpoint is responsible to get the summary of the top 3 loads
-@router.post("/recommend/summary", summary="Get an AI-generated summary for top recommendations")
-def recommend_summary_endpoint(truck: Truck) -> dict:
+@router.post("/recommend/summary", summary="Get an AI-generated summary for top recommendations", response_model=RecommendationSummary, dependencies=[Depends(admission("recommend_summary"))])
+async def recommend_summary_endpoint(truck: Truck):
     logger.info("recommedn summary method")
     """
     Provides an AI-generated summary for the top 3 recommended loads for the given truck.
     """
-    all_available_loads = get_dummy_loads()
+    truck = await resolve_request_truck(truck)
+    all_available_loads = await run_blocking_io(candidate_loads, truck.capacity)
     if not all_available_loads:
         raise HTTPException(status_code=404, detail="No loads available to make recommendations.")
 
-    scored_loads_list = score_loads(truck, all_available_loads)
+    stats = {}
+    scored_loads_list = await run_upstream(score_loads, truck, all_available_loads, stats, scoring_budget())
 
     if not scored_loads_list:
         raise HTTPException(status_code=404, detail=f"No suitable loads found for truck {truck.truck_id} to summarize.")
 
-    top_3_loads = sorted(scored_loads_list, key=lambda x: x["score"], reverse=True)[:3]
+    with timed("sort"):
+        top_3_loads = sorted(scored_loads_list, key=lambda x: x["score"], reverse=True)[:3]
 
     # Prepare data for OpenAI prompt (original load dict + score + detour info)
     summary_input_data = []
@@ -84,10 +147,14 @@ def recommend_summary_endpoint(truck: Truck) -> dict:
             "detour_info": item["detour"] # ensure key matches what score_loads returns
         })
 
-    summary_text = get_openai_summary(truck.model_dump(), summary_input_data) # Use model_dump() for Pydantic v2+
+    truck_info = truck.model_dump() # Use model_dump() for Pydantic v2+
+    summary_text = await run_upstream(get_openai_summary, truck_info, summary_input_data)
+
+    # The LLM call is latency-budgeted; if it times out or fails, answer with a
+    # deterministic summary built from the scored data instead of a 500.
+    is_fallback = summary_text is None
+    if is_fallback:
+        logger.warning("AI summary unavailable within budget. Returning template summary.")
+        summary_text = build_fallback_summary(truck_info, summary_input_data)
 
-    if summary_text is None:
-        logger.error("Failed to generate AI summary.")
-        raise HTTPException(status_code=500, detail="AI summary generation failed. Please check logs.")
-    
-    return {"summary": summary_text}
\ No newline at end of file
+    return {"summary": summary_text, "fallback": is_fallback, "partial": bool(stats.get("partial"))}
\ No newline at end of file
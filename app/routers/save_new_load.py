@@ -1,9 +1,21 @@
-from app.data.data_loader import save_loads,get_dummy_loads
-from fastapi import APIRouter, HTTPException, Body,File, UploadFile
+from app.config import settings
+from app.data.data_loader import save_loads,get_dummy_loads,loads_write_lock
+from app.data.archive import load_archive
+from app.data.changes import change_source, current_feed_version, load_change_log, sync_change_log
+from app.data.snapshot import current_board
+from app.core.concurrency import run_blocking_io, run_upstream
+from app.core.places import learn_places, load_place_ids
+from app.core.scoring import get_coordinates
+from app.services.Maps import maps_is_mocked
+from app.core.responses import FastJSONResponse, RawJSON, parse_fields, project
+from app.core.admission import admission
+from app.core.subscriptions import subscription_hub
+from app.models import LoadList
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Body,File, UploadFile, Query, Depends
 import logging
-from typing import Dict, Any, List
+import time
+from typing import Dict, Any, List, Optional, Tuple
 import re
-import pandas as pd
 from io import BytesIO 
 
 logger = logging.getLogger(__name__)
@@ -37,6 +49,42 @@ def flatten_loads_data(raw_data: List[Any]) -> List[Dict[str, Any]]:
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
 
+
+def next_load_id_number(current_loads: List[Dict[str, Any]]) -> int:
+    """Returns the numeric part for the next load ID (L<n>), one above the highest existing ID."""
+    numeric_ids = []
+    for load in current_loads:
+        if isinstance(load, dict) and "load_id" in load:
+            lid = load.get("load_id")
+            if lid:
+                match = re.match(r"[A-Za-z]*(\d+)", str(lid))
+                if match:
+                    numeric_ids.append(int(match.group(1)))
+
+    # Archived loads keep their IDs, so never hand one out again
+    archived_max = load_archive.max_load_number() if load_archive is not None else None
+    if archived_max is not None:
+        numeric_ids.append(archived_max)
+
+    max_id_num = max(numeric_ids) if numeric_ids else 100
+    return max_id_num + 1
+
+
+def _append_new_load(load_fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Assigns the next load ID and appends the load to the store.
+    Blocking (file I/O); runs in the I/O executor under the store write lock.
+    """
+    with loads_write_lock, change_source("add_load"):
+        raw_loads_from_file = get_dummy_loads()
+        current_loads = flatten_loads_data(raw_loads_from_file)
+
+        new_load = {"load_id": f"L{next_load_id_number(current_loads)}", **load_fields}
+
+        current_loads.append(new_load)
+        save_loads(current_loads)
+    return new_load
+
 @router.post("/add-load", summary="Add a new logistics load")
 async def add_load(payload: Dict[str, Any] = Body(...)) -> dict:
     required_fields = [
@@ -93,25 +141,7 @@ async def add_load(payload: Dict[str, Any] = Body(...)) -> dict:
             detail={"status": False, "message": "Field 'weight_tons' must be non-negative."}
         )
 
-    raw_loads_from_file = get_dummy_loads()
-    current_loads = flatten_loads_data(raw_loads_from_file)
-
-    numeric_ids = []
-    for load in current_loads:
-        if isinstance(load, dict) and "load_id" in load:
-            lid = load.get("load_id")
-            if lid:
-                match = re.match(r"[A-Za-z]*(\d+)", str(lid))
-                if match:
-                    numeric_ids.append(int(match.group(1)))
-
-    max_id_num = max(numeric_ids) if numeric_ids else 100
-    
-    new_id_num = max_id_num + 1
-    new_load_id = f"L{new_id_num}"
-
-    new_load = {
-        "load_id": new_load_id,
+    load_fields = {
         "pickup_point": payload["pickup_point"],
         "destination": payload["destination"],
         "rate": formatted_rate_string,  
@@ -120,10 +150,14 @@ async def add_load(payload: Dict[str, Any] = Body(...)) -> dict:
         "weight_tons": weight,
         "expected_delivery_date": payload["expected_delivery_date"]
     }
+    # Canonicalise both cities before taking the store lock (geocodes only spellings never seen before)
+    if not maps_is_mocked():
+        await run_upstream(learn_places, [load_fields["pickup_point"], load_fields["destination"]], get_coordinates)
+    load_fields.update(load_place_ids(load_fields))
 
-    current_loads.append(new_load)
-    save_loads(current_loads)
-
+    new_load = await run_blocking_io(_append_new_load, load_fields)
+    # Push the new load to subscribed trucks that it matches (runs in the background)
+    subscription_hub.notify_new_loads([new_load])
 
     # Modified response includes boolean 'status' true on success
     return {"status": True, "message": "Load added successfully", "load": new_load}
@@ -131,16 +165,123 @@ async def add_load(payload: Dict[str, Any] = Body(...)) -> dict:
 
 
 
-@router.post("/upload-loads-excel", summary="Upload loads from an Excel file")
-async def upload_loads_excel(file: UploadFile = File(...)): # Assuming this function is used
+def _read_excel_frame(contents: bytes) -> "pd.DataFrame":
+    """Parses an uploaded Excel file into a DataFrame with blanks as None. CPU-bound; run off the event loop."""
+    import pandas as pd  # pandas is heavy; only Excel uploads pay for importing it
+    excel_data = pd.read_excel(BytesIO(contents))
+    return excel_data.where(pd.notnull(excel_data), None)
+
+
+def _import_excel_rows(excel_data: "pd.DataFrame", required_excel_columns: List[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Validates Excel rows, assigns load IDs and saves the new loads in one write.
+    Blocking (pandas + file I/O); runs in the I/O executor under the store write lock.
+    """
+    import pandas as pd
+    with loads_write_lock, change_source("excel_upload"):
+        raw_loads_from_file = get_dummy_loads()
+        current_loads = flatten_loads_data(raw_loads_from_file)
+
+        next_id_num = next_load_id_number(current_loads)
+
+        newly_added_loads = []
+        processing_errors = []
+
+        for index, row in excel_data.iterrows():
+            try:
+                load_data = row.to_dict()
+
+                missing_fields_in_row = [
+                    field for field in required_excel_columns
+                    if pd.isna(load_data.get(field)) or load_data.get(field) == ''
+                ]
+                if missing_fields_in_row:
+                    processing_errors.append({"row": index + 2, "error": f"Missing data for fields: {', '.join(missing_fields_in_row)}"})
+                    continue
+
+                # --- Rate Processing ---
+                rate_input = load_data.get("rate")
+
+                if isinstance(rate_input, (int, float)):
+                    rate_input_str = str(rate_input)
+                elif isinstance(rate_input, str):
+                    rate_input_str = rate_input
+                else:
+                    processing_errors.append({"row": index + 2, "field": "rate", "error": "Rate must be a number or string."})
+                    continue
+
+                try:
+                    numeric_rate = float(re.sub(r'[^\d.]', '', rate_input_str))
+                    if numeric_rate < 0:
+                        processing_errors.append({"row": index + 2, "field": "rate", "error": "Rate must be non-negative."})
+                        continue
+                except ValueError:
+                    processing_errors.append({"row": index + 2, "field": "rate", "error": f"Invalid rate format: '{rate_input}'. Expected a number."})
+                    continue
+
+                # ✅ Convert rate to "₹25/km" or "₹25.50/km"
+                if numeric_rate == int(numeric_rate):
+                    formatted_rate_string = f"₹{int(numeric_rate)}/km"
+                else:
+                    formatted_rate_string = f"₹{numeric_rate:.2f}/km"
+
+                # --- Weight Processing ---
+                try:
+                    weight = float(load_data["weight_tons"])
+                    if weight < 0:
+                        processing_errors.append({"row": index + 2, "field": "weight_tons", "error": "Weight must be non-negative."})
+                        continue
+                except (ValueError, TypeError):
+                    processing_errors.append({"row": index + 2, "field": "weight_tons", "error": "Weight must be a valid number."})
+                    continue
+
+                # --- Expected Delivery Date Processing ---
+                expected_delivery_date_input = load_data["expected_delivery_date"]
+                if isinstance(expected_delivery_date_input, pd.Timestamp):
+                    formatted_delivery_date = expected_delivery_date_input.strftime('%Y-%m-%d')
+                elif isinstance(expected_delivery_date_input, str):
+                    formatted_delivery_date = expected_delivery_date_input
+                else:
+                    processing_errors.append({"row": index + 2, "field": "expected_delivery_date", "error": "Invalid date format."})
+                    continue
+
+                new_load_id = f"L{next_id_num}"
+                next_id_num += 1
+
+                new_load_entry = {
+                    "load_id": new_load_id,
+                    "pickup_point": str(load_data["pickup_point"]),
+                    "destination": str(load_data["destination"]),
+                    "rate": formatted_rate_string,
+                    "status": str(load_data.get("status", "available")),
+                    "cargo_type": str(load_data["cargo_type"]),
+                    "weight_tons": weight,
+                    "expected_delivery_date": formatted_delivery_date
+                }
+                new_load_entry.update(load_place_ids(new_load_entry))
+                current_loads.append(new_load_entry)
+                newly_added_loads.append(new_load_entry)
+
+            except Exception as e:
+                logger.error(f"Error processing row {index + 2} from Excel: {e}")
+                processing_errors.append({"row": index + 2, "error": f"Unexpected error: {str(e)}"})
+                continue
+
+        if newly_added_loads:
+            save_loads(current_loads)
+
+        return newly_added_loads, processing_errors
+
+
+@router.post("/upload-loads-excel", summary="Upload loads from an Excel file", dependencies=[Depends(admission("upload_loads_excel"))])
+async def upload_loads_excel(background_tasks: BackgroundTasks, file: UploadFile = File(...)): # Assuming this function is used
 
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail={"status": False, "message": "Invalid file type. Please upload an Excel file (.xlsx or .xls)."})
 
     try:
         contents = await file.read()
-        excel_data = pd.read_excel(BytesIO(contents))
-        excel_data = excel_data.where(pd.notnull(excel_data), None)
+        excel_data = await run_blocking_io(_read_excel_frame, contents)
     except Exception as e:
         logger.error(f"Error reading Excel file: {e}")
         raise HTTPException(status_code=400, detail={"status": False, "message": f"Error processing Excel file: {str(e)}"})
@@ -157,105 +298,14 @@ async def upload_loads_excel(file: UploadFile = File(...)): # Assuming this func
                 detail={"status": False, "message": f"Missing required column in Excel file: {col}"}
             )
 
-    raw_loads_from_file = get_dummy_loads()
-    current_loads = flatten_loads_data(raw_loads_from_file)
-
-    numeric_ids = []
-    for load in current_loads:
-        if isinstance(load, dict) and "load_id" in load:
-            lid = load.get("load_id")
-            if lid:
-                match = re.match(r"[A-Za-z]*(\d+)", str(lid))
-                if match:
-                    numeric_ids.append(int(match.group(1)))
-
-    max_id_num = max(numeric_ids) if numeric_ids else 100
-    next_id_num = max_id_num + 1
-
-    newly_added_loads = []
-    processing_errors = []
-
-    for index, row in excel_data.iterrows():
-        try:
-            load_data = row.to_dict()
+    newly_added_loads, processing_errors = await run_blocking_io(_import_excel_rows, excel_data, required_excel_columns)
+    subscription_hub.notify_new_loads(newly_added_loads)
 
-            missing_fields_in_row = [
-                field for field in required_excel_columns
-                if pd.isna(load_data.get(field)) or load_data.get(field) == ''
-            ]
-            if missing_fields_in_row:
-                processing_errors.append({"row": index + 2, "error": f"Missing data for fields: {', '.join(missing_fields_in_row)}"})
-                continue
-
-            # --- Rate Processing ---
-            rate_input = load_data.get("rate")
-
-            if isinstance(rate_input, (int, float)):
-                rate_input_str = str(rate_input)
-            elif isinstance(rate_input, str):
-                rate_input_str = rate_input
-            else:
-                processing_errors.append({"row": index + 2, "field": "rate", "error": "Rate must be a number or string."})
-                continue
-
-            try:
-                numeric_rate = float(re.sub(r'[^\d.]', '', rate_input_str))
-                if numeric_rate < 0:
-                    processing_errors.append({"row": index + 2, "field": "rate", "error": "Rate must be non-negative."})
-                    continue
-            except ValueError:
-                processing_errors.append({"row": index + 2, "field": "rate", "error": f"Invalid rate format: '{rate_input}'. Expected a number."})
-                continue
-
-            # ✅ Convert rate to "₹25/km" or "₹25.50/km"
-            if numeric_rate == int(numeric_rate):
-                formatted_rate_string = f"₹{int(numeric_rate)}/km"
-            else:
-                formatted_rate_string = f"₹{numeric_rate:.2f}/km"
-
-            # --- Weight Processing ---
-            try:
-                weight = float(load_data["weight_tons"])
-                if weight < 0:
-                    processing_errors.append({"row": index + 2, "field": "weight_tons", "error": "Weight must be non-negative."})
-                    continue
-            except (ValueError, TypeError):
-                processing_errors.append({"row": index + 2, "field": "weight_tons", "error": "Weight must be a valid number."})
-                continue
-
-            # --- Expected Delivery Date Processing ---
-            expected_delivery_date_input = load_data["expected_delivery_date"]
-            if isinstance(expected_delivery_date_input, pd.Timestamp):
-                formatted_delivery_date = expected_delivery_date_input.strftime('%Y-%m-%d')
-            elif isinstance(expected_delivery_date_input, str):
-                formatted_delivery_date = expected_delivery_date_input
-            else:
-                processing_errors.append({"row": index + 2, "field": "expected_delivery_date", "error": "Invalid date format."})
-                continue
-
-            new_load_id = f"L{next_id_num}"
-            next_id_num += 1
-
-            new_load_entry = {
-                "load_id": new_load_id,
-                "pickup_point": str(load_data["pickup_point"]),
-                "destination": str(load_data["destination"]),
-                "rate": formatted_rate_string,
-                "status": str(load_data.get("status", "available")),
-                "cargo_type": str(load_data["cargo_type"]),
-                "weight_tons": weight,
-                "expected_delivery_date": formatted_delivery_date
-            }
-            current_loads.append(new_load_entry)
-            newly_added_loads.append(new_load_entry)
-
-        except Exception as e:
-            logger.error(f"Error processing row {index + 2} from Excel: {e}")
-            processing_errors.append({"row": index + 2, "error": f"Unexpected error: {str(e)}"})
-            continue
-
-    if newly_added_loads:
-        save_loads(current_loads)
+    # Rows are tagged with the places already known; new cities are learned after the
+    # response (capped per upload), so a large sheet never waits on hundreds of geocodes
+    cities = [str(city) for column in ("pickup_point", "destination") for city in excel_data[column].dropna() if str(city).strip()]
+    if cities and not maps_is_mocked():
+        background_tasks.add_task(run_upstream, learn_places, cities, get_coordinates, settings.PLACE_LEARN_UPLOAD_LIMIT)
 
     return {
         "status": True,
@@ -266,15 +316,68 @@ async def upload_loads_excel(file: UploadFile = File(...)): # Assuming this func
 
 
 
-@router.get("/get-all-loads", summary="Retrieve all available logistics loads")
-async def get_all_loads() -> Dict[str, Any]:
+@router.get("/get-all-loads", summary="Retrieve all available logistics loads", response_model=LoadList)
+async def get_all_loads(
+    fields: Optional[str] = Query(None, description="Comma-separated load fields to return, e.g. load_id,pickup_point,rate"),
+):
     """
     Retrieves all logistics loads from the dummy data storage.
     """
+    field_names = parse_fields(fields)
     try:
-        raw_loads = get_dummy_loads()
-        loads = flatten_loads_data(raw_loads)
-        return {"status": True, "message": "Loads retrieved successfully", "loads": loads}
+        # Version first: a change committed while the board is read is then replayed by /changes, never missed
+        version = await run_blocking_io(current_feed_version)
+        snapshot = await run_blocking_io(current_board)
+        if snapshot is not None and field_names is None:
+            # The snapshot's loads blob is already the JSON array to send
+            loads = RawJSON(snapshot.loads_json())
+        else:
+            loads = await run_blocking_io(snapshot.loads) if snapshot is not None else flatten_loads_data(await run_blocking_io(get_dummy_loads))
+            if field_names is not None:
+                loads = [project(load, field_names) for load in loads]
+        # Loads are returned as stored; skip response-model validation of the whole board
+        return FastJSONResponse({"status": True, "message": "Loads retrieved successfully", "loads": loads, "version": version})
     except Exception as e:
         logger.error(f"Error retrieving all loads: {e}")
         raise HTTPException(status_code=500, detail={"status": False, "message": f"Failed to retrieve loads: {str(e)}"})
+
+
+def _changes_since(since: int, limit: int) -> Dict[str, Any]:
+    """Blocking read of the change feed, after recording any store writes it has not seen yet."""
+    sync_change_log()
+    return load_change_log.since(since, limit)
+
+
+@router.get("/changes", summary="Load changes (add, update, delete) since a feed version, with optional long-poll")
+async def get_load_changes(
+    since: int = Query(0, ge=0, description="Last version the client has applied (the `version` of /get-all-loads or of the previous call)"),
+    limit: int = Query(500, ge=1, le=5000, description="Max changes per response; `more` is true when there are further ones"),
+    wait_s: float = Query(0, ge=0, le=settings.CHANGE_FEED_MAX_WAIT_S, description="Long-poll: wait up to this long for a change when there is none yet"),
+    fields: Optional[str] = Query(None, description="Comma-separated load fields to return for added and updated loads"),
+):
+    """
+    Incremental sync for clients that mirror the board: apply `changes` in order
+    (add/update carry the whole load, delete only its load_id) and ask again with
+    the returned `version`. When `reset_required` is true the client is too far
+    behind (or its version is unknown): re-download /get-all-loads and continue
+    from the version it returns.
+    """
+    if load_change_log is None:
+        raise HTTPException(status_code=404, detail={"status": False, "message": "The change feed is disabled (CHANGE_FEED_ENABLED=false)."})
+    field_names = parse_fields(fields)
+
+    deadline = time.monotonic() + wait_s
+    result = await run_blocking_io(_changes_since, since, limit)
+    while not result["changes"] and not result["reset_required"]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # Woken at once by commits in this worker, and by the worker's shared poller for other writers
+        await load_change_log.wakeup.wait(remaining, result["version"])
+        result = await run_blocking_io(_changes_since, since, limit)
+
+    if field_names is not None:
+        for change in result["changes"]:
+            if "load" in change:
+                change["load"] = project(change["load"], field_names)
+    return FastJSONResponse({"status": True, **result})
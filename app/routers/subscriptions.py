@@ -0,0 +1,100 @@
+# logistics_ai_project/app/routers/subscriptions.py
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+
+from app.config import settings
+from app.core.subscriptions import Subscription, subscription_hub
+from app.core.trucks import TruckNotRegistered, resolve_request_truck, resolve_truck
+from app.core.concurrency import run_blocking_io
+from app.models import Truck
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+def _to_json(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+@router.get("/stream", summary="Stream newly added loads that match a truck (Server-Sent Events)")
+async def stream_matching_loads(
+    truck_id: Optional[str] = Query(None, description="Registered truck; its stored position and capacity are used unless overridden"),
+    location: Optional[str] = Query(None, description="Truck's current location"),
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    capacity: Optional[int] = Query(None, description="Truck capacity in tons"),
+    min_score: Optional[float] = Query(None, description="Only push matches scoring at least this much"),
+    max_pickup_km: Optional[float] = Query(None, description="Straight-line pickup radius used to prefilter new loads (0 = no limit)"),
+):
+    """
+    Opens an SSE stream. A `subscribed` event is sent first, then one `load_match`
+    event per newly added load that matches the truck (same shape as a /recommend
+    item). Comment lines are sent as keep-alives while nothing matches.
+    """
+    truck = await resolve_request_truck(
+        Truck(truck_id=truck_id, location=location, latitude=latitude, longitude=longitude, capacity=capacity)
+    )
+    try:
+        subscription = await subscription_hub.subscribe(truck, min_score, max_pickup_km)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        try:
+            yield f"event: subscribed\ndata: {_to_json(subscription.as_dict())}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=settings.SUBSCRIPTION_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['event']}\ndata: {_to_json(event)}\n\n"
+        finally:
+            subscription_hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _forward_matches(websocket: WebSocket, subscription: Subscription):
+    while True:
+        event = await subscription.queue.get()
+        await websocket.send_text(_to_json(event))
+
+
+@router.websocket("/ws")
+async def websocket_matching_loads(websocket: WebSocket):
+    """
+    WebSocket variant of /stream. The first client message must be the truck, e.g.
+    {"location": "Pune", "capacity": 20, "min_score": 10, "max_pickup_km": 150}
+    or {"truck_id": "T1"} for a registered truck.
+    The server replies {"event": "subscribed", ...} and then pushes `load_match` events.
+    """
+    await websocket.accept()
+    try:
+        message = await websocket.receive_json()
+        truck = Truck(**{key: message.get(key) for key in ("truck_id", "location", "latitude", "longitude", "capacity")})
+        truck = await run_blocking_io(resolve_truck, truck)
+        subscription = await subscription_hub.subscribe(truck, message.get("min_score"), message.get("max_pickup_km"))
+    except WebSocketDisconnect:
+        return
+    except (ValidationError, ValueError, TypeError, AttributeError, TruckNotRegistered) as e:
+        await websocket.send_text(_to_json({"event": "error", "message": f"Invalid subscription: {e}"}))
+        await websocket.close(code=1008)
+        return
+
+    await websocket.send_text(_to_json({"event": "subscribed", **subscription.as_dict()}))
+    forwarder = asyncio.create_task(_forward_matches(websocket, subscription))
+    try:
+        while True:
+            await websocket.receive_text()  # nothing to handle; this just notices the disconnect
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forwarder.cancel()
+        subscription_hub.unsubscribe(subscription)
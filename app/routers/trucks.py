@@ -0,0 +1,64 @@
+# logistics_ai_project/app/routers/trucks.py
+import logging
+from typing import List
+
+from fastapi import APIRouter, HTTPException, status
+
+from app.core.concurrency import run_blocking_io, run_upstream
+from app.core.scoring import get_coordinates
+from app.core.trucks import truck_registry
+from app.models import RegisteredTruck, TruckUpdate
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.put("/{truck_id}", summary="Register a truck or update its position/capacity", response_model=RegisteredTruck)
+async def upsert_truck(truck_id: str, update: TruckUpdate):
+    """
+    Telematics units can call this with just {"latitude": .., "longitude": ..}.
+    A location sent without coordinates is geocoded once here, so later
+    recommendations for this truck never need to geocode it again.
+    """
+    fields = update.model_dump(exclude_none=True)
+    if ("latitude" in fields) != ("longitude" in fields):
+        raise HTTPException(status_code=422, detail="latitude and longitude must be given together.")
+
+    if "location" in fields and "latitude" not in fields:
+        coords = await run_upstream(get_coordinates, fields["location"])
+        if coords.get("status"):
+            fields["latitude"], fields["longitude"] = coords["latitude"], coords["longitude"]
+            fields["place_id"] = coords.get("place_id")
+        else:
+            logger.warning(f"Could not geocode '{fields['location']}' for truck {truck_id}; it will be geocoded at scoring time.")
+
+    try:
+        record = await run_blocking_io(truck_registry.upsert, truck_id, fields)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"Truck {truck_id} registered/updated.")
+    return record
+
+
+@router.get("/{truck_id}", summary="Get a registered truck", response_model=RegisteredTruck)
+async def get_truck(truck_id: str):
+    record = await run_blocking_io(truck_registry.get, truck_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Truck '{truck_id}' is not registered.")
+    return record
+
+
+@router.get("", summary="List registered trucks", response_model=List[RegisteredTruck])
+async def list_trucks():
+    return await run_blocking_io(truck_registry.all)
+
+
+@router.delete("/{truck_id}", summary="Remove a truck from the registry")
+async def delete_truck(truck_id: str) -> dict:
+    try:
+        removed = await run_blocking_io(truck_registry.remove, truck_id)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"Truck '{truck_id}' is not registered.")
+    return {"message": f"Truck '{truck_id}' removed from the registry."}
@@ -1,56 +1,160 @@
 # logistics_ai_project/app/services/Maps.py
-import requests
 import logging
 from typing import Dict, Optional, Any
 from app.config import settings # Import settings from your config.py
+from app.core.budget import charge_upstream_call, upstream_timeout
+from app.core.cache import make_cache
+from app.core.lanes import is_coordinate_pair, lane_table
+from app.core.metrics import UPSTREAM_REQUESTS
+from app.core.places import place_key, place_query
+from app.core.timing import timed
 import os
-from dotenv import load_dotenv
-load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-def get_route_eta_distance(
-    origin_lat: float,
-    origin_lng: float,
-    pickup_address: str,
-    drop_address: str
-) -> Optional[Dict[str, Any]]:
+# Distance Matrix elements for legs that start at a truck's coordinates, keyed by
+# "origin|place_key(destination)". Only real OK elements are stored, so mock data and failures never stick.
+route_leg_cache = make_cache("route_leg", max_entries=settings.ROUTE_LEG_CACHE_SIZE, ttl_s=settings.ROUTE_LEG_CACHE_TTL_S)
+
+def maps_is_mocked() -> bool:
+    return not settings.Maps_API_KEY or settings.Maps_API_KEY == os.getenv("Maps_API_KEY")
+
+
+def fetch_route_leg(origins_val: str, destinations_val: str) -> Optional[Dict[str, Any]]:
     """
-    Calculates route, ETA, and distance using Google Maps API.
+    One Distance Matrix call for a single origin/destination, bypassing all caches.
+    Bounded by MAPS_CALL_TIMEOUT_S and the request's remaining budget; a timeout is a failed leg (None).
     """
-    def query(origins_val: str, destinations_val: str) -> Optional[Dict[str, Any]]:
-        if not settings.Maps_API_KEY or settings.Maps_API_KEY == os.getenv("Maps_API_KEY"):
-           logger.warning("Google Maps API key is a dummy or not configured. Returning mock data.")
-           return {"distance": {"value": 200000}, "duration": {"value": 10800}, "status": "OK_MOCK"}
+    import requests  # imported lazily to keep worker start-up fast
 
-        try:
+    charge_upstream_call()
+    try:
+        with timed("route_leg"):
             response = requests.get(
-                "https://maps.googleapis.com/maps/api/distancematrix/json",
+                f"{settings.GOOGLE_MAPS_BASE_URL}/distancematrix/json",
                 params={
                     "origins": origins_val,
                     "destinations": destinations_val,
                     "key": settings.Maps_API_KEY,
                     "units": "metric" # Ensures values are in meters and seconds
-                }
+                },
+                timeout=upstream_timeout(settings.MAPS_CALL_TIMEOUT_S),
             )
-            response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
-            result = response.json()
-
-            if result['status'] != 'OK' or not result['rows'] or not result['rows'][0]['elements']:
-                logger.warning(f"Google Maps API issue for {origins_val} → {destinations_val}: Status {result.get('status')}, Error: {result.get('error_message', 'No elements')}")
-                return None
-            
-            element = result['rows'][0]['elements'][0]
-            if element['status'] != 'OK':
-                logger.warning(f"Google Maps element status not OK for {origins_val} → {destinations_val}: {element['status']}")
-                return None
-            return element
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Google Maps request failed for {origins_val} → {destinations_val}: {e}")
+        response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
+        result = response.json()
+
+        if result['status'] != 'OK' or not result['rows'] or not result['rows'][0]['elements']:
+            UPSTREAM_REQUESTS.labels("google_distance_matrix", "api_error").inc()
+            logger.warning(f"Google Maps API issue for {origins_val} → {destinations_val}: Status {result.get('status')}, Error: {result.get('error_message', 'No elements')}")
             return None
-        except Exception as e: # Catch any other unexpected errors
-            logger.error(f"Unexpected error in Google Maps query for {origins_val} → {destinations_val}: {e}", exc_info=True)
+        
+        element = result['rows'][0]['elements'][0]
+        if element['status'] != 'OK':
+            UPSTREAM_REQUESTS.labels("google_distance_matrix", "no_result").inc()
+            logger.warning(f"Google Maps element status not OK for {origins_val} → {destinations_val}: {element['status']}")
             return None
+        UPSTREAM_REQUESTS.labels("google_distance_matrix", "ok").inc()
+        return element
+    except requests.exceptions.Timeout:
+        UPSTREAM_REQUESTS.labels("google_distance_matrix", "timeout").inc()
+        logger.warning(f"Google Maps request timed out for {origins_val} → {destinations_val}")
+        return None
+    except requests.exceptions.RequestException as e:
+        UPSTREAM_REQUESTS.labels("google_distance_matrix", "error").inc()
+        logger.error(f"Google Maps request failed for {origins_val} → {destinations_val}: {e}")
+        return None
+    except Exception as e: # Catch any other unexpected errors
+        UPSTREAM_REQUESTS.labels("google_distance_matrix", "error").inc()
+        logger.error(f"Unexpected error in Google Maps query for {origins_val} → {destinations_val}: {e}", exc_info=True)
+        return None
+
+
+def get_route_leg(origins_val: str, destinations_val: str) -> Optional[Dict[str, Any]]:
+    """
+    Distance/duration for one leg. City-to-city legs are answered from the
+    persistent lane table when known; legs starting at a truck's coordinates use
+    the route-leg cache. Only real upstream answers are stored in either.
+    """
+    if maps_is_mocked():
+       logger.warning("Google Maps API key is a dummy or not configured. Returning mock data.")
+       UPSTREAM_REQUESTS.labels("google_distance_matrix", "mock").inc()
+       return {"distance": {"value": 200000}, "duration": {"value": 10800}, "status": "OK_MOCK"}
+
+    is_lane = lane_table is not None and not is_coordinate_pair(origins_val) and not is_coordinate_pair(destinations_val)
+    cache_key = f"{origins_val}|{place_key(destinations_val)}"
+    cached = lane_table.lookup(origins_val, destinations_val) if is_lane else route_leg_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    element = fetch_route_leg(origins_val, destinations_val)
+    if element is not None:
+        if is_lane:
+            lane_table.record(origins_val, destinations_val, element["distance"]["value"], element["duration"]["value"])
+        else:
+            route_leg_cache.set(cache_key, element)
+    return element
+
+
+def refresh_stale_lanes() -> Dict[str, int]:
+    """
+    Background job: re-fetches the oldest lanes past LANE_REFRESH_AGE_S, at most
+    LANE_REFRESH_BATCH per run. Lanes that fail to refresh keep their old values.
+    """
+    report = {"claimed": 0, "refreshed": 0, "failed": 0}
+    if lane_table is None or maps_is_mocked():
+        return report
+    for origin, destination in lane_table.claim_stale(settings.LANE_REFRESH_AGE_S, settings.LANE_REFRESH_BATCH):
+        report["claimed"] += 1
+        element = fetch_route_leg(place_query(origin), place_query(destination))
+        if element is None:
+            report["failed"] += 1
+            continue
+        lane_table.record(origin, destination, element["distance"]["value"], element["duration"]["value"])
+        report["refreshed"] += 1
+    if report["claimed"]:
+        logger.info(f"Lane refresh: {report}")
+    return report
+
+
+def detour_from_legs(
+    direct_route_info: Dict[str, Any],
+    to_pickup_info: Dict[str, Any],
+    pickup_to_drop_info: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Detour figures from three Distance Matrix elements (truck -> drop, truck ->
+    pickup, pickup -> drop). Raises KeyError if an element lacks distance or duration.
+    """
+    direct_km = direct_route_info['distance']['value'] / 1000
+    direct_min = direct_route_info['duration']['value'] / 60
+
+    via_km = (to_pickup_info['distance']['value'] + pickup_to_drop_info['distance']['value']) / 1000
+    via_min = (to_pickup_info['duration']['value'] + pickup_to_drop_info['duration']['value']) / 60
+    
+    extra_km = via_km - direct_km
+    fuel_cost = extra_km * settings.FUEL_COST_PER_KM if extra_km > 0 else 0.0
+
+
+    return {
+        "direct_km": round(direct_km, 1),
+        "via_km": round(via_km, 1),
+        "extra_km": round(extra_km, 1),
+        "extra_min": round(via_min - direct_min, 1),
+        "via_min": round(via_min, 1),
+        "fuel_cost": round(fuel_cost, 2)
+    }
+
+
+def get_route_eta_distance(
+    origin_lat: float,
+    origin_lng: float,
+    pickup_address: str,
+    drop_address: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Calculates route, ETA, and distance using Google Maps API.
+    """
+    query = get_route_leg
 
     if not pickup_address or not drop_address:
         logger.warning("Pickup or drop address is missing.")
@@ -67,23 +171,7 @@ def get_route_eta_distance(
         return None
 
     try:
-        direct_km = direct_route_info['distance']['value'] / 1000
-        direct_min = direct_route_info['duration']['value'] / 60
-
-        via_km = (to_pickup_info['distance']['value'] + pickup_to_drop_info['distance']['value']) / 1000
-        via_min = (to_pickup_info['duration']['value'] + pickup_to_drop_info['duration']['value']) / 60
-        
-        extra_km = via_km - direct_km
-        fuel_cost = extra_km * settings.FUEL_COST_PER_KM if extra_km > 0 else 0.0
-
-
-        return {
-            "direct_km": round(direct_km, 1),
-            "via_km": round(via_km, 1),
-            "extra_km": round(extra_km, 1),
-            "extra_min": round(via_min - direct_min, 1),
-            "fuel_cost": round(fuel_cost, 2)
-        }
+        return detour_from_legs(direct_route_info, to_pickup_info, pickup_to_drop_info)
     except KeyError as e: # More specific exception for missing keys in API response
         logger.error(f"Detour calculation failed due to missing key in Google Maps response: {e}", exc_info=True)
         return None
@@ -1,14 +1,13 @@
 import requests
-from dotenv import load_dotenv
 import os
-load_dotenv()
+from app.config import settings
 
 
 
 class GoogleLocationService:
     def __init__(self):
         self.api_key = os.getenv("GOOGLE_MAPS_API_KEY")  # ✅ Fix: Use the correct key
-        self.base_url = "https://maps.googleapis.com/maps/api/geocode/json"
+        self.base_url = f"{settings.GOOGLE_MAPS_BASE_URL}/geocode/json"
 
     def get_coordinates(self, location: str) -> dict:
         params = {
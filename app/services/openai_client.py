@@ -1,79 +1,355 @@
 
 
 # logistics_ai_project/app/services/openai_client.py
-import openai
 import json
 import logging
+import threading
+import time
 from typing import Dict, List, Optional, Any
 from app.config import settings
+from app.core.metrics import LLM_SUMMARY_BATCH_SIZE, LLM_SUMMARY_BATCHES, UPSTREAM_REQUESTS
+from app.core.timing import timed
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client if API key is available
-if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != "your-dummy-openai-key":
-    client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-else:
-    client = None
+OPENAI_CONFIGURED = bool(settings.OPENAI_API_KEY) and settings.OPENAI_API_KEY != "your-dummy-openai-key"
+if not OPENAI_CONFIGURED:
     logger.warning("OpenAI API key is a dummy or not configured. OpenAI client not initialized.")
 
-def get_openai_summary(truck_info: Dict[str, Any], top_loads_data: List[Dict[str, Any]]) -> Optional[str]:
-    """Generates a summary recommendation using OpenAI."""
-    if client is None:
-        return "OpenAI API key not set. Mock summary: Consider the load with the highest score and lowest detour."
+# The OpenAI SDK takes a noticeable share of worker start-up to import, so the
+# module is imported and the client built on first use.
+_client = None
+_client_lock = threading.Lock()
 
-    prompt = (
+
+def get_client():
+    """
+    Returns the shared OpenAI client, or None if no API key is configured.
+    Retries are disabled: every call runs inside a latency budget, and a retry
+    would silently spend time the caller no longer has.
+    """
+    global _client
+    if _client is None and OPENAI_CONFIGURED:
+        with _client_lock:
+            if _client is None:
+                import openai
+                _client = openai.OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None, max_retries=0)
+    return _client
+
+# Caps the number of in-flight chat completions across all endpoints in this worker
+_llm_slots = threading.BoundedSemaphore(max(1, settings.LLM_MAX_CONCURRENCY))
+
+
+def _chat_completion_within_budget(
+    messages: List[Dict[str, str]],
+    budget_s: float,
+    purpose: str,
+    response_format: Optional[Dict[str, str]] = None,
+) -> Optional[str]:
+    """
+    Runs a chat completion that must finish within `budget_s` seconds.
+
+    Time spent waiting for a free LLM slot counts against the budget. The
+    remaining budget is passed to the HTTP request as its timeout, so the
+    upstream call is abandoned once the budget runs out.
+    Returns None if the budget is exhausted or the call fails.
+    """
+    import openai  # already loaded by get_client()
+
+    deadline = time.monotonic() + budget_s
+
+    if not _llm_slots.acquire(timeout=budget_s):
+        UPSTREAM_REQUESTS.labels("openai", "rejected").inc()
+        logger.warning(f"OpenAI {purpose}: no free LLM slot within {budget_s:.1f}s budget. Giving up.")
+        return None
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            UPSTREAM_REQUESTS.labels("openai", "rejected").inc()
+            logger.warning(f"OpenAI {purpose}: budget exhausted while waiting for an LLM slot.")
+            return None
+
+        options = {"response_format": response_format} if response_format else {}
+        with timed("llm"):
+            response = get_client().chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=messages,
+                timeout=remaining,
+                **options,
+            )
+        UPSTREAM_REQUESTS.labels("openai", "ok").inc()
+        return response.choices[0].message.content
+    except openai.APITimeoutError:
+        UPSTREAM_REQUESTS.labels("openai", "timeout").inc()
+        logger.warning(f"OpenAI {purpose} exceeded its {budget_s:.1f}s latency budget. Request cancelled.")
+        return None
+    except Exception as e:
+        UPSTREAM_REQUESTS.labels("openai", "error").inc()
+        logger.error(f"OpenAI {purpose} failed: {e}", exc_info=True)
+        return None
+    finally:
+        _llm_slots.release()
+
+
+def build_fallback_summary(truck_info: Dict[str, Any], top_loads_data: List[Dict[str, Any]]) -> str:
+    """
+    Builds a deterministic, template-based recommendation from already scored loads.
+    Used when the LLM is unavailable or too slow to answer within its budget.
+    """
+    if not top_loads_data:
+        return "No suitable loads found for this truck."
+
+    def describe(item: Dict[str, Any]) -> str:
+        load = item.get("load_details", {})
+        detour = item.get("detour_info") or {}
+        origin = load.get("pickup_point") or load.get("origin", "unknown pickup")
+        return (
+            f"load {load.get('load_id', 'N/A')} ({origin} → {load.get('destination', 'unknown destination')}, "
+            f"{load.get('rate', 'rate n/a')}), score {item.get('score', 0.0):.2f}, "
+            f"detour {detour.get('extra_km', 0.0):.1f} km, extra fuel cost ₹{detour.get('fuel_cost', 0.0):.2f}"
+        )
+
+    top_pick, alternatives = top_loads_data[0], top_loads_data[1:]
+    summary = (
+        f"Top pick for your {truck_info.get('capacity')}-ton truck: {describe(top_pick)}. "
+        f"It has the best balance of rate, urgency and detour cost among the available loads."
+    )
+    if alternatives:
+        summary += " Alternatives: " + "; ".join(describe(item) for item in alternatives) + "."
+    return summary
+
+
+SUMMARY_SYSTEM_PROMPT = "You are an expert logistics assistant providing clear, actionable advice to truck drivers."
+SUMMARY_INSTRUCTIONS = (
+    "Prioritize loads with high scores, minimal detours, and compatibility with truck capacity. "
+    "Explain your top choice briefly."
+)
+
+
+def _truck_line(truck_info: Dict[str, Any]) -> str:
+    return (
         f"Truck details: Current Location Lat/Lng ({truck_info.get('latitude')},{truck_info.get('longitude')}), "
-        f"Capacity: {truck_info.get('capacity')} tons. Based on the following top {len(top_loads_data)} potential loads, "
-        f"provide a concise recommendation for the driver. Prioritize loads with high scores, minimal detours, "
-        f"and compatibility with truck capacity. Explain your top choice briefly.\n\n"
+        f"Capacity: {truck_info.get('capacity')} tons."
+    )
+
+
+def _single_summary(truck_info: Dict[str, Any], top_loads_data: List[Dict[str, Any]], budget_s: float) -> Optional[str]:
+    """One chat completion for one truck's summary."""
+    prompt = (
+        f"{_truck_line(truck_info)} Based on the following top {len(top_loads_data)} potential loads, "
+        f"provide a concise recommendation for the driver. {SUMMARY_INSTRUCTIONS}\n\n"
         f"Top Loads (with scores and detour info):\n{json.dumps(top_loads_data, indent=2)}\n\n"
         f"Recommendation:"
     )
+    return _chat_completion_within_budget(
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        budget_s=budget_s,
+        purpose="summary generation",
+    )
+
+
+def _parse_batched_summaries(content: str, request_ids: List[str]) -> Dict[str, str]:
+    """
+    Per-request summaries from a multi-truck answer: {"summaries": {"<id>": "<text>"}}
+    or {"summaries": [{"request_id": .., "summary": ..}]}. Unknown ids and empty
+    texts are dropped; anything unparseable gives {}.
+    """
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`").split("\n", 1)[-1]  # drop a ```json fence
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o", # Or "gpt-4" if you have access and prefer it
-            messages=[
-                {"role": "system", "content": "You are an expert logistics assistant providing clear, actionable advice to truck drivers."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        logger.error(f"OpenAI summary generation failed: {e}", exc_info=True)
+        summaries = json.loads(text).get("summaries")
+    except (ValueError, AttributeError):
+        return {}
+    if isinstance(summaries, list):
+        summaries = {
+            str(entry.get("request_id")): entry.get("summary")
+            for entry in summaries if isinstance(entry, dict)
+        }
+    if not isinstance(summaries, dict):
+        return {}
+    wanted = set(request_ids)
+    return {
+        request_id: summary.strip() for request_id, summary in summaries.items()
+        if request_id in wanted and isinstance(summary, str) and summary.strip()
+    }
+
+
+_RETRY_ALONE = object()  # a batched request the multi-truck answer did not cover
+
+
+class _PendingSummary:
+    __slots__ = ("truck_info", "top_loads_data", "deadline", "done", "result")
+
+    def __init__(self, truck_info: Dict[str, Any], top_loads_data: List[Dict[str, Any]], budget_s: float):
+        self.truck_info = truck_info
+        self.top_loads_data = top_loads_data
+        self.deadline = time.monotonic() + budget_s
+        self.done = threading.Event()
+        self.result: Any = None
+
+
+class SummaryBatcher:
+    """
+    Micro-batches summary requests from concurrent callers (each in its own
+    upstream-pool thread). The first request opens a window of `window_s` and
+    leads it: requests arriving meanwhile join, up to `max_batch`, and the leader
+    sends them all as one multi-truck prompt that asks for a JSON object keyed by
+    request id. Every caller gets its own part of the answer. If the answer cannot
+    be parsed or misses a request, those requests fall back to a single call each
+    with the budget they have left; they run in their own threads, so the
+    fallbacks go out in parallel, bounded by the LLM slots.
+    Waiting in the window counts against each request's budget.
+    """
+
+    def __init__(self, window_s: float, max_batch: int):
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._batch_full = threading.Condition(self._lock)
+        self._open: Optional[List[_PendingSummary]] = None
+
+    def submit(self, truck_info: Dict[str, Any], top_loads_data: List[Dict[str, Any]], budget_s: float) -> Optional[str]:
+        pending = _PendingSummary(truck_info, top_loads_data, budget_s)
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = [pending]
+            else:
+                batch.append(pending)
+                if len(batch) >= self.max_batch:
+                    self._open = None  # the next request starts a new batch
+                    self._batch_full.notify_all()
+
+        if leader:
+            with self._lock:
+                self._batch_full.wait_for(lambda: len(batch) >= self.max_batch, timeout=min(self.window_s, budget_s))
+                if self._open is batch:
+                    self._open = None
+            self._send(batch)
+        else:
+            pending.done.wait(timeout=max(0.0, pending.deadline - time.monotonic()))
+
+        if pending.result is _RETRY_ALONE:
+            remaining = pending.deadline - time.monotonic()
+            return _single_summary(truck_info, top_loads_data, remaining) if remaining > 0 else None
+        return pending.result
+
+    def _send(self, batch: List[_PendingSummary]):
+        LLM_SUMMARY_BATCH_SIZE.observe(len(batch))
+        try:
+            if len(batch) == 1:
+                batch[0].result = _RETRY_ALONE  # nobody joined: the leader makes the ordinary single call
+                return
+
+            request_ids = [f"r{position}" for position in range(1, len(batch) + 1)]
+            requests_json = json.dumps([
+                {
+                    "request_id": request_id,
+                    "truck": _truck_line(pending.truck_info),
+                    "top_loads": pending.top_loads_data,
+                }
+                for request_id, pending in zip(request_ids, batch)
+            ], indent=2)
+            prompt = (
+                f"Below are {len(batch)} independent requests, each for a different truck driver. For each one, "
+                f"provide a concise recommendation based on that truck's top potential loads (with scores and detour info). "
+                f"{SUMMARY_INSTRUCTIONS}\n\n"
+                f"Respond with only a JSON object of the form "
+                f'{{"summaries": {{"<request_id>": "<recommendation>"}}}} covering every request_id.\n\n'
+                f"Requests:\n{requests_json}"
+            )
+            content = _chat_completion_within_budget(
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                budget_s=min(pending.deadline for pending in batch) - time.monotonic(),
+                purpose=f"batched summary generation ({len(batch)} trucks)",
+                response_format={"type": "json_object"},
+            )
+            if content is None:
+                LLM_SUMMARY_BATCHES.labels("failed").inc()
+                return  # out of budget or upstream error: every caller uses its template summary
+
+            summaries = _parse_batched_summaries(content, request_ids)
+            if not summaries:
+                LLM_SUMMARY_BATCHES.labels("unparsed").inc()
+                logger.warning(f"Could not parse the batched summary answer for {len(batch)} trucks; falling back to single calls.")
+            else:
+                LLM_SUMMARY_BATCHES.labels("ok" if len(summaries) == len(batch) else "partial").inc()
+            for request_id, pending in zip(request_ids, batch):
+                pending.result = summaries.get(request_id, _RETRY_ALONE)
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+
+summary_batcher = SummaryBatcher(settings.LLM_SUMMARY_BATCH_WINDOW_MS / 1000.0, max(1, settings.LLM_SUMMARY_BATCH_MAX))
+
+
+def get_openai_summary(
+    truck_info: Dict[str, Any],
+    top_loads_data: List[Dict[str, Any]],
+    budget_s: Optional[float] = None,
+) -> Optional[str]:
+    """
+    Generates a summary recommendation using OpenAI, micro-batched with other
+    summaries requested at the same time (see SummaryBatcher).
+    Returns None if the model does not answer within `budget_s`
+    (defaults to settings.LLM_SUMMARY_BUDGET_S) or no API key is set, so the
+    caller serves build_fallback_summary() and flags it as a fallback.
+    Blocking; run it on the upstream pool.
+    """
+    if not OPENAI_CONFIGURED:
+        logger.warning("OpenAI API key not set. Serving the template summary.")
         return None
 
-def get_openai_agent_answer(question: str, recent_loads_data: List[Dict[str, Any]]) -> Optional[str]:
+    budget_s = budget_s if budget_s is not None else settings.LLM_SUMMARY_BUDGET_S
+    if summary_batcher.window_s <= 0 or summary_batcher.max_batch <= 1:
+        return _single_summary(truck_info, top_loads_data, budget_s)
+    return summary_batcher.submit(truck_info, top_loads_data, budget_s)
+
+def get_openai_agent_answer(
+    question: str,
+    recent_loads_data: List[Dict[str, Any]],
+    budget_s: Optional[float] = None,
+) -> Optional[str]:
     """Gets an answer from OpenAI acting as a logistics expert without truck context."""
 
-    if client is None:
+    if not OPENAI_CONFIGURED:
         logger.warning("OpenAI API key not set. Returning mock agent answer.")
         return "OpenAI API key not set. Mock answer: I can help with logistics questions if properly configured."
 
-    # Since truck_id is removed, we consider all recent loads directly
+    # Loads arrive already ranked by relevance and trimmed to the token budget;
+    # one compact JSON object per line keeps the prompt small.
+    loads_context = "\n".join(
+        json.dumps(load, separators=(",", ":"), ensure_ascii=False) for load in recent_loads_data
+    )
     prompt = (
         f"You are a logistics expert assisting with a question:\n"
         f"{question}\n\n"
-        f"Here are some recent loads that might be relevant:\n"
-        f"{json.dumps(recent_loads_data, indent=2)}\n\n"
+        f"Here are the loads most relevant to the question (one JSON object per line):\n"
+        f"{loads_context}\n\n"
         f"Answer:"
     )
     # logger.info(f"OpenAI Agent Prompt: {prompt}")
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful logistics expert."},
-                {"role": "user", "content": prompt}
-            ],
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        logger.error(f"OpenAI agent answer failed: {e}", exc_info=True)
-        return None
-    
+    return _chat_completion_within_budget(
+        messages=[
+            {"role": "system", "content": "You are a helpful logistics expert."},
+            {"role": "user", "content": prompt}
+        ],
+        budget_s=budget_s if budget_s is not None else settings.LLM_AGENT_BUDGET_S,
+        purpose="agent answer",
+    )
+
+
 
-    
 def get_truck_capacity(truck_id: str) -> int:
     # In a real application, you would fetch this from a database or in-memory store
     if truck_id == "T123":
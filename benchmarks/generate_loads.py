@@ -0,0 +1,52 @@
+# benchmarks/generate_loads.py
+# Synthetic load boards shaped like app/data/dummy_loads.json.
+import argparse
+import json
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+CITIES = [
+    "Mumbai,India", "Delhi,India", "Chennai,India", "Pune,India", "Bengaluru,India", "Hyderabad,India",
+    "Kolkata,India", "Ahmedabad,India", "Jaipur,India", "Lucknow,India", "Nagpur,India", "Indore,India",
+    "Surat,India", "Kanpur,India", "Bhopal,India", "Visakhapatnam,India", "Coimbatore,India", "Kochi,India",
+    "Goa,India", "Chandigarh,India",
+]
+CARGO_TYPES = ["Electronics", "Textiles", "Machinery", "FMCG", "Pharmaceuticals", "Steel", "Cement", "Furniture"]
+STATUSES = ["available"] * 8 + ["urgent"] + ["booked"]
+
+
+def generate_loads(count: int, seed: int = 42, start_id: int = 1001, base_date: date = None) -> List[Dict[str, Any]]:
+    """Returns `count` deterministic loads for the given seed."""
+    rng = random.Random(seed)
+    base_date = base_date or date.today()
+    loads = []
+    for offset in range(count):
+        pickup, destination = rng.sample(CITIES, 2)
+        rate = rng.choice([rng.randint(18, 35), round(rng.uniform(18, 35), 2)])
+        loads.append({
+            "load_id": f"L{start_id + offset}",
+            "pickup_point": pickup,
+            "destination": destination,
+            "rate": f"₹{rate}/km" if isinstance(rate, int) else f"₹{rate:.2f}/km",
+            "status": rng.choice(STATUSES),
+            "cargo_type": rng.choice(CARGO_TYPES),
+            "weight_tons": float(rng.choice([5, 7.5, 10, 12, 15, 15.5, 18, 20, 25])),
+            "expected_delivery_date": (base_date + timedelta(days=rng.randint(-5, 30))).isoformat(),
+        })
+    return loads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic load board as JSON.")
+    parser.add_argument("count", type=int, help="number of loads (e.g. 1000 to 100000)")
+    parser.add_argument("output", help="path of the JSON file to write")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(generate_loads(args.count, args.seed), f, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
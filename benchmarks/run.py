@@ -0,0 +1,265 @@
+# benchmarks/run.py
+"""
+Reproducible throughput/latency benchmark for the Logistics AI API.
+
+Starts local stand-ins for Google Maps and OpenAI, writes a synthetic load
+board to a scratch directory, launches the API under uvicorn pointed at
+both, then drives each scenario and prints machine-readable JSON.
+
+    python -m benchmarks.run --loads 1000 --requests 50 --concurrency 8
+    python -m benchmarks.run --scenarios recommend,get_all_loads --maps-latency-ms 50 --output bench.json
+    python -m benchmarks.run --workers 4 --cache-backend sqlite --scenarios recommend
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from benchmarks.generate_loads import CITIES, generate_loads
+from benchmarks.stand_ins import StandInConfig, StandInServer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API = "/api/v1"
+SCENARIOS = ["recommend", "recommend_summary", "add_load", "upload_loads_excel", "feedback", "get_all_loads"]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _excel_payload(rows: int) -> Optional[bytes]:
+    try:
+        import pandas as pd
+    except ImportError:
+        return None
+    frame = pd.DataFrame(generate_loads(rows, seed=7))[
+        ["pickup_point", "destination", "rate", "cargo_type", "weight_tons", "expected_delivery_date", "status"]
+    ]
+    buffer = BytesIO()
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def build_request(scenario: str, base_url: str, i: int, excel_bytes: Optional[bytes], timeout_s: float) -> Callable[[requests.Session], requests.Response]:
+    truck = {"location": CITIES[i % len(CITIES)], "capacity": 20}
+    if scenario == "recommend":
+        return lambda s: s.post(f"{base_url}{API}/recommendations/recommend", json=truck, timeout=timeout_s)
+    if scenario == "recommend_summary":
+        return lambda s: s.post(f"{base_url}{API}/recommendations/recommend/summary", json=truck, timeout=timeout_s)
+    if scenario == "add_load":
+        load = {
+            "pickup_point": CITIES[i % len(CITIES)], "destination": CITIES[(i + 3) % len(CITIES)],
+            "rate": 25, "cargo_type": "FMCG", "weight_tons": 10, "expected_delivery_date": "2030-01-01",
+        }
+        return lambda s: s.post(f"{base_url}{API}/load/add-load", json=load, timeout=timeout_s)
+    if scenario == "upload_loads_excel":
+        files = {"file": ("loads.xlsx", excel_bytes, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+        return lambda s: s.post(f"{base_url}{API}/load/upload-loads-excel", files=files, timeout=timeout_s)
+    if scenario == "feedback":
+        feedback = {
+            "truck_id": f"T{i % 50}", "load_origin": CITIES[i % len(CITIES)],
+            "load_destination": CITIES[(i + 1) % len(CITIES)], "ai_score": 12.5, "action": "accepted",
+        }
+        return lambda s: s.post(f"{base_url}{API}/feedback/feedback", json=feedback, timeout=timeout_s)
+    if scenario == "get_all_loads":
+        return lambda s: s.get(f"{base_url}{API}/load/get-all-loads", timeout=timeout_s)
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def _diff_counts(before: Dict[str, Dict[str, int]], after: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+    diff = {}
+    for endpoint, outcomes in after.items():
+        delta = {outcome: count - before.get(endpoint, {}).get(outcome, 0) for outcome, count in outcomes.items()}
+        delta = {outcome: count for outcome, count in delta.items() if count}
+        if delta:
+            diff[endpoint] = delta
+    return diff
+
+
+def run_scenario(scenario: str, base_url: str, stand_in: StandInServer, total_requests: int, concurrency: int,
+                 excel_bytes: Optional[bytes], timeout_s: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    sessions: Dict[int, requests.Session] = {}
+
+    def one(i: int):
+        session = sessions.setdefault(threading.get_ident(), requests.Session())
+        send = build_request(scenario, base_url, i, excel_bytes, timeout_s)
+        start = time.perf_counter()
+        try:
+            response = send(session)
+            status = str(response.status_code)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        return time.perf_counter() - start, status
+
+    counts_before = stand_in.snapshot_counts()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, status in pool.map(one, range(total_requests)):
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+    wall_s = time.perf_counter() - wall_start
+    for session in sessions.values():
+        session.close()
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "wall_s": round(wall_s, 4),
+        "throughput_rps": round(total_requests / wall_s, 2) if wall_s else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+        },
+        "status_codes": statuses,
+        "upstream_calls": _diff_counts(counts_before, stand_in.snapshot_counts()),
+    }
+
+
+def _wait_until_ready(base_url: str, process: subprocess.Popen, timeout_s: float = 60.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API process exited early with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("API did not become ready in time")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loads", type=int, default=1000, help="size of the synthetic load board (1k-100k)")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--maps-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail (0-1)")
+    parser.add_argument("--excel-rows", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--cache-backend", choices=["memory", "sqlite"], default="memory",
+                        help="sqlite shares geocode/route caches between workers")
+    parser.add_argument("--timeout-s", type=float, default=120.0, help="per-request timeout budget")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = sorted(set(scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios: {unknown}")
+
+    stand_in = StandInServer(config=StandInConfig(
+        latency_ms=args.maps_latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, llm_latency_ms=args.llm_latency_ms,
+    )).start()
+
+    board = generate_loads(args.loads, seed=args.seed)
+    excel_bytes = _excel_payload(args.excel_rows) if "upload_loads_excel" in scenarios else None
+
+    report: Dict[str, Any] = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "python": sys.version.split()[0],
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="lb-bench-") as scratch:
+        loads_file = os.path.join(scratch, "loads.json")
+        feedback_file = os.path.join(scratch, "feedback.json")
+        trucks_file = os.path.join(scratch, "trucks.json")
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = dict(
+            os.environ,
+            OPENAI_API_KEY="bench-key",
+            OPENAI_BASE_URL=f"{stand_in.base_url}/v1",
+            GOOGLE_MAPS_API_KEY="bench-key",
+            GOOGLE_MAPS_BASE_URL=f"{stand_in.base_url}/maps/api",
+            LOADS_FILE=loads_file,
+            FEEDBACK_FILE=feedback_file,
+            TRUCKS_FILE=trucks_file,
+            CACHE_BACKEND=args.cache_backend,
+            CACHE_SQLITE_PATH=os.path.join(scratch, "cache.sqlite3"),
+            # Persistent side stores must start empty too, or a rerun answers from the last run's data
+            LANES_DB_PATH=os.path.join(scratch, "lanes.sqlite3"),
+            LOAD_ARCHIVE_PATH=os.path.join(scratch, "loads_archive.sqlite3"),
+            CHANGE_FEED_PATH=os.path.join(scratch, "load_changes.sqlite3"),
+            LOAD_SNAPSHOT_DIR=os.path.join(scratch, "board_snapshot"),
+            PLACES_DB_PATH=os.path.join(scratch, "places.sqlite3"),
+            LOG_LEVEL="WARNING",
+        )
+        env.pop("Maps_API_KEY", None)
+
+        def reset_store():
+            with open(loads_file, "w", encoding="utf-8") as f:
+                json.dump(board, f, ensure_ascii=False)
+            with open(feedback_file, "w", encoding="utf-8") as f:
+                json.dump([], f)
+            with open(trucks_file, "w", encoding="utf-8") as f:
+                json.dump([], f)
+
+        reset_store()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=PROJECT_ROOT, env=env,
+        )
+        try:
+            _wait_until_ready(base_url, process)
+            for scenario in scenarios:
+                if scenario == "upload_loads_excel" and excel_bytes is None:
+                    report["scenarios"][scenario] = {"skipped": "pandas/openpyxl not installed"}
+                    continue
+                reset_store()
+                report["scenarios"][scenario] = run_scenario(
+                    scenario, base_url, stand_in, args.requests, args.concurrency, excel_bytes, args.timeout_s
+                )
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            stand_in.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# benchmarks/stand_ins.py
+# Local HTTP stand-ins for Google Distance Matrix, Google Geocoding and OpenAI
+# chat completions, so benchmarks never touch paid APIs.
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+def _stable_unit(text: str) -> float:
+    """Deterministic pseudo-random number in [0, 1) derived from `text`."""
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+
+class StandInConfig:
+    """Latency and error injection, adjustable while the server runs."""
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 5.0, error_rate: float = 0.0, llm_latency_ms: float = 400.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.llm_latency_ms = llm_latency_ms
+
+
+class StandInServer:
+    """
+    Threaded HTTP server exposing:
+      GET  /maps/api/distancematrix/json
+      GET  /maps/api/geocode/json
+      POST /v1/chat/completions (JSON mode answers every "request_id" in the prompt)
+    Responses are deterministic per input so runs are comparable.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: StandInConfig = None):
+        self.config = config or StandInConfig()
+        self.counts: Dict[Tuple[str, str], int] = defaultdict(int)  # (endpoint, outcome) -> calls
+        self._counts_lock = threading.Lock()
+        self._rng = random.Random(1234)
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stand-in-server", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def snapshot_counts(self) -> Dict[str, Dict[str, int]]:
+        with self._counts_lock:
+            result: Dict[str, Dict[str, int]] = defaultdict(dict)
+            for (endpoint, outcome), count in self.counts.items():
+                result[endpoint][outcome] = count
+            return dict(result)
+
+    def _count(self, endpoint: str, outcome: str):
+        with self._counts_lock:
+            self.counts[(endpoint, outcome)] += 1
+
+    def _sleep_and_maybe_fail(self, base_latency_ms: float) -> bool:
+        """Sleeps for the injected latency; returns True if this call should fail."""
+        with self._counts_lock:
+            jitter = self._rng.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+            fail = self._rng.random() < self.config.error_rate
+        time.sleep(max(0.0, base_latency_ms + jitter) / 1000.0)
+        return fail
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # keep benchmark output clean
+                pass
+
+            def _send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                if parsed.path.endswith("/distancematrix/json"):
+                    endpoint = "distance_matrix"
+                elif parsed.path.endswith("/geocode/json"):
+                    endpoint = "geocode"
+                else:
+                    self._send_json(404, {"error": "unknown stand-in path"})
+                    return
+
+                if server._sleep_and_maybe_fail(server.config.latency_ms):
+                    server._count(endpoint, "error")
+                    self._send_json(500, {"status": "UNKNOWN_ERROR"})
+                    return
+                server._count(endpoint, "ok")
+
+                if endpoint == "geocode":
+                    address = params.get("address", "")
+                    self._send_json(200, {
+                        "status": "OK",
+                        "results": [{
+                            "formatted_address": address,
+                            "geometry": {"location": {
+                                "lat": 8.0 + 20.0 * _stable_unit("lat:" + address),
+                                "lng": 70.0 + 20.0 * _stable_unit("lng:" + address),
+                            }},
+                        }],
+                    })
+                    return
+
+                origin, destination = params.get("origins", ""), params.get("destinations", "")
+                metres = int(50_000 + 1_950_000 * _stable_unit(f"{origin}|{destination}"))
+                self._send_json(200, {
+                    "status": "OK",
+                    "rows": [{"elements": [{
+                        "status": "OK",
+                        "distance": {"value": metres},
+                        "duration": {"value": int(metres / 15)},  # ~54 km/h
+                    }]}],
+                })
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request_body = self.rfile.read(length) if length else b""
+                if not urlparse(self.path).path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": "unknown stand-in path"})
+                    return
+
+                if server._sleep_and_maybe_fail(server.config.llm_latency_ms):
+                    server._count("chat_completions", "error")
+                    self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+                    return
+                server._count("chat_completions", "ok")
+
+                try:
+                    payload = json.loads(request_body or b"{}")
+                except ValueError:
+                    payload = {}
+                model = payload.get("model", "stand-in")
+                content = "Stand-in recommendation: take the top-scored load."
+                if (payload.get("response_format") or {}).get("type") == "json_object":
+                    prompt = " ".join(str(message.get("content", "")) for message in payload.get("messages", []))
+                    request_ids = re.findall(r'"request_id": "([^"]+)"', prompt)
+                    content = json.dumps({"summaries": {request_id: f"Stand-in recommendation for {request_id}: take the top-scored load." for request_id in request_ids}})
+                self._send_json(200, {
+                    "id": "chatcmpl-standin",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }],
+                    "usage": {"prompt_tokens": len(request_body) // 4, "completion_tokens": 12, "total_tokens": len(request_body) // 4 + 12},
+                })
+
+        return Handler